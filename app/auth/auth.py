@@ -20,14 +20,20 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+from collections import OrderedDict
+import hashlib
 import json
 import logging
 import os
-from typing import Optional, Dict, List, Type
+import time
+from typing import Optional, Dict, List, Tuple, Type
 import urllib.parse
-import urllib.request
 
-from jose import jwt  # type: ignore
+import httpx
+from jose import jwk, jwt  # type: ignore
+from jose.backends.base import Key  # type: ignore
+from jose.exceptions import JWKError  # type: ignore
 from fastapi import HTTPException, Depends, Request
 from fastapi.security import SecurityScopes, HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.security import OAuth2, OAuth2PasswordBearer, OAuth2AuthorizationCodeBearer, OpenIdConnect
@@ -104,10 +110,72 @@ class JwksDict(TypedDict):
     keys: List[JwksKeyDict]
 
 
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens that already passed signature and claims verification.
+    Entries are keyed by the token's SHA-256 digest and expire with the token's exp claim.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[bytes, Tuple[float, Dict, Auth0User]]' = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Tuple[Dict, Auth0User]]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        exp, payload, user = entry
+        if exp <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return payload, user
+
+    def put(self, token: str, payload: Dict, user: Auth0User):
+        exp = payload.get('exp')
+        if self.maxsize <= 0 or not isinstance(exp, (int, float)):
+            return
+        key = self._key(token)
+        self._entries[key] = (exp, payload, user)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
 class Auth0:
     def __init__(self, domain: str, api_audience: str, scopes: Dict[str, str] = {},
                  auto_error: bool = True, scope_auto_error: bool = True, email_auto_error: bool = False,
-                 auth0user_model: Type[Auth0User] = Auth0User):
+                 auth0user_model: Type[Auth0User] = Auth0User,
+                 jwks_cache_path: Optional[str] = None,
+                 jwks_refresh_interval: float = 3600,
+                 jwks_min_refresh_interval: float = 30,
+                 jwks_timeout: float = 5,
+                 token_cache_size: int = 4096):
         self.domain = domain
         self.audience = api_audience
 
@@ -118,8 +186,22 @@ class Auth0:
         self.auth0_user_model = auth0user_model
 
         self.algorithms = ['RS256']
-        r = urllib.request.urlopen(f'https://{domain}/.well-known/jwks.json')
-        self.jwks: JwksDict = json.loads(r.read())
+
+        # The JWKS is never fetched synchronously. It is read from the on-disk cache when one exists,
+        # otherwise it is fetched on the event loop by the first request (or the app lifespan).
+        self.jwks_url = f'https://{domain}/.well-known/jwks.json'
+        self.jwks_cache_path = jwks_cache_path
+        self.jwks_refresh_interval = jwks_refresh_interval
+        self.jwks_min_refresh_interval = jwks_min_refresh_interval
+        self.jwks_timeout = jwks_timeout
+        self.jwks: JwksDict = {'keys': []}
+        self._keys_by_kid: Dict[str, Key] = {}
+        self._jwks_fetched_at: float = float('-inf')
+        self._jwks_attempted_at: float = float('-inf')
+        self._jwks_lock = asyncio.Lock()
+        self._jwks_refresher: Optional[asyncio.Task] = None
+        self.token_cache = VerifiedTokenCache(maxsize=token_cache_size)
+        self._load_jwks_cache()
 
         authorization_url_qs = urllib.parse.urlencode(
             {'audience': api_audience})
@@ -137,6 +219,139 @@ class Auth0:
         self.oidc_scheme = OpenIdConnect(
             openIdConnectUrl=f'https://{domain}/.well-known/openid-configuration')
 
+    def _build_key_index(self, jwks: JwksDict) -> Dict[str, Key]:
+        # Parse every public key once per refresh instead of once per verified token
+        keys_by_kid = {}
+        for key in jwks.get('keys', []):
+            try:
+                keys_by_kid[key['kid']] = jwk.construct(
+                    key, algorithm=self.algorithms[0])
+            except (JWKError, KeyError, ValueError) as e:
+                logger.warning(f'Skipping unusable JWKS key "{key.get("kid")}": {e}')
+        return keys_by_kid
+
+    def _set_jwks(self, jwks: JwksDict, fetched_at: Optional[float] = None):
+        keys_by_kid = self._build_key_index(jwks)
+        if self._keys_by_kid.keys() - keys_by_kid.keys():
+            # A signing key was revoked, tokens it signed must be verified again
+            self.token_cache.clear()
+        self.jwks = jwks
+        self._keys_by_kid = keys_by_kid
+        self._jwks_fetched_at = time.monotonic() if fetched_at is None else fetched_at
+
+    def _load_jwks_cache(self):
+        if not self.jwks_cache_path or not os.path.exists(self.jwks_cache_path):
+            return
+        try:
+            with open(self.jwks_cache_path) as f:
+                jwks = json.load(f)
+            # Age the cached keys by the file's mtime so a stale cache is refreshed promptly
+            age = max(time.time() - os.path.getmtime(self.jwks_cache_path), 0)
+            self._set_jwks(jwks, fetched_at=time.monotonic() - age)
+        except (OSError, ValueError) as e:
+            logger.warning(
+                f'Ignoring unreadable JWKS cache "{self.jwks_cache_path}": {e}')
+
+    def _write_jwks_cache(self, jwks: JwksDict):
+        tmp_path = f'{self.jwks_cache_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(jwks, f)
+        os.replace(tmp_path, self.jwks_cache_path)
+
+    async def _fetch_jwks(self) -> JwksDict:
+        async with httpx.AsyncClient(timeout=self.jwks_timeout) as client:
+            r = await client.get(self.jwks_url)
+            r.raise_for_status()
+            return r.json()
+
+    def jwks_is_stale(self) -> bool:
+        return time.monotonic() - self._jwks_fetched_at >= self.jwks_refresh_interval
+
+    async def refresh_jwks(self, min_interval: float = 0) -> bool:
+        """
+        Fetch the JWKS from the tenant and swap it in. Returns True if the keys were (re)loaded.
+
+        Concurrent callers are coalesced: whoever holds the lock performs the fetch and everyone who was
+        waiting on it reuses that attempt instead of issuing another request.
+        No request is made if the last attempt is younger than min_interval seconds.
+        """
+        requested_at = self._jwks_attempted_at
+        async with self._jwks_lock:
+            if self._jwks_attempted_at != requested_at:
+                return self._jwks_fetched_at >= self._jwks_attempted_at
+            if time.monotonic() - self._jwks_attempted_at < min_interval:
+                return False
+
+            self._jwks_attempted_at = time.monotonic()
+            try:
+                jwks = await self._fetch_jwks()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.error(f'Failed to fetch JWKS from "{self.jwks_url}": {e}')
+                return False
+
+            self._set_jwks(jwks)
+            if self.jwks_cache_path:
+                try:
+                    await asyncio.to_thread(self._write_jwks_cache, jwks)
+                except OSError as e:
+                    logger.warning(
+                        f'Failed to write JWKS cache "{self.jwks_cache_path}": {e}')
+            return True
+
+    async def _run_jwks_refresher(self):
+        while True:
+            delay = self.jwks_refresh_interval - (time.monotonic() - self._jwks_fetched_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not await self.refresh_jwks(min_interval=self.jwks_min_refresh_interval):
+                await asyncio.sleep(self.jwks_min_refresh_interval)
+
+    async def start(self):
+        """
+        Load the JWKS (if it was not read from the on-disk cache) and start refreshing it in the background.
+        Meant to be called from the application lifespan.
+        """
+        if not self._keys_by_kid:
+            await self.refresh_jwks()
+        if self._jwks_refresher is None or self._jwks_refresher.done():
+            self._jwks_refresher = asyncio.create_task(self._run_jwks_refresher())
+
+    async def stop(self):
+        if self._jwks_refresher is not None:
+            self._jwks_refresher.cancel()
+            try:
+                await self._jwks_refresher
+            except asyncio.CancelledError:
+                pass
+            self._jwks_refresher = None
+
+    async def _get_signing_key(self, kid: Optional[str]) -> Optional[Key]:
+        key = self._keys_by_kid.get(kid) if kid else None
+        if key is None and kid:
+            # Unknown kid: the tenant may have rotated its signing key. Re-fetch, but never more often than
+            # jwks_min_refresh_interval so that tokens with made up kids cannot hammer the tenant.
+            await self.refresh_jwks(min_interval=self.jwks_min_refresh_interval)
+            key = self._keys_by_kid.get(kid)
+        elif self._jwks_refresher is None and self.jwks_is_stale():
+            # No background refresher (e.g. the app was started without its lifespan), refresh lazily.
+            await self.refresh_jwks(min_interval=self.jwks_min_refresh_interval)
+        return key
+
+    def _check_scopes(self, payload: Dict, security_scopes: SecurityScopes):
+        token_scope_str: str = payload.get('scope', '')
+
+        if isinstance(token_scope_str, str):
+            token_scopes = token_scope_str.split()
+
+            for scope in security_scopes.scopes:
+                if scope not in token_scopes:
+                    raise Auth0UnauthorizedException(detail=f'Missing "{scope}" scope',
+                                                     headers={'WWW-Authenticate': f'Bearer scope="{security_scopes.scope_str}"'})
+        else:
+            # This is an unlikely case but handle it just to be safe (perhaps auth0 will change the scope format)
+            raise Auth0UnauthorizedException(
+                detail='Token "scope" field must be a string')
+
     async def get_user(self,
                        security_scopes: SecurityScopes,
                        creds: Optional[HTTPAuthorizationCredentials] = Depends(
@@ -161,24 +376,24 @@ class Auth0:
                 return None
 
         token = creds.credentials
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            payload, user = cached
+            if self.scope_auto_error:
+                self._check_scopes(payload, security_scopes)
+            if self.email_auto_error and not user.email:
+                raise Auth0UnauthorizedException(
+                    detail='Missing email claim (check auth0 rule "Add email to access token")')
+            return user
+
         payload: Dict = {}
         try:
             unverified_header = jwt.get_unverified_header(token)
-            rsa_key = {}
-            for key in self.jwks['keys']:
-                if key['kid'] == unverified_header.get('kid'):
-                    rsa_key = {
-                        'kty': key['kty'],
-                        'kid': key['kid'],
-                        'use': key['use'],
-                        'n': key['n'],
-                        'e': key['e']
-                    }
-                    break
-            if rsa_key:
+            signing_key = await self._get_signing_key(unverified_header.get('kid'))
+            if signing_key is not None:
                 payload = jwt.decode(
                     token,
-                    rsa_key,
+                    signing_key,
                     algorithms=self.algorithms,
                     audience=self.audience,
                     issuer=f'https://{self.domain}/'
@@ -229,26 +444,15 @@ class Auth0:
                 return None
 
         if self.scope_auto_error:
-            token_scope_str: str = payload.get('scope', '')
-
-            if isinstance(token_scope_str, str):
-                token_scopes = token_scope_str.split()
-
-                for scope in security_scopes.scopes:
-                    if scope not in token_scopes:
-                        raise Auth0UnauthorizedException(detail=f'Missing "{scope}" scope',
-                                                         headers={'WWW-Authenticate': f'Bearer scope="{security_scopes.scope_str}"'})
-            else:
-                # This is an unlikely case but handle it just to be safe (perhaps auth0 will change the scope format)
-                raise Auth0UnauthorizedException(
-                    detail='Token "scope" field must be a string')
+            self._check_scopes(payload, security_scopes)
 
         try:
             user = self.auth0_user_model(**payload)
+            self.token_cache.put(token, payload, user)
 
             if self.email_auto_error and not user.email:
                 raise Auth0UnauthorizedException(
-                    detail=f'Missing email claim (check auth0 rule "Add email to access token")')
+                    detail='Missing email claim (check auth0 rule "Add email to access token")')
 
             return user
 
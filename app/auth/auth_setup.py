@@ -3,4 +3,7 @@ from app.auth.auth import Auth0
 
 auth0_domain = settings.AUTH0_DOMAIN
 auth0_api_audience = settings.AUTH0_API_AUDIENCE
-auth = Auth0(domain=auth0_domain, api_audience=auth0_api_audience, scopes={})
+
+# Process-wide verifier shared by every router, so the JWKS is loaded and refreshed once.
+auth = Auth0(domain=auth0_domain, api_audience=auth0_api_audience, scopes={},
+             jwks_cache_path=settings.AUTH0_JWKS_CACHE_PATH)
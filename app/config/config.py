@@ -1,4 +1,5 @@
-from pydantic import EmailStr
+from typing import Optional
+from pydantic import EmailStr, Field
 from pydantic_settings import SettingsConfigDict, BaseSettings
 
 
@@ -8,13 +9,21 @@ class Settings(BaseSettings):
 
     AUTH0_DOMAIN: str
     AUTH0_API_AUDIENCE: str
+    AUTH0_JWKS_CACHE_PATH: Optional[str] = None
 
     AZURE_STORAGE_CONNECTION_STRING: str
     IMAGE_CONTAINER_NAME: str
+    # Uploads of one process that may stream to Azure at the same time
+    AZURE_UPLOAD_CONCURRENCY: int = 10
+    # Worker processes that render thumbnails and responsive variants of uploaded images
+    IMAGE_WORKERS: int = 2
 
     TWILIO_SID: str
     TWILIO_TOKEN: str
     TWILIO_VERIFICATION_SID: str
+    TWILIO_TIMEOUT_SECONDS: float = 10
+    # Only set to point the client at a local fake Twilio Verify server in tests
+    TWILIO_VERIFY_BASE_URL: Optional[str] = None
 
     SENTRY_DSN: str
 
@@ -22,10 +31,21 @@ class Settings(BaseSettings):
     AWS_BUCKET_NAME: str
     AWS_ACCESS_KEY: str
     AWS_SECRET_ACCESS_KEY: str
+    # Only set to point the client at a local S3 stand-in in tests
+    AWS_ENDPOINT_URL: Optional[str] = None
 
     STRIPE_SECRET_KEY: str
     STRIPE_WEBHOOK_SECRET: str
     PAYMENT_RETURN_URL: str
+    STRIPE_TIMEOUT_SECONDS: float = 10
+    # Only set to point the client at a local fake Stripe server in tests
+    STRIPE_API_BASE: Optional[str] = None
+    # How long an unpaid booking holds its slot, Stripe checkout sessions last between 30 minutes and 24 hours
+    # from when Stripe creates them, the extra minute covers the time until the session request reaches Stripe
+    BOOKING_HOLD_MINUTES: int = Field(default=31, ge=31, le=24 * 60)
+
+    AVAILABILITY_CACHE_TTL_SECONDS: float = 60
+    AVAILABILITY_CACHE_SIZE: int = 50_000
 
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel, ConfigDict
+from pymongo import IndexModel
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(BaseModel):
+    collection: str
+    keys: List[Tuple[str, int]]
+    unique: bool = False
+    sparse: bool = False
+    # TTL indexes delete documents once the (date) field is this many seconds in the past
+    expire_after_seconds: Optional[int] = None
+    # Partial indexes only cover the documents that match this filter
+    partial_filter: Optional[Dict] = None
+    # Critical indexes back uniqueness guarantees or hot queries, the app is not ready without them
+    critical: bool = False
+    model_config = ConfigDict(frozen=True)
+
+    @property
+    def key_pattern(self) -> Tuple[Tuple[str, int], ...]:
+        return tuple((field, int(direction)) for field, direction in self.keys)
+
+    @property
+    def name(self) -> str:
+        return '_'.join(f'{field}_{direction}' for field, direction in self.keys)
+
+    def options(self) -> Dict:
+        options = {'unique': self.unique, 'sparse': self.sparse}
+        if self.expire_after_seconds is not None:
+            options['expireAfterSeconds'] = self.expire_after_seconds
+        if self.partial_filter is not None:
+            options['partialFilterExpression'] = self.partial_filter
+        return options
+
+    def to_index_model(self) -> IndexModel:
+        return IndexModel(self.keys, name=self.name, **self.options())
+
+
+REQUIRED_INDEXES: List[IndexSpec] = [
+    IndexSpec(collection='usernames', keys=[('username', 1)], unique=True, critical=True),
+    # Service listings join each service to its owner's username and merchant profile by user_id
+    IndexSpec(collection='usernames', keys=[('user_id', 1)]),
+    IndexSpec(collection='merchants', keys=[('username_id', 1)], unique=True, sparse=True, critical=True),
+    IndexSpec(collection='merchants', keys=[('user_id', 1)], unique=True, critical=True),
+    IndexSpec(collection='merchants', keys=[('profiles.username', 1)], unique=True, sparse=True),
+    IndexSpec(collection='customers', keys=[('user_id', 1)], unique=True, critical=True),
+    # Bookings embed the merchant and customer, every booking query filters on merchant.id or customer.id.
+    # Booking histories page by (start_time, _id) after a cursor, the trailing _id keeps the sort on the index
+    IndexSpec(collection='bookings', keys=[('customer.id', 1), ('appointment_date.start_time', 1), ('_id', 1)],
+              critical=True),
+    IndexSpec(collection='bookings', keys=[('merchant.id', 1), ('appointment_date.start_time', 1), ('_id', 1)],
+              critical=True),
+    # Overlap checks bound the scan with end_time > new start, i.e. only bookings that have not ended yet
+    IndexSpec(collection='bookings', keys=[('merchant.id', 1), ('appointment_date.end_time', 1)],
+              critical=True),
+    # Only unpaid bookings carry a hold, the sweeper looks them up by expiry
+    IndexSpec(collection='bookings', keys=[('hold_expires_at', 1)], sparse=True),
+    # One lock per merchant and 5-minute bucket, the unique index is what makes reservations race-free
+    IndexSpec(collection='booking_slots', keys=[('merchant_id', 1), ('slot', 1)], unique=True, critical=True),
+    IndexSpec(collection='booking_slots', keys=[('booking_id', 1)], critical=True),
+    IndexSpec(collection='booking_slots', keys=[('expires_at', 1)], expire_after_seconds=0),
+    IndexSpec(collection='transactions', keys=[('booking_id', 1)]),
+    # Webhook events are claimed oldest first, kept 30 days after processing for auditing
+    IndexSpec(collection='stripe_events', keys=[('status', 1), ('created', 1)]),
+    IndexSpec(collection='stripe_events', keys=[('booking_id', 1), ('status', 1)]),
+    IndexSpec(collection='stripe_events', keys=[('processed_at', 1)], expire_after_seconds=30 * 24 * 3600),
+    IndexSpec(collection='services', keys=[('owner_id', 1)]),
+    # Price range filter of the service search, matched before any join
+    IndexSpec(collection='services', keys=[('price.amount', 1)]),
+    # Finds the services that use an image once its variants are ready
+    IndexSpec(collection='services', keys=[('images', 1)]),
+    # One copy of each file per merchant, uploads look for an existing one by content hash
+    IndexSpec(collection='media', keys=[('merchant_id', 1), ('sha256', 1)], unique=True,
+              partial_filter={'sha256': {'$exists': True}}, critical=True),
+    IndexSpec(collection='users', keys=[('contact_info.phone_number.dialing_code', 1),
+                                        ('contact_info.phone_number.phone_number', 1)], unique=True, critical=True),
+    IndexSpec(collection='users', keys=[('user_id', 1)], unique=True, critical=True),
+]
+
+
+def _normalize_key(key) -> Tuple[Tuple[str, int], ...]:
+    return tuple((field, int(direction)) if isinstance(direction, (int, float)) else (field, direction)
+                 for field, direction in key.items())
+
+
+class IndexReconciler:
+    """
+    Diffs the declared indexes against the ones that exist in the database, creates whatever is missing
+    and reports drift (indexes with different options, or indexes nobody declared).
+
+    Drift is only reported: dropping or rebuilding indexes on a live database is left to a human.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, specs: List[IndexSpec] = REQUIRED_INDEXES,
+                 retry_delay: float = 5, max_retry_delay: float = 60):
+        self.db = db
+        self.specs = specs
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.missing: List[str] = []
+        self.drift: List[str] = []
+        self.errors: Dict[str, str] = {}
+        self.critical_ready = asyncio.Event()
+        self.finished = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.critical_ready.is_set()
+
+    def status(self) -> Dict:
+        return {
+            'ready': self.ready,
+            'finished': self.finished.is_set(),
+            'missing': self.missing,
+            'drift': self.drift,
+            'errors': self.errors,
+        }
+
+    async def diff(self) -> List[IndexSpec]:
+        """Return the specs with no matching index, recording drift along the way."""
+        missing: List[IndexSpec] = []
+        drift: List[str] = []
+        by_collection: Dict[str, List[IndexSpec]] = {}
+        for spec in self.specs:
+            by_collection.setdefault(spec.collection, []).append(spec)
+
+        for collection, specs in by_collection.items():
+            existing = {}
+            async for index in self.db[collection].list_indexes():
+                existing[_normalize_key(index['key'])] = index
+
+            declared = set()
+            for spec in specs:
+                declared.add(spec.key_pattern)
+                index = existing.get(spec.key_pattern)
+                if index is None:
+                    missing.append(spec)
+                    continue
+                for option, expected in spec.options().items():
+                    actual = bool(index.get(option, False)) if isinstance(expected, bool) else index.get(option)
+                    if actual != expected:
+                        drift.append(
+                            f"{collection}.{index['name']}: {option} is {actual}, expected {expected}")
+
+            for key_pattern, index in existing.items():
+                if index['name'] != '_id_' and key_pattern not in declared:
+                    drift.append(
+                        f"{collection}.{index['name']}: not declared in REQUIRED_INDEXES")
+
+        self.missing = [f'{spec.collection}.{spec.name}' for spec in missing]
+        self.drift = drift
+        for message in drift:
+            logger.warning(f'Index drift: {message}')
+        return missing
+
+    async def _create(self, specs: List[IndexSpec]) -> bool:
+        created_all = True
+        for spec in specs:
+            name = f'{spec.collection}.{spec.name}'
+            try:
+                await self.db[spec.collection].create_indexes([spec.to_index_model()])
+                logger.info(f'Created index {name}')
+                self.missing.remove(name)
+                self.errors.pop(name, None)
+            except ConnectionFailure:
+                raise
+            except PyMongoError as e:
+                # e.g. a unique index over existing duplicates, retrying will not help
+                logger.error(f'Failed to create index {name}: {e}')
+                self.errors[name] = str(e)
+                created_all = False
+        return created_all
+
+    async def run(self):
+        """Reconcile until every critical index exists, retrying while the database is unreachable."""
+        delay = self.retry_delay
+        while True:
+            try:
+                missing = await self.diff()
+                critical = [spec for spec in missing if spec.critical]
+                others = [spec for spec in missing if not spec.critical]
+
+                if await self._create(critical):
+                    self.critical_ready.set()
+                else:
+                    logger.error(
+                        'Critical indexes could not be created, the app will not report ready')
+                await self._create(others)
+                self.finished.set()
+                return
+            except ConnectionFailure as e:
+                logger.warning(
+                    f'Index reconciliation failed, retrying in {delay}s: {e}')
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def start(self) -> asyncio.Task:
+        return asyncio.create_task(self.run())
+
+
+async def reconcile_indexes(db: AsyncIOMotorDatabase, specs: Optional[List[IndexSpec]] = None) -> IndexReconciler:
+    reconciler = IndexReconciler(db, specs or REQUIRED_INDEXES)
+    await reconciler.run()
+    return reconciler
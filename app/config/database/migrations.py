@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from typing import Dict
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+async def convert_appointment_dates(db: AsyncIOMotorDatabase) -> int:
+    """
+    Convert appointment times stored as ISO strings by older releases into BSON dates.
+    Range queries only match values of the same BSON type, so string dates would be invisible to them.
+    """
+    result = await db['bookings'].update_many(
+        {'$or': [{'appointment_date.start_time': {'$type': 'string'}},
+                 {'appointment_date.end_time': {'$type': 'string'}}]},
+        [{'$set': {
+            'appointment_date.start_time': {'$toDate': '$appointment_date.start_time'},
+            'appointment_date.end_time': {'$toDate': '$appointment_date.end_time'},
+        }}])
+    return result.modified_count
+
+
+MIGRATIONS = [
+    convert_appointment_dates,
+]
+
+
+class MigrationRunner:
+    """
+    Runs every (idempotent) data migration at startup, in the background.
+
+    Queries rely on the migrated data, e.g. overlap checks cannot see bookings whose dates are still strings,
+    so the app reports ready only once every migration has completed. Migrations are retried while the
+    database is unreachable. One that fails otherwise is logged and keeps the app from reporting ready.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, retry_delay: float = 5, max_retry_delay: float = 60):
+        self.db = db
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.errors: Dict[str, str] = {}
+        self.completed = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.completed.is_set()
+
+    def status(self) -> Dict:
+        return {'ready': self.ready, 'errors': self.errors}
+
+    async def _migrate(self, migration) -> bool:
+        try:
+            modified = await migration(self.db)
+        except ConnectionFailure:
+            raise
+        except PyMongoError as e:
+            logger.error(f'{migration.__name__} failed: {e}')
+            self.errors[migration.__name__] = str(e)
+            return False
+        if modified:
+            logger.info(f'{migration.__name__}: migrated {modified} documents')
+        self.errors.pop(migration.__name__, None)
+        return True
+
+    async def run(self):
+        delay = self.retry_delay
+        while True:
+            try:
+                succeeded = [await self._migrate(migration) for migration in MIGRATIONS]
+                if all(succeeded):
+                    self.completed.set()
+                else:
+                    logger.error('Data migrations failed, the app will not report ready')
+                return
+            except ConnectionFailure as e:
+                logger.warning(f'Data migrations failed, retrying in {delay}s: {e}')
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def start(self) -> asyncio.Task:
+        return asyncio.create_task(self.run())
+
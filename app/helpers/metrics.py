@@ -0,0 +1,46 @@
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+
+class CallMetrics:
+    """
+    Latency and error counts of outbound calls, grouped by operation name.
+    Percentiles are computed over the last `window` calls of each operation.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._calls: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def record(self, operation: str, seconds: float, error: bool = False):
+        self._calls[operation] = self._calls.get(operation, 0) + 1
+        if error:
+            self._errors[operation] = self._errors.get(operation, 0) + 1
+        self._latencies.setdefault(operation, deque(maxlen=self.window)).append(seconds)
+
+    @asynccontextmanager
+    async def track(self, operation: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(operation, time.perf_counter() - start, error=True)
+            raise
+        self.record(operation, time.perf_counter() - start)
+
+    def stats(self) -> Dict:
+        stats = {}
+        for operation, latencies in self._latencies.items():
+            ordered = sorted(latencies)
+            stats[operation] = {
+                'calls': self._calls[operation],
+                'errors': self._errors.get(operation, 0),
+                'p50_ms': ordered[len(ordered) // 2] * 1e3,
+                'p95_ms': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1e3,
+                'max_ms': ordered[-1] * 1e3,
+            }
+        return stats
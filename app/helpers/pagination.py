@@ -0,0 +1,64 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor holds the sort key of the last item of a page, and the next page starts right after it. Unlike
+skip, which walks over every earlier item, the next page is a range read on the index backing the sort,
+however deep the client has scrolled. The sort must end in a unique field (usually _id) so keys never tie.
+"""
+import base64
+import binascii
+from datetime import timezone
+from typing import Any, List, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException, Response, status
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+Sort = List[Tuple[str, int]]
+
+_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=True, tzinfo=timezone.utc)
+
+
+def _field(document: dict, path: str) -> Any:
+    for part in path.split('.'):
+        document = document.get(part) if isinstance(document, dict) else None
+    return document
+
+
+def encode_cursor(document: dict, sort: Sort) -> str:
+    values = [_field(document, field) for field, _ in sort]
+    return base64.urlsafe_b64encode(json_util.dumps(values, json_options=_JSON_OPTIONS).encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: Sort) -> List[Any]:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()), json_options=_JSON_OPTIONS)
+    except (ValueError, TypeError, binascii.Error):
+        values = None
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def after_cursor(cursor: str, sort: Sort) -> dict:
+    """Query for the documents that come after the cursor in `sort` order."""
+    values = decode_cursor(cursor, sort)
+    clauses = []
+    for index, (field, direction) in enumerate(sort):
+        clause = {earlier: value for (earlier, _), value in zip(sort[:index], values)}
+        clause[field] = {'$gt' if direction == 1 else '$lt': values[index]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+def paginated_query(query: dict, sort: Sort, cursor: Optional[str]) -> dict:
+    if not cursor:
+        return query
+    return {'$and': [query, after_cursor(cursor, sort)]} if query else after_cursor(cursor, sort)
+
+
+def set_next_cursor(response: Response, documents: List[dict], sort: Sort, per_page: int):
+    """Send the cursor of the next page in a header, unless this page came back short and so is the last."""
+    if len(documents) == per_page:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(documents[-1], sort)
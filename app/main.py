@@ -1,4 +1,6 @@
-from fastapi import FastAPI, status
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from app.routers.v0 import customer, merchant, services, users, country, username, uploads, file_uploads, bookings, webhooks
@@ -6,6 +8,18 @@ from app.routers.v0.payments import stripe
 import sentry_sdk
 
 from app.config.config import settings
+from app.auth.auth_setup import auth
+from app.config.database.database import get_db
+from app.config.database.indexes import IndexReconciler
+from app.config.database.migrations import MigrationRunner
+from app.helpers.pagination import NEXT_CURSOR_HEADER
+from app.services.bookings.availability_cache import availability_cache
+from app.services.bookings.holds import run_hold_sweeper
+from app.services.media.derivatives import image_derivatives
+from app.services.payments.stripe import stripe_gateway
+from app.services.payments.webhook_events import stripe_events
+from app.services.storage.azure_blob import blob_storage
+from app.services.verification.twilio import verifier
 
 _sentry_dsn = settings.SENTRY_DSN
 
@@ -21,11 +35,38 @@ sentry_sdk.init(
 )
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the Auth0 signing keys once for the whole process and keep them fresh in the background
+    await auth.start()
+    # Create missing indexes in the background, /ready reports 503 until the critical ones exist
+    app.state.indexes = IndexReconciler(get_db())
+    index_task = app.state.indexes.start()
+    # Migrate legacy data in the background, /ready reports 503 until every migration completed
+    app.state.migrations = MigrationRunner(get_db())
+    migrations_task = app.state.migrations.start()
+    # Cancel unpaid bookings whose checkout hold lapsed and free their slots
+    holds_task = asyncio.create_task(run_hold_sweeper(get_db()))
+    # Apply the Stripe webhook events the webhook endpoint persisted
+    events_task = stripe_events.start(get_db())
+    yield
+    tasks = (index_task, migrations_task, holds_task, events_task)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await auth.stop()
+    await stripe_gateway.close()
+    await verifier.close()
+    image_derivatives.shutdown()
+    await blob_storage.close()
+
+
 app = FastAPI(
     title="Suav Beauty Technologies Inc. API for Web Application",
     description="The following documentation describes the API endpoints for the Suav Beauty Technologies Inc. These can be used by the frontend developers to build the web application with the required data.",
     version="1.0.0",
     openapi_url="/openapi.json",
+    lifespan=lifespan,
 )
 
 app.include_router(users.router)
@@ -52,6 +93,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browsers read the cursor of the next page on paginated lists
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -72,3 +115,31 @@ def read_root():
 
     """
     return {"msg": "Welcome to Suav Beauty"}
+
+
+@app.get("/ready", include_in_schema=False)
+def read_readiness(response: Response):
+    """
+    Readiness probe. Reports 503 until the critical database indexes exist and the data migrations completed.
+    """
+    indexes = getattr(app.state, 'indexes', None)
+    migrations = getattr(app.state, 'migrations', None)
+    if indexes is None or not indexes.ready or migrations is None or not migrations.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"indexes": indexes.status() if indexes else None,
+            "migrations": migrations.status() if migrations else None}
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """
+    In-process cache statistics. Each worker keeps its own caches, so these are per worker.
+    """
+    return {
+        "auth_token_cache": auth.token_cache.stats(),
+        "availability_cache": availability_cache.stats(),
+        "stripe": stripe_gateway.stats(),
+        "stripe_events": stripe_events.stats(),
+        "twilio": verifier.stats(),
+        "image_derivatives": image_derivatives.stats(),
+    }
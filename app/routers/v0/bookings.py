@@ -1,99 +1,51 @@
 import datetime as super_datetime
 from app.schema.object_models.v0.schedule_model import Schedule
 from datetime import datetime, timedelta
-from typing import Annotated, List
-from fastapi import Depends, FastAPI, HTTPException, APIRouter, Security, status, Query, Request
+from typing import Annotated, List, Optional
+from fastapi import Depends, FastAPI, HTTPException, APIRouter, Security, status, Query, Request, Response
 from fastapi.encoders import jsonable_encoder
 from datetime import date, datetime, timedelta
 from app.schema.object_models.v0 import booking_model, service_model, user_model
 from app.config.database.database import get_db, get_db_client, get_db_name
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorClient
 from app.schema.enums.enums import BookingStatusEnum, PaymentStatusEnum
-from app.config.config import settings
-from app.auth.auth import Auth0, Auth0User
-from app.services.payments.stripe import create_checkout_session
+from app.helpers.pagination import paginated_query, set_next_cursor
+from app.auth.auth import Auth0User
+from app.auth.auth_setup import auth
+from app.services.payments.stripe import create_checkout_session, expire_checkout_session
+from app.services.bookings.availability import AVAILABILITY_DAYS, combine, overlapping_bookings_query
+from app.services.bookings.availability_cache import availability_cache, get_start_times, get_start_times_for_merchants
+from app.services.bookings.occupancy import MAX_AVAILABILITY_DAYS
+from app.services.bookings.holds import hold_window
+from app.services.bookings.slots import SlotUnavailable, release_slots, reserve_slots
 
 router = APIRouter(
     prefix="/api/bookings",
     tags=["Bookings"],
 )
 
-auth0_domain = settings.AUTH0_DOMAIN
-auth0_api_audience = settings.AUTH0_API_AUDIENCE
-auth = Auth0(domain=auth0_domain, api_audience=auth0_api_audience, scopes={})
 
+def merchant_bookings_query(merchant_id: str) -> dict:
+    return {'merchant.id': merchant_id}
 
-def calculate_possible_start_times(schedule: Schedule, appointment_duration_minutes: int, ref_date: date, bookings_list: List[booking_model.BookingFullModel]):
-    possible_start_times = {}
-    schedule = jsonable_encoder(schedule.daily_schedule)
-    # return schedule
 
-    for i in range(7):
-        current_date = ref_date + timedelta(days=i)
-        possible_start_times[current_date] = []
+def customer_bookings_query(customer_id: str) -> dict:
+    return {'customer.id': customer_id}
 
-        duration_minutes = appointment_duration_minutes
-        day_of_week = current_date.strftime('%A').lower()
 
-        day_schedule = schedule.get(day_of_week)
-        if not day_schedule or not day_schedule.get('is_available'):
-            possible_start_times[current_date] = []
-            continue
-        operating_hours = day_schedule.get('operating_hours')
-
-        start_time_only = operating_hours.get(
-            'start_time').replace('Z', '+00:00')
-        end_time_only = operating_hours.get('end_time').replace('Z', '+00:00')
-
-        start_time = datetime.strptime(
-            f'{current_date}T{start_time_only}', '%Y-%m-%dT%H:%M:%S%z')
-        end_time = datetime.strptime(
-            f'{current_date}T{end_time_only}', '%Y-%m-%dT%H:%M:%S%z')
-
-        blocked_hours = []
-        for block in day_schedule.get('blocked_hours'):
-            blocked_start_time_only = block.get(
-                'start_time').replace('Z', '+00:00')
-            blocked_end_time_only = block.get(
-                'end_time').replace('Z', '+00:00')
-            blocked_start = datetime.strptime(
-                f'{current_date}T{blocked_start_time_only}', '%Y-%m-%dT%H:%M:%S%z')
-            blocked_end = datetime.strptime(
-                f'{current_date}T{blocked_end_time_only}', '%Y-%m-%dT%H:%M:%S%z')
-            blocked_hours.append((blocked_start, blocked_end))
-
-        interval = timedelta(minutes=30)
-        appointment_duration = timedelta(minutes=duration_minutes)
-
-        current_time = start_time
-
-        while current_time + appointment_duration <= end_time:
-            is_blocked = any(block_start <= current_time <
-                             block_end for block_start, block_end, in blocked_hours)
-            if not is_blocked:
-                overlap = False
-                for booking in bookings_list:
-                    booking = booking_model.BookingFullModel.model_validate(
-                        booking)
-                    if (booking.booking_status == BookingStatusEnum.CANCELLED):
-
-                        continue
-                    appt_start = booking.appointment_date.start_time
-                    appt_end = booking.appointment_date.end_time
-                    if (current_time < appt_end and (current_time + appointment_duration) > appt_start):
-                        overlap = True
-                if not overlap:
-                    possible_start_times[current_date].append(
-                        current_time.timetz())
-            current_time += interval
-
-    return possible_start_times
+# Booking histories page by appointment time, backed by the (merchant.id | customer.id, start_time, _id) indexes
+BOOKINGS_SORT = [('appointment_date.start_time', 1), ('_id', 1)]
 
 
 @router.get('/availability/{username}/{starting_date}/{duration_minutes}')
-async def get_availability_for_next_7_days(username: str, starting_date: date, duration_minutes: int, db: AsyncIOMotorDatabase = Depends(get_db)):
+async def get_availability_for_next_7_days(
+    username: str,
+    starting_date: date,
+    duration_minutes: int,
+    days: Annotated[int, Query(ge=1, le=MAX_AVAILABILITY_DAYS, description="Number of days to return")] = AVAILABILITY_DAYS,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
 
-    bookings = []
     username_object = await db['usernames'].find_one({'username': username})
 
     if not username_object:
@@ -102,30 +54,56 @@ async def get_availability_for_next_7_days(username: str, starting_date: date, d
 
     user_id = jsonable_encoder(username_object).get('user_id')
     merchant = await db['merchants'].find_one({'user_id': user_id})
-    # merchant = jsonable_encoder(merchant)
-    # return merchant
     schedule = Schedule.model_validate(merchant.get('schedule'))
 
     merchant = user_model.MerchantModelForComparison.model_validate(merchant)
 
-    # return schedule
-    bookings = await db['bookings'].find({'merchant.id': merchant.id}).to_list(length=None)
-    # bookings_list = []
-    # for booking in bookings:
-    #     booking = booking_model.BookingFullModel.model_validate(booking)
-    #     bookings_list.append(booking)
-    # bookings = jsonable_encoder(bookings)
-    # return bookings
-    available_slots = calculate_possible_start_times(
-        schedule, duration_minutes, starting_date, bookings)
+    available_slots = await get_start_times(
+        db, merchant.id, schedule, duration_minutes, starting_date, days)
     return available_slots
 
 
+@router.post('/availability/batch', response_model=List[booking_model.NextAvailableSlot])
+async def get_next_available_slots(payload: booking_model.BatchAvailabilityRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    First available start time for each username, in request order. Usernames, merchants and bookings are
+    each loaded with one query however many merchants are asked for.
+    """
+    usernames = list(dict.fromkeys(payload.usernames))
+    user_ids = {}
+    async for username_object in db['usernames'].find({'username': {'$in': usernames}}, projection={'username': 1, 'user_id': 1}):
+        user_ids[username_object['username']] = username_object.get('user_id')
+
+    merchants = {}
+    async for merchant in db['merchants'].find({'user_id': {'$in': list(user_ids.values())}}, projection={'user_id': 1, 'schedule': 1}):
+        if merchant.get('schedule'):
+            merchants[merchant['user_id']] = merchant
+
+    schedules = {str(merchant['_id']): Schedule.model_validate(merchant['schedule'])
+                 for merchant in merchants.values()}
+    start_times = await get_start_times_for_merchants(
+        db, schedules, payload.duration_minutes, payload.starting_date, payload.days)
+
+    next_slots = []
+    for username in payload.usernames:
+        merchant = merchants.get(user_ids.get(username))
+        if merchant is None:
+            next_slots.append(booking_model.NextAvailableSlot(username=username))
+            continue
+        merchant_id = str(merchant['_id'])
+        start_time = next((combine(day, slots[0]) for day, slots in sorted(start_times[merchant_id].items()) if slots), None)
+        next_slots.append(booking_model.NextAvailableSlot(
+            username=username, merchant_id=merchant_id, start_time=start_time))
+    return next_slots
+
+
 @router.get('/customer/my-bookings')
 async def get_my_bookings_as_customer(
+    response: Response,
     user_profile: Auth0User = Security(auth.get_user),
     page: Annotated[int, Query(description="Page number")] = 1,
     per_page: Annotated[int, Query(description="Items per page")] = 10,
+    cursor: Annotated[Optional[str], Query(description="X-Next-Cursor of the previous page, replaces page")] = None,
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     user_id = user_profile.id
@@ -133,20 +111,24 @@ async def get_my_bookings_as_customer(
         raise HTTPException(
             status_code=400, detail="Invalid page or per_page values")
 
-    # Calculate the number of documents to skip
-    skip = (page - 1) * per_page
+    # Calculate the number of documents to skip, a cursor picks up right after the previous page instead
+    skip = 0 if cursor else (page - 1) * per_page
 
     # Query MongoDB using skip and limit
-    bookings = await db['bookings'].find({"customer.id": user_id}).skip(skip).limit(per_page).to_list(length=None)
+    query = paginated_query(customer_bookings_query(user_id), BOOKINGS_SORT, cursor)
+    bookings = await db['bookings'].find(query).sort(BOOKINGS_SORT).skip(skip).limit(per_page).to_list(length=None)
+    set_next_cursor(response, bookings, BOOKINGS_SORT, per_page)
 
     return bookings
 
 
 @router.get('/merchant/my-bookings')
 async def get_my_bookings_as_merchant(
+    response: Response,
     user_profile: Auth0User = Security(auth.get_user),
     page: Annotated[int, Query(description="Page number")] = 1,
     per_page: Annotated[int, Query(description="Items per page")] = 10,
+    cursor: Annotated[Optional[str], Query(description="X-Next-Cursor of the previous page, replaces page")] = None,
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     user_id = user_profile.id
@@ -155,45 +137,30 @@ async def get_my_bookings_as_merchant(
         raise HTTPException(
             status_code=400, detail="Invalid page or per_page values")
 
-    # Calculate the number of documents to skip
-    skip = (page - 1) * per_page
+    # Calculate the number of documents to skip, a cursor picks up right after the previous page instead
+    skip = 0 if cursor else (page - 1) * per_page
 
     # Query MongoDB using skip and limit
     merchant = await db['merchants'].find_one({'user_id': user_id})
     merchant = user_model.MerchantModelForComparison.model_validate(merchant)
 
-    bookings = await db['bookings'].find({"merchant.id": merchant.id}).skip(skip).limit(per_page).to_list(length=None)
+    query = paginated_query(merchant_bookings_query(merchant.id), BOOKINGS_SORT, cursor)
+    bookings = await db['bookings'].find(query).sort(BOOKINGS_SORT).skip(skip).limit(per_page).to_list(length=None)
+    set_next_cursor(response, bookings, BOOKINGS_SORT, per_page)
 
     return bookings
 
 
-async def check_overlap(appointment_date: date, service_duration_minutes: int, merchant_id: str, db: AsyncIOMotorDatabase):
-    overlap_exists = False
+async def check_overlap(appointment_date: datetime, service_duration_minutes: int, merchant_id: str, db: AsyncIOMotorDatabase, exclude_booking_id: Optional[str] = None):
     start_time = appointment_date
     end_time = start_time + timedelta(minutes=service_duration_minutes)
 
-    bookings = []
-    async for item in db['bookings'].find({"merchant.id": merchant_id}):
-        bookings.append(item)
-
-    # calculate_possible_start_times(schedule, service.duration_minutes, payload.appointment_date.date.date(),)
-
-    # day_of_week = appointment_date.strftime('%A').lower()
-
-    # print(day_of_week)
+    query = overlapping_bookings_query(merchant_id, start_time, end_time)
+    if exclude_booking_id:
+        query['_id'] = {'$ne': exclude_booking_id}
 
-    # calculate_possible_start_times
-    for existing_appointment in bookings:
-        existing_appointment = booking_model.BookingFullModel.model_validate(
-            existing_appointment)
-        if (existing_appointment.booking_status == BookingStatusEnum.CANCELLED):
-            continue
-        existing_start_time = existing_appointment.appointment_date.start_time
-        existing_end_time = existing_appointment.appointment_date.end_time
-        if (start_time < existing_end_time) and (end_time > existing_start_time):
-            overlap_exists = True
-
-    return overlap_exists
+    overlapping_booking = await db['bookings'].find_one(query, projection={'_id': 1})
+    return overlapping_booking is not None
 
 
 @router.post('/create')
@@ -252,16 +219,41 @@ async def create_new_booking(payload: booking_model.CreateBooking, user_profile:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail='Merchant Not Available. Booking overlaps with an existing booking.')
 
+    # The slot is only held until checkout expires, the payment webhook makes it permanent
+    checkout_expires_at, hold_expires_at = hold_window()
+
+    # check_overlap covers bookings made before slot locks existed, the reservation closes the race between
+    # two requests that both passed it
+    try:
+        await reserve_slots(db, merchant.id, booking_info.id, appointment_date.start_time, appointment_date.end_time,
+                            expires_at=hold_expires_at)
+    except SlotUnavailable:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail='Merchant Not Available. Booking overlaps with an existing booking.')
+
     booking_info = jsonable_encoder(booking_info)
-    booking = await db['bookings'].insert_one(booking_info)
+    # Appointment times are stored as BSON dates so overlap checks can use indexed range queries
+    booking_info['appointment_date'] = appointment_date.model_dump()
+    booking_info['hold_expires_at'] = hold_expires_at
+    try:
+        booking = await db['bookings'].insert_one(booking_info)
+    except Exception:
+        await release_slots(db, booking_info['_id'])
+        raise
+    availability_cache.invalidate_booking(
+        merchant.id, appointment_date.start_time, appointment_date.end_time)
 
     new_booking = await db['bookings'].find_one({'_id': booking.inserted_id})
     new_booking = booking_model.BookingFullModel.model_validate(new_booking)
-    checkout_client_secret = create_checkout_session(
-        new_booking, user_profile.email)
+    checkout_session = await create_checkout_session(
+        new_booking, user_profile.email, expires_at=checkout_expires_at)
+    if checkout_session is not None:
+        # Kept on the booking so reopening checkout reuses it
+        await db['bookings'].update_one({'_id': new_booking.id}, {'$set': {'checkout_session': checkout_session.model_dump()}})
+        new_booking.checkout_session = checkout_session
     return {
         'new_booking': new_booking,
-        'client_secret': checkout_client_secret
+        'client_secret': checkout_session.client_secret if checkout_session else None
     }
 
 
@@ -335,7 +327,7 @@ async def reschedule_booking(payload: booking_model.AppointmentStartDate, bookin
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail="Appointment date is in the past")
 
-    if (await check_overlap(payload.date, booking.service.duration_minutes, booking.merchant.id, db)):
+    if (await check_overlap(payload.date, booking.service.duration_minutes, booking.merchant.id, db, exclude_booking_id=booking_id)):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail='Merchant Not Available. Booking overlaps with an existing booking.')
 
@@ -346,6 +338,14 @@ async def reschedule_booking(payload: booking_model.AppointmentStartDate, bookin
     new_appointment_date = booking_model.AppointmentDate.model_validate(
         new_appointment_date)
 
+    try:
+        new_slots = await reserve_slots(db, booking.merchant.id, booking_id,
+                                        new_appointment_date.start_time, new_appointment_date.end_time,
+                                        expires_at=booking.hold_expires_at)
+    except SlotUnavailable:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail='Merchant Not Available. Booking overlaps with an existing booking.')
+
     booking_status = booking.booking_status
     if (booking.booking_status == BookingStatusEnum.RESCHEDULE_PENDING):
         booking_status = BookingStatusEnum.PENDING
@@ -353,11 +353,18 @@ async def reschedule_booking(payload: booking_model.AppointmentStartDate, bookin
         booking_status == BookingStatusEnum.CONFIRMED
 
     # return new_appointment_date
-    booking_update = await db['bookings'].update_one({'_id': booking_id}, {'$set': {'appointment_date': jsonable_encoder(new_appointment_date), 'booking_status': booking_status.value}})
+    booking_update = await db['bookings'].update_one({'_id': booking_id}, {'$set': {'appointment_date': new_appointment_date.model_dump(), 'booking_status': booking_status.value}})
 
     if booking_update.matched_count == 0:
+        await release_slots(db, booking_id)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Booking Not Found.")
+    await release_slots(db, booking_id, keep=new_slots)
+    # Both the freed and the newly taken days change
+    availability_cache.invalidate_booking(
+        booking.merchant.id, booking.appointment_date.start_time, booking.appointment_date.end_time)
+    availability_cache.invalidate_booking(
+        booking.merchant.id, new_appointment_date.start_time, new_appointment_date.end_time)
     if booking_update.modified_count == 0:
         raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED)
 
@@ -390,11 +397,18 @@ async def cancel_booking(booking_id: str, user_profile: Auth0User = Depends(auth
 
     new_booking_status = BookingStatusEnum.CANCELLED
 
-    booking_update = await db['bookings'].update_one({'_id': booking_id}, {'$set': {'booking_status': new_booking_status.value, 'payment_status': payment_status}})
+    # Without hold_lapsed a payment that still lands is refunded instead of reviving the booking
+    booking_update = await db['bookings'].update_one({'_id': booking_id}, {'$set': {'booking_status': new_booking_status.value, 'payment_status': payment_status},
+                                                                           '$unset': {'hold_lapsed': ''}})
 
     if booking_update.matched_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Booking Not Found.")
+    await release_slots(db, booking_id)
+    availability_cache.invalidate_booking(
+        booking.merchant.id, booking.appointment_date.start_time, booking.appointment_date.end_time)
+    if booking.checkout_session is not None:
+        await expire_checkout_session(booking.checkout_session.id)
     if booking_update.modified_count == 0:
         raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED)
 
@@ -2,9 +2,8 @@ import random
 from typing import List
 from fastapi import APIRouter, HTTPException, Depends, status, Depends
 from fastapi.encoders import jsonable_encoder
-from app.config.config import settings
 from app.schema.object_models.v0 import service_model
-from app.auth.auth import Auth0, Auth0User
+from app.auth.auth import Auth0User
 from app.config.database.database import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.helpers.country_data import get_country, list_available_countries
@@ -15,9 +14,6 @@ router = APIRouter(
     tags=['Country Details']
 )
 
-auth = Auth0(domain=settings.AUTH0_DOMAIN,
-             api_audience=settings.AUTH0_API_AUDIENCE, scopes={})
-
 
 @router.get('/available', response_model=List[CountrySummary])
 def get_available_countries():
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, status, Depends, HTTPException, Security
 from fastapi.encoders import jsonable_encoder
 from pydantic_core import ValidationError
-from app.config.config import settings
 from app.helpers.default_user_data import get_default_notification_settings
 from app.schema.object_models.v0 import user_model
 from app.config.database.database import get_db
-from app.auth.auth import Auth0, Auth0User
+from app.auth.auth import Auth0User
+from app.auth.auth_setup import auth
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 router = APIRouter(
@@ -13,10 +13,6 @@ router = APIRouter(
     tags=['Customer Profile']
 )
 
-auth0_domain = settings.AUTH0_DOMAIN
-auth0_api_audience = settings.AUTH0_API_AUDIENCE
-auth = Auth0(domain=auth0_domain, api_audience=auth0_api_audience, scopes={})
-
 
 async def get_customer_profile(user_id: str, db: AsyncIOMotorDatabase):
     customer = await db['customers'].find_one({'user_id': user_id})
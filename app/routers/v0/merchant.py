@@ -1,7 +1,7 @@
 import logging
 from datetime import time
-from typing import Annotated, List
-from fastapi import APIRouter, Query, status, Depends, HTTPException, Security
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Query, Response, status, Depends, HTTPException, Security
 from fastapi.encoders import jsonable_encoder
 from pydantic import ConfigDict, BaseModel, Field
 import pymongo
@@ -9,12 +9,16 @@ import pymongo.errors
 from pymongo.errors import PyMongoError
 
 from app.config.config import settings
+from app.helpers.pagination import paginated_query, set_next_cursor
 from app.helpers.default_user_data import get_default_notification_settings, get_default_schedule
 from app.schema.object_models.v0 import user_model, service_model
 from app.schema.object_models.v0.id_model import PyObjectId
 from app.config.database.database import get_db, get_db_client, get_db_name
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorClient
-from app.auth.auth import Auth0, Auth0User
+from app.auth.auth import Auth0User
+from app.auth.auth_setup import auth
+from app.services.bookings.availability_cache import availability_cache
+from app.services.media.derivatives import media_variants
 
 
 router = APIRouter(
@@ -22,9 +26,6 @@ router = APIRouter(
     tags=['Merchant Profile']
 )
 
-auth0_domain = settings.AUTH0_DOMAIN
-auth0_api_audience = settings.AUTH0_API_AUDIENCE
-auth = Auth0(domain=auth0_domain, api_audience=auth0_api_audience, scopes={})
 db_name = settings.DB_NAME
 
 
@@ -36,42 +37,70 @@ class CreateUserName(BaseModel):
                               arbitrary_types_allowed=True)
 
 
+MERCHANTS_SORT = [('_id', 1)]
+
+
+def merchant_card_stages():
+    """
+    Aggregation stages that turn merchant documents into MerchantCardResponse fields.
+
+    Merchants without a username keep their row, with no username, so the page keeps its cursor.
+    """
+    return [
+        {
+            "$lookup": {
+                "from": "usernames",
+                "localField": "username_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"_id": 0, "username": 1}}],
+                "as": "username"
+            }
+        },
+        {
+            "$unwind": {"path": "$username", "preserveNullAndEmptyArrays": True}
+        },
+        {
+            "$project": {
+                "username": "$username.username",
+                "image_url": "$profile_picture_url",
+                "image_variants": "$profile_picture_variants",
+                "header_name": "$name",
+                "location": 1,
+                "profession": 1,
+            }
+        },
+    ]
+
+
 @router.get('/', status_code=status.HTTP_200_OK, response_model=List[user_model.MerchantCardResponse])
 async def get_merchants(
+    response: Response,
     page: Annotated[int, Query(description="Page Number")] = 1,
     per_page: Annotated[int, Query(
         description="Number of items per page")] = 10,
+    cursor: Annotated[Optional[str], Query(description="X-Next-Cursor of the previous page, replaces page")] = None,
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     if page < 1 or per_page < 1:
         raise HTTPException(
             status_code=400, detail="Invalid page or per_page values")
 
-    # Calculate the number of documents to skip
-    skip = (page - 1) * per_page
+    # Calculate the number of documents to skip, a cursor picks up right after the previous page instead
+    skip = 0 if cursor else (page - 1) * per_page
 
-    # QueryMongoDB using skip and limit
+    # One round trip per page: the page is cut first, then joined to usernames and trimmed to the card fields
+    pipeline = [
+        {"$match": paginated_query({}, MERCHANTS_SORT, cursor)},
+        {"$sort": {"_id": 1}},
+        {"$skip": skip},
+        {"$limit": per_page},
+        *merchant_card_stages(),
+    ]
     try:
-        merchants = await db['merchants'].find().skip(skip).limit(per_page).to_list(length=None)
-        # users = jsonable_encoder(users)
-        # return users
-        # print(users)
-        merchant_profiles = []
-        for merchant in merchants:
-
-            username = await db['usernames'].find_one({'_id': merchant.get('username_id')})
-            merchantCardData = {
-                'username': username.get('username'),
-                'image_url': merchant.get('profile_picture_url'),
-                'header_name': merchant.get('name'),
-                'location': merchant.get('location'),
-                'profession': merchant.get('profession'),
-            }
-            user_model.MerchantCardResponse.model_validate(
-                merchantCardData)
-            merchant_profiles.append(merchantCardData)
-
-        return merchant_profiles
+        merchants = await db['merchants'].aggregate(pipeline).to_list(length=None)
+        # The cursor comes from the whole page, so a merchant without a username cannot end the listing
+        set_next_cursor(response, merchants, MERCHANTS_SORT, per_page)
+        return [merchant for merchant in merchants if "username" in merchant]
 
     except Exception as e:
         raise HTTPException(
@@ -466,6 +495,9 @@ async def update_availability(payload: user_model.Schedule, user_profile: Auth0U
             raise HTTPException(
                 status_code=status.HTTP_304_NOT_MODIFIED, detail="Profile data not updated")
 
+        # Every cached day was computed from the old schedule
+        availability_cache.invalidate(str(merchant['_id']))
+
         if (merchant := await db['merchants'].find_one({'user_id': user_id})) is not None:
             merchant = jsonable_encoder(merchant)
             # print(user)
@@ -554,7 +586,9 @@ async def update_profile_picture_url(payload: user_model.UpdateProfilePictureURL
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail="Merchant profile does not exist. Please create one.")
 
-        updated_user = await db['merchants'].update_one({'user_id': user_id}, {"$set": {"profile_picture_url": payload.profile_picture_url}})
+        # Variants exist when the picture went through the upload endpoint
+        variants = (await media_variants(db, [payload.profile_picture_url])).get(payload.profile_picture_url)
+        updated_user = await db['merchants'].update_one({'user_id': user_id}, {"$set": {"profile_picture_url": payload.profile_picture_url, "profile_picture_variants": variants}})
 
         if updated_user.matched_count == 0:
             raise HTTPException(
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from pydantic import BaseModel, ConfigDict
-from app.config.config import settings
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from app.auth.auth import Auth0, Auth0User
+from app.auth.auth import Auth0User
+from app.auth.auth_setup import auth
 from app.schema.object_models.v0 import booking_model
 from app.config.database.database import get_db
-from app.services.payments.stripe import create_checkout_session, get_checkout_session_status
+from app.services.bookings.holds import extend_hold
+from app.services.payments.stripe import (awaiting_payment, create_checkout_session, get_checkout_session_status,
+                                         reusable_checkout_session)
 # from app.services.payments.stripe import get_stripe_account_id
 
 router = APIRouter(
@@ -13,10 +15,6 @@ router = APIRouter(
     tags=['Stripe Integration Handling'],
 )
 
-auth0_domain = settings.AUTH0_DOMAIN
-auth0_api_audience = settings.AUTH0_API_AUDIENCE
-auth = Auth0(domain=auth0_domain, api_audience=auth0_api_audience, scopes={})
-
 
 class PaymentsAccount(BaseModel):
     provider: str
@@ -27,8 +25,8 @@ class PaymentsAccount(BaseModel):
 
 
 @router.get('/session_status/{session_id}')
-def get_session_status(session_id: str):
-    return get_checkout_session_status(session_id)
+async def get_session_status(session_id: str):
+    return await get_checkout_session_status(session_id)
 
 
 @router.get('/account/id')
@@ -69,7 +67,28 @@ async def set_merchant_stripe_account_id(payload: PaymentsAccount, user_profile:
 async def get_checkout_session(booking_id: str, user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db)):
     booking = await db['bookings'].find_one({'_id': booking_id})
     booking = booking_model.BookingFullModel.model_validate(booking)
-    client_secret = create_checkout_session(booking, user_profile.email)
+    if not awaiting_payment(booking):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail='Booking can no longer be paid. Please book the appointment again.')
+
+    # Page refreshes get the session that is already open instead of a new one on every hit
+    checkout_session = reusable_checkout_session(booking)
+    if checkout_session is not None:
+        return {
+            'client_secret': checkout_session.client_secret
+        }
+
+    # Reopening checkout restarts the hold, a lapsed hold has already released the slot
+    checkout_expires_at = await extend_hold(db, booking_id)
+    if checkout_expires_at is None and booking.hold_expires_at is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail='Booking hold has expired. Please book the appointment again.')
+    checkout_session = await create_checkout_session(booking, user_profile.email, expires_at=checkout_expires_at)
+    if checkout_session is None:
+        return {
+            'client_secret': None
+        }
+    await db['bookings'].update_one({'_id': booking_id}, {'$set': {'checkout_session': checkout_session.model_dump()}})
     return {
-        'client_secret': client_secret
+        'client_secret': checkout_session.client_secret
     }
@@ -1,20 +1,19 @@
 import random
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status, Depends
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status, Depends
 from fastapi.encoders import jsonable_encoder
-from app.config.config import settings
+from app.helpers.pagination import paginated_query, set_next_cursor
 from app.schema.object_models.v0 import service_model
-from app.auth.auth import Auth0, Auth0User
+from app.auth.auth import Auth0User
+from app.auth.auth_setup import auth
 from app.config.database.database import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.services.media.derivatives import refresh_service_variants
 
 router = APIRouter(
     prefix='/api/services',
     tags=['Products/Services']
 )
-auth = Auth0(domain=settings.AUTH0_DOMAIN,
-             api_audience=settings.AUTH0_API_AUDIENCE, scopes={})
-
 
 async def get_owner_details(owner_id: str, db: AsyncIOMotorDatabase):
     owner_details = await db['merchants'].find_one({"user_id": owner_id})
@@ -26,6 +25,49 @@ async def get_owner_details(owner_id: str, db: AsyncIOMotorDatabase):
     return service_model.ServiceOwner(username=username, **owner_details)
 
 
+# Largest page the service listings return
+MAX_PER_PAGE = 100
+SERVICES_SORT = [('_id', 1)]
+
+
+def owner_lookup_stages():
+    """
+    Aggregation stages that attach each service's owner, as a ServiceOwner, in the same round trip.
+
+    Both lookups are indexed on user_id and only bring back the fields a service card shows. Services
+    whose owner has no merchant profile are kept without an owner, so the page keeps its length and
+    its cursor; callers drop them once the cursor is taken.
+    """
+    return [
+        {
+            "$lookup": {
+                "from": "merchants",
+                "localField": "owner_id",
+                "foreignField": "user_id",
+                "pipeline": [
+                    {
+                        "$lookup": {
+                            "from": "usernames",
+                            "localField": "user_id",
+                            "foreignField": "user_id",
+                            "pipeline": [{"$project": {"_id": 0, "username": 1}}],
+                            "as": "username"
+                        }
+                    },
+                    {
+                        "$project": {"_id": 0, "name": 1, "profile_image_url": 1, "profession": 1, "location": 1,
+                                     "username": {"$first": "$username.username"}}
+                    },
+                ],
+                "as": "owner"
+            }
+        },
+        {
+            "$unwind": {"path": "$owner", "preserveNullAndEmptyArrays": True}
+        },
+    ]
+
+
 @router.post("/create", status_code=status.HTTP_201_CREATED, response_model=service_model.ProfileServiceResponse, dependencies=[Depends(auth.implicit_scheme)])
 async def create_service(payload: service_model.CreateService, user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db)):
 
@@ -38,17 +80,31 @@ async def create_service(payload: service_model.CreateService, user_profile: Aut
     payload["owner_id"] = user_profile.id
 
     new_service = await db['services'].insert_one(payload)
+    await refresh_service_variants(db, {"_id": new_service.inserted_id})
     created_service = await db['services'].find_one({"_id": new_service.inserted_id})
     return jsonable_encoder(created_service)
 
 
 @router.get('/', response_model=List[service_model.ServiceResponse])
-async def get_all_services(db: AsyncIOMotorDatabase = Depends(get_db)):
-    services = await db['services'].find().to_list(length=None)
-    for service in services:
-        service['owner'] = await get_owner_details(service.get('owner_id'), db)
-
-    return services
+async def get_all_services(
+    response: Response,
+    page: Annotated[int, Query(ge=1, description="Page number")] = 1,
+    per_page: Annotated[int, Query(ge=1, le=MAX_PER_PAGE, description="Items per page")] = 10,
+    cursor: Annotated[Optional[str], Query(description="X-Next-Cursor of the previous page, replaces page")] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    # One round trip per page: the page is cut first, then only its services are joined to their owners
+    pipeline = [
+        {"$match": paginated_query({}, SERVICES_SORT, cursor)},
+        {"$sort": {"_id": 1}},
+        {"$skip": 0 if cursor else (page - 1) * per_page},
+        {"$limit": per_page},
+        *owner_lookup_stages(),
+    ]
+    services = await db['services'].aggregate(pipeline).to_list(length=None)
+    # The cursor comes from the whole page, so a service without a merchant profile cannot end the listing
+    set_next_cursor(response, services, SERVICES_SORT, per_page)
+    return [service for service in services if "owner" in service]
 
 
 @router.get("/get_my_services", status_code=status.HTTP_200_OK, response_model=List[service_model.ProfileServiceResponse])
@@ -61,58 +117,77 @@ def build_service_query(service_name, min_price, max_price):
     query = {}
     if service_name:
         query["description"] = {"$regex": service_name, "$options": "i"}
+    price = {}
     if min_price is not None:
-        query["price.amount"] = {"$gte": min_price}
+        price["$gte"] = min_price
     if max_price is not None:
-        query["price.amount"] = {"$lte": max_price}
+        price["$lte"] = max_price
+    if price:
+        query["price.amount"] = price
     return query
 
 
 def build_location_query(country, city):
-    query = {}
+    """Filter on the owner's merchant profile, applied inside the merchants lookup."""
+    query = {"public": True}
     if country:
-        query["owner.location.country"] = country.capitalize()
+        query["location.country"] = country.capitalize()
     if city:
-        query["owner.location.city"] = city.capitalize()
+        query["location.city"] = city.capitalize()
     return query
 
 
 def build_aggregation_pipeline(service_query, user_location_query, page, per_page):
+    """
+    Service search, filtering before joining.
+
+    The service predicates and the _id order run first, on the services indexes. The merchants lookup
+    carries the location and public filters, so services of other or private merchants are dropped by
+    the indexed join on user_id instead of after it. Usernames are only looked up for the page itself.
+    """
     return [
         {
-            "$lookup": {
-                "from": "merchants",
-                "localField": "owner_id",
-                "foreignField": "user_id",  # Use "_id" to match the users collection
-                "as": "owner"
-            }
+            "$match": service_query
+        },
+        {
+            "$sort": {"_id": 1}
         },
         {
             "$lookup": {
-                "from": "usernames",
+                "from": "merchants",
                 "localField": "owner_id",
                 "foreignField": "user_id",
-                "as": "username"
+                "pipeline": [
+                    {"$match": user_location_query},
+                    {"$project": {"_id": 0, "name": 1, "profile_image_url": 1, "profession": 1, "location": 1}},
+                ],
+                "as": "owner"
             }
         },
         {
-            "$unwind": "$username"
+            "$unwind": "$owner"
         },
         {
-            "$unwind": "$owner"
+            "$skip": (page - 1) * per_page
         },
         {
-            "$match": user_location_query  # Filter based on user location
+            "$limit": per_page
         },
         {
-            "$match": service_query  # Filter based on service criteria
+            "$lookup": {
+                "from": "usernames",
+                "localField": "owner_id",
+                "foreignField": "user_id",
+                "pipeline": [{"$project": {"_id": 0, "username": 1}}],
+                "as": "username"
+            }
         },
         {
-            "$skip": (page - 1) * per_page
+            "$set": {"owner.username": {"$first": "$username.username"}}
         },
         {
-            "$limit": per_page
-        }
+            "$project": {"username": 0}
+        },
     ]
 
 
@@ -122,11 +197,8 @@ def format_service_results(results):
         owner_info = None  # Initialize owner_info to None
 
         if "owner" in item:
-            if not item.get('owner').get('public'):
-                continue
-
             owner_info = {
-                "username": item["username"]["username"],
+                "username": item.get('owner').get("username"),
                 "name": item.get('owner').get("name"),
                 "profile_image_url": item.get('owner').get("profile_image_url"),
                 "profession": item.get('owner').get("profession"),
@@ -142,6 +214,7 @@ def format_service_results(results):
             "customisation": item.get("customisation", ""),
             "owner": owner_info,  # Use the owner_info obtained above
             "images": item.get("images", []),
+            "image_variants": item.get("image_variants"),
             "price": item.get("price", "")
         }
 
@@ -151,14 +224,17 @@ def format_service_results(results):
 
 
 @router.get("/search-services", response_model=List[service_model.ServiceResponse])
-async def filter_services(service_name: str = None, min_price: float = None, max_price: float = None,
-                          country: str = None, city: str = None, page: int = 1, per_page: int = 10, db: AsyncIOMotorDatabase = Depends(get_db)):
-    service_query = build_service_query(service_name, min_price, max_price)
+async def filter_services(response: Response, service_name: str = None, min_price: float = None, max_price: float = None,
+                          country: str = None, city: str = None, page: int = 1, per_page: int = 10, cursor: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_db)):
+    # A cursor (the X-Next-Cursor of the previous page) picks up right after that page instead of skipping
+    service_query = paginated_query(build_service_query(service_name, min_price, max_price), SERVICES_SORT, cursor)
     user_location_query = build_location_query(country, city)
     pipeline = build_aggregation_pipeline(
-        service_query, user_location_query, page, per_page)
+        service_query, user_location_query, 1 if cursor else page, per_page)
 
     results = await db['services'].aggregate(pipeline).to_list(length=None)
+    # Taken before formatting, which shuffles the page
+    set_next_cursor(response, results, SERVICES_SORT, per_page)
     return format_service_results(results)
 
 
@@ -186,6 +262,7 @@ async def update_service(service_id: str, payload: service_model.UpdateService,
     if updated_service.matched_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Service not found.")
+    await refresh_service_variants(db, {"_id": service_id})
 
     updated_service = await db['services'].find_one({"_id": service_id})
     updated_service = jsonable_encoder(updated_service)
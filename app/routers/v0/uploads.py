@@ -1,25 +1,21 @@
-from datetime import datetime, timedelta
-from random import randbytes
+import asyncio
 import hashlib
 from typing import Annotated, List
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorClient
-from fastapi import APIRouter, Request, Response, Security, status, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Request, Response, Security, status, Depends, HTTPException, UploadFile, File
 from fastapi.encoders import jsonable_encoder
 
 # from app.auth import oauth2, utils
-from app.config.config import settings
 
 # from app.models import user_auth, merchant_models
 from app.config.database.database import get_db
 
 # from app.email.helpers.email import send_mail
-from app.auth.auth import Auth0, Auth0User
-from azure.core.exceptions import AzureError
-from azure.storage.blob import BlobServiceClient
-
-auth0_domain = settings.AUTH0_DOMAIN
-auth0_api_audience = settings.AUTH0_API_AUDIENCE
-auth = Auth0(domain=auth0_domain, api_audience=auth0_api_audience, scopes={})
+from app.auth.auth import Auth0User
+from app.auth.auth_setup import auth
+from app.services.media.derivatives import ImageDerivatives, get_image_derivatives, media_variants
+from app.services.media.library import spool_upload, store_image
+from app.services.storage.azure_blob import BlobStorage, blob_storage
 
 router = APIRouter(
     prefix='/api/uploads',
@@ -27,18 +23,8 @@ router = APIRouter(
 )
 
 
-def get_blob_service_client():
-    try:
-        connect_str = settings.AZURE_STORAGE_CONNECTION_STRING
-        return BlobServiceClient.from_connection_string(connect_str)
-    except AzureError as azure_error:
-        # Handle Azure-specific exceptions here
-        print(f"An Azure error occurred: {azure_error}")
-        # You can choose to log the error, raise a custom exception, or take other actions as needed
-        return None  # Return None or raise a custom exception depending on your requirements
-
-
-container_name = settings.IMAGE_CONTAINER_NAME
+def get_blob_storage() -> BlobStorage:
+    return blob_storage
 
 
 async def get_merchant_id(user_id: str, db: AsyncIOMotorDatabase):
@@ -51,59 +37,50 @@ async def get_merchant_id(user_id: str, db: AsyncIOMotorDatabase):
 
 
 @router.post('/merchant/profile_image/', status_code=status.HTTP_200_OK)
-async def upload_profile_image(user_profile: Auth0User = Security(auth.get_user), image: UploadFile = File(...), db: AsyncIOMotorDatabase = Depends(get_db)):
-    try:
-        blob_service_client = get_blob_service_client()
-        user_id = await get_merchant_id(user_profile.id, db)
-        renamed_file = f"SB{datetime.now().strftime('%Y%m%d%H%M%S')}{randbytes(4).hex()}{image.filename.strip().replace(' ', '_')}"
-        file_name = f"{user_id}/profile/{renamed_file}"
-        with blob_service_client.get_blob_client(container=container_name, blob=file_name) as blob_client:
-            blob_client.upload_blob(image.file, overwrite=True)
-
-        image_url = f"https://{blob_service_client.account_name}.blob.core.windows.net/{container_name}/{file_name}"
-        # print(image_url)
-        updated_account = await db['merchants'].update_one({'user_id': user_profile.id}, {'$set': {'profile_picture_url': image_url}})
-
-        if updated_account.modified_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_304_NOT_MODIFIED, detail="Profile image not updated")
-        if updated_account.matched_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
-
-        return {
-            "message": "Profile Image Updated Successfully!",
-            "URL": image_url
-        }
-    except AzureError as azure_error:
-        # Handle Azure-specific exceptions here
-        print(f"An Azure error occurred: {azure_error}")
+async def upload_profile_image(background_tasks: BackgroundTasks, user_profile: Auth0User = Security(auth.get_user), image: UploadFile = File(...), db: AsyncIOMotorDatabase = Depends(get_db), storage: BlobStorage = Depends(get_blob_storage), derivatives: ImageDerivatives = Depends(get_image_derivatives)):
+    user_id = await get_merchant_id(user_profile.id, db)
+    stored = await store_image(db, storage, user_id, f"{user_id}/profile", image)
+    image_url = stored.url
+    # print(image_url)
+    # A picture the merchant uploaded before may already have its variants
+    variants = (await media_variants(db, [image_url])).get(image_url)
+    updated_account = await db['merchants'].update_one({'user_id': user_profile.id}, {'$set': {'profile_picture_url': image_url, 'profile_picture_variants': variants}})
+
+    # Re-uploading the current picture dedupes to the same URL and modifies nothing, which is still a success
+    if updated_account.matched_count == 0:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{azure_error}")
-    except Exception as e:
-        # raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{e}")
-        raise e
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+
+    if stored.uploaded:
+        # Thumbnails are rendered after the response, list endpoints serve the original until they are ready
+        # Spooled to disk rather than read into memory, the worker process reads it from there
+        background_tasks.add_task(derivatives.process_upload, db, user_id, stored.blob_name, image_url,
+                                  await spool_upload(image))
+
+    return {
+        "message": "Profile Image Updated Successfully!",
+        "URL": image_url
+    }
 
 
 @router.post("/upload/service/")
-async def upload_service_images(user_profile: Auth0User = Security(auth.get_user), images: List[UploadFile] = File(...), db: AsyncIOMotorDatabase = Depends(get_db)):
+async def upload_service_images(background_tasks: BackgroundTasks, user_profile: Auth0User = Security(auth.get_user), images: List[UploadFile] = File(...), db: AsyncIOMotorDatabase = Depends(get_db), storage: BlobStorage = Depends(get_blob_storage), derivatives: ImageDerivatives = Depends(get_image_derivatives)):
 
     try:
-        blob_service_client = get_blob_service_client()
-        directory_name = "services"  # Specify the name of the directory
         user_id = await get_merchant_id(user_profile.id, db)
-        image_urls = []
         directory_name = f"{user_id}/services"
-        for image in images:
-            # renamed_file = image.filename.strip().replace(" ", "_")
-            renamed_file = f"SB{datetime.now().strftime('%Y%m%d%H%M%S')}{randbytes(4).hex()}{image.filename.strip().replace(' ', '_')}"
-            blob_name = f"{directory_name}/{renamed_file}"
-            with blob_service_client.get_blob_client(container=container_name, blob=blob_name) as blob_client:
-                blob_client.upload_blob(image.file, overwrite=True)
-            image_url = f"https://{blob_service_client.account_name}.blob.core.windows.net/{container_name}/{blob_name}"
-            image_urls.append(image_url)
-
-        return {"image_urls": image_urls}
+        # All images upload at once, bounded by the storage's concurrency limit. Files the merchant
+        # uploaded before are not transferred again
+        stored_images = await asyncio.gather(*(store_image(db, storage, user_id, directory_name, image) for image in images))
+        rendering = set()
+        for stored, image in zip(stored_images, images):
+            # The same file twice in one request is uploaded twice to the same blob, render it once
+            if stored.uploaded and stored.url not in rendering:
+                rendering.add(stored.url)
+                background_tasks.add_task(derivatives.process_upload, db, user_id, stored.blob_name, stored.url,
+                                          await spool_upload(image))
+
+        return {"image_urls": [stored.url for stored in stored_images]}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{e}")
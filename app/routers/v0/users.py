@@ -1,32 +1,24 @@
 from pydantic import ConfigDict, BaseModel
-from twilio.rest import Client
 import random
 from typing import List
 from fastapi import APIRouter, HTTPException, Depends, status, Depends
 from fastapi.encoders import jsonable_encoder
-from app.config.config import settings
 from app.schema.object_models.v0 import service_model
-from app.auth.auth import Auth0, Auth0User
+from app.auth.auth import Auth0User
+from app.auth.auth_setup import auth
 from app.config.database.database import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.helpers.country_data import get_country
 from app.schema.object_models.v0.user_model import RegisterUser, UserProfile, UserProfileResponse
 from app.schema.object_models.v0.contact_model import ContactInfo, UpdatePhoneNumber, PhoneNumber
 from app.schema.object_models.v0.country_model import FullCountryModel
+from app.services.verification.twilio import TwilioVerifier, get_verifier
 
 router = APIRouter(
     prefix='/api/users',
     tags=['User Details']
 )
 
-auth = Auth0(domain=settings.AUTH0_DOMAIN,
-             api_audience=settings.AUTH0_API_AUDIENCE, scopes={})
-
-twilio_sid = settings.TWILIO_SID
-twilio_token = settings.TWILIO_TOKEN
-twilio_verification_sid = settings.TWILIO_VERIFICATION_SID
-
-
 @router.post('/register', response_model=UserProfileResponse)
 async def register_user(payload: RegisterUser, user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db)):
 
@@ -98,31 +90,16 @@ async def get_phone_number_verification_status(user_profile: Auth0User = Depends
     return {'is_verified': verification_status}
 
 
-def get_twilio_client():
-    return Client(twilio_sid, twilio_token)
-
-
-def get_verification_service_id():
-    return twilio_verification_sid
-
-
-def start_verification_process(phone_number: str, twilio_client: Client):
-    client = twilio_client
-    verification = client.verify.v2.services(
-        get_verification_service_id()).verifications.create(to=phone_number, channel="sms")
-    return verification.status
-
+async def start_verification_process(phone_number: str, verifier: TwilioVerifier):
+    return await verifier.send_code(phone_number)
 
-def attempt_verification(phone_number: str, code: str, twilio_client: Client):
-    client = twilio_client
 
-    verification_check = client.verify.v2.services(
-        get_verification_service_id()).verification_checks.create(to=phone_number, code=code)
-    return verification_check.status
+async def attempt_verification(phone_number: str, code: str, verifier: TwilioVerifier):
+    return await verifier.check_code(phone_number, code)
 
 
 @router.get('/verify-request/send-otp')
-async def send_otp_for_verification(user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db)):
+async def send_otp_for_verification(user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db), verifier: TwilioVerifier = Depends(get_verifier)):
     user = await db['users'].find_one({'user_id': user_profile.id})
     if not user:
         raise HTTPException(
@@ -138,7 +115,7 @@ async def send_otp_for_verification(user_profile: Auth0User = Depends(auth.get_u
     phone_number_string = phone_number_object.dialing_code + \
         str(phone_number_object.phone_number)
 
-    start_verification_process(phone_number_string, get_twilio_client())
+    await start_verification_process(phone_number_string, verifier)
 
     return {'message': 'OTP Sent'}
 
@@ -150,7 +127,7 @@ class OTP(BaseModel):
 
 
 @router.post('/submit-otp')
-async def submit_otp(payload: OTP, user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db)):
+async def submit_otp(payload: OTP, user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db), verifier: TwilioVerifier = Depends(get_verifier)):
     user = await db['users'].find_one({'user_id': user_profile.id})
     if not user:
         raise HTTPException(
@@ -166,8 +143,8 @@ async def submit_otp(payload: OTP, user_profile: Auth0User = Depends(auth.get_us
     phone_number_string = phone_number_object.dialing_code + \
         str(phone_number_object.phone_number)
 
-    result = attempt_verification(
-        phone_number_string, payload.code, get_twilio_client())
+    result = await attempt_verification(
+        phone_number_string, payload.code, verifier)
     if (result == "approved"):
         updated_result = await db['users'].update_one({'user_id': user_profile.id}, {'$set': {'contact_info.phone_number.is_verified': True}})
         if updated_result.matched_count == 0:
@@ -182,7 +159,7 @@ async def submit_otp(payload: OTP, user_profile: Auth0User = Depends(auth.get_us
 
 
 @router.put('/update/phone-number')
-async def update_phone_number(payload: UpdatePhoneNumber, user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db)):
+async def update_phone_number(payload: UpdatePhoneNumber, user_profile: Auth0User = Depends(auth.get_user), db: AsyncIOMotorDatabase = Depends(get_db), verifier: TwilioVerifier = Depends(get_verifier)):
     user = await db['users'].find_one({'user_id': user_profile.id})
     if not user:
         raise HTTPException(
@@ -218,7 +195,7 @@ async def update_phone_number(payload: UpdatePhoneNumber, user_profile: Auth0Use
     phone_number_string = phone_number.dialing_code + \
         str(phone_number.phone_number)
 
-    start_verification_process(phone_number_string, get_twilio_client())
+    await start_verification_process(phone_number_string, verifier)
 
     return {
         'message': 'Phone Number Updated Successfully. Verification Code Sent'
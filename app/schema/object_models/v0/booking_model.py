@@ -5,7 +5,7 @@ from typing import List, Optional
 from app.schema.enums.enums import BookingStatusEnum, PaymentStatusEnum
 from app.schema.object_models.v0.location_model import Location
 from app.schema.object_models.v0.id_model import PyObjectId
-from app.schema.object_models.v0.payment_model import Price, Transaction
+from app.schema.object_models.v0.payment_model import CheckoutSession, Price, Transaction
 
 
 class AppointmentDate(BaseModel):
@@ -23,6 +23,26 @@ class AppointmentStartDate(BaseModel):
                               arbitrary_types_allowed=True)
 
 
+class BatchAvailabilityRequest(BaseModel):
+    usernames: List[str] = Field(min_length=1, max_length=50)
+    duration_minutes: int = Field(gt=0)
+    starting_date: datetime.date
+    days: int = Field(default=7, ge=1, le=90)
+
+    model_config = ConfigDict(populate_by_name=True,
+                              arbitrary_types_allowed=True)
+
+
+class NextAvailableSlot(BaseModel):
+    username: str
+    merchant_id: Optional[str] = None
+    # None when the username is unknown or nothing is free in the requested days
+    start_time: Optional[datetime.datetime] = None
+
+    model_config = ConfigDict(populate_by_name=True,
+                              arbitrary_types_allowed=True)
+
+
 class CreateBooking(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias='_id')
     service_id: str
@@ -86,6 +106,10 @@ class BookingFullModel(BaseModel):
     booking_status: BookingStatusEnum
     payment_status: PaymentStatusEnum
     appointment_location: Location
+    # Set while the booking is unpaid, the slot is released once it passes
+    hold_expires_at: Optional[datetime.datetime] = None
+    # The open Stripe checkout session, reused until it expires. Never serialised into API responses.
+    checkout_session: Optional[CheckoutSession] = Field(default=None, exclude=True)
     # comments: Optional[str]
     model_config = ConfigDict(
         populate_by_name=True, arbitrary_types_allowed=True)
@@ -0,0 +1,10 @@
+from typing import Dict
+from pydantic import ConfigDict, BaseModel
+
+
+class ImageVariants(BaseModel):
+    original: str
+    # Variant name (thumbnail, thumbnail_jpeg, w320, ...) -> URL
+    variants: Dict[str, str]
+    model_config = ConfigDict(populate_by_name=True,
+                              arbitrary_types_allowed=True)
@@ -15,6 +15,14 @@ class Price(BaseModel):
                               arbitrary_types_allowed=True)
 
 
+class CheckoutSession(BaseModel):
+    id: str
+    client_secret: str
+    expires_at: datetime
+    model_config = ConfigDict(populate_by_name=True,
+                              arbitrary_types_allowed=True)
+
+
 class Transaction(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     payment_gateway: PaymentGatewayEnum
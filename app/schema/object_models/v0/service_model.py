@@ -4,6 +4,7 @@ from bson import ObjectId
 
 from app.schema.object_models.v0.id_model import PyObjectId
 from app.schema.object_models.v0.location_model import Location
+from app.schema.object_models.v0.media_model import ImageVariants
 from app.schema.object_models.v0.payment_model import Price
 
 
@@ -28,6 +29,7 @@ class ProfileServiceResponse(BaseModel):
     out_call: bool = False
     description: str = Field(...)
     images: Optional[List[str]] = None
+    image_variants: Optional[List[ImageVariants]] = None
     price: Price = Field(...)
     # TODO[pydantic]: The following keys were removed: `json_encoders`.
     # Check https://docs.pydantic.dev/dev-v2/migration/#changes-to-config for more information.
@@ -42,6 +44,7 @@ class Service(BaseModel):
     out_call: bool = Field(...)
     description: str = Field(...)
     images: Optional[List[str]] = None
+    image_variants: Optional[List[ImageVariants]] = None
     price: Price = Field(...)
     owner_id: str = Field(...)
     # TODO[pydantic]: The following keys were removed: `json_encoders`.
@@ -67,6 +70,7 @@ class ServiceDBObject(BaseModel):
     out_call: bool = Field(...)
     description: str = Field(...)
     images: Optional[List[str]] = None
+    image_variants: Optional[List[ImageVariants]] = None
     price: Price = Field(...)
     owner_id: str = Field(...)
     # TODO[pydantic]: The following keys were removed: `json_encoders`.
@@ -81,6 +85,7 @@ class ServiceSnapshotResponse(BaseModel):
     duration_minutes: int = Field(...)
     out_call: bool = Field(...)
     images: Optional[List[str]] = None
+    image_variants: Optional[List[ImageVariants]] = None
     price: Price = Field(...)
     model_config = ConfigDict(populate_by_name=True,
                               arbitrary_types_allowed=True)
@@ -100,6 +105,7 @@ class ServiceResponse(BaseModel):
     description: str = Field(...)
     owner: ServiceOwner
     images: Optional[List[str]] = None
+    image_variants: Optional[List[ImageVariants]] = None
     price: Price = Field(...)
 
 
@@ -1,7 +1,7 @@
 from bson import ObjectId
 from datetime import time
 from pydantic import ConfigDict, BaseModel, Field, AnyHttpUrl
-from typing import List, Optional
+from typing import Dict, List, Optional
 from app.schema.object_models.v0.id_model import PyObjectId
 from app.schema.object_models.v0.location_model import Coordinates, Location
 from app.schema.object_models.v0.service_model import ServiceSnapshotResponse
@@ -188,6 +188,7 @@ class MerchantProfileData(BaseModel):
     profession: Optional[str] = None
     location: Location = None
     profile_picture_url: Optional[AnyHttpUrl] = None
+    profile_picture_variants: Optional[Dict[str, str]] = None
     intro_video_url: Optional[AnyHttpUrl] = None
     schedule: Schedule
     bio: Optional[str] = None
@@ -245,6 +246,7 @@ class UpdateMerchantData(BaseModel):
 class MerchantCardResponse(BaseModel):
     username: str
     image_url: Optional[AnyHttpUrl] = None
+    image_variants: Optional[Dict[str, str]] = None
     header_name: str
     location: Location
     profession: Optional[str] = None
@@ -257,6 +259,7 @@ class MerchantDataWithoutSchedule(BaseModel):
     profession: Optional[str] = None
     location: Location
     profile_picture_url: Optional[AnyHttpUrl] = None
+    profile_picture_variants: Optional[Dict[str, str]] = None
     intro_video_url: Optional[AnyHttpUrl] = None
     bio: Optional[str] = None
     model_config = ConfigDict(populate_by_name=True,
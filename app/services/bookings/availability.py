@@ -0,0 +1,137 @@
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple, Union
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.schema.enums.enums import BookingStatusEnum
+from app.schema.object_models.v0.schedule_model import DailyScheduleItem, Schedule
+
+SLOT_INTERVAL = timedelta(minutes=30)
+AVAILABILITY_DAYS = 7
+
+Interval = Tuple[datetime, datetime]
+
+
+def as_utc(value: datetime) -> datetime:
+    """Treat naive datetimes as UTC, which is how BSON stores them."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def combine(day: date, at: time) -> datetime:
+    return datetime.combine(day, at.replace(tzinfo=None), tzinfo=at.tzinfo or timezone.utc)
+
+
+def day_schedule_for(schedule: Schedule, day: date) -> DailyScheduleItem:
+    return getattr(schedule.daily_schedule, day.strftime('%A').lower())
+
+
+def operating_window(schedule: Schedule, day: date) -> Optional[Interval]:
+    day_schedule = day_schedule_for(schedule, day)
+    hours = day_schedule.operating_hours
+    if not day_schedule.is_available or hours.start_time is None or hours.end_time is None:
+        return None
+    return combine(day, hours.start_time), combine(day, hours.end_time)
+
+
+def availability_window(ref_date: date, days: int = AVAILABILITY_DAYS) -> Interval:
+    # Operating hours carry their own UTC offset, so pad the window by a day on each side
+    start = datetime.combine(ref_date - timedelta(days=1), time.min, tzinfo=timezone.utc)
+    end = datetime.combine(ref_date + timedelta(days=days + 1), time.min, tzinfo=timezone.utc)
+    return start, end
+
+
+def overlapping_bookings_query(merchant_id: Union[str, List[str]], start_time: datetime, end_time: datetime,
+                               now: Optional[datetime] = None) -> dict:
+    # end_time > start comes first so the scan only covers bookings that have not ended yet
+    now = now or datetime.now(timezone.utc)
+    return {
+        'merchant.id': {'$in': merchant_id} if isinstance(merchant_id, list) else merchant_id,
+        'appointment_date.end_time': {'$gt': start_time},
+        'appointment_date.start_time': {'$lt': end_time},
+        'booking_status': {'$ne': BookingStatusEnum.CANCELLED.value},
+        # Unpaid bookings only hold their slot until hold_expires_at, paid ones have no hold
+        '$or': [{'hold_expires_at': None}, {'hold_expires_at': {'$gt': now}}],
+    }
+
+
+async def fetch_booked_intervals(db: AsyncIOMotorDatabase, merchant_id: str, window_start: datetime, window_end: datetime) -> List[Interval]:
+    """Load only the active bookings that touch the window, and only their appointment times."""
+    cursor = db['bookings'].find(
+        overlapping_bookings_query(merchant_id, window_start, window_end),
+        projection={'_id': 0, 'appointment_date': 1})
+    return [(as_utc(booking['appointment_date']['start_time']), as_utc(booking['appointment_date']['end_time']))
+            async for booking in cursor]
+
+
+async def fetch_booked_intervals_by_merchant(db: AsyncIOMotorDatabase, merchant_ids: List[str], window_start: datetime,
+                                             window_end: datetime) -> Dict[str, List[Interval]]:
+    """fetch_booked_intervals for many merchants in a single query, grouped by merchant id."""
+    booked: Dict[str, List[Interval]] = {merchant_id: [] for merchant_id in merchant_ids}
+    cursor = db['bookings'].find(
+        overlapping_bookings_query(merchant_ids, window_start, window_end),
+        projection={'_id': 0, 'merchant.id': 1, 'appointment_date': 1})
+    async for booking in cursor:
+        booked[booking['merchant']['id']].append(
+            (as_utc(booking['appointment_date']['start_time']), as_utc(booking['appointment_date']['end_time'])))
+    return booked
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def busy_intervals(schedule: Schedule, ref_date: date, days: int, booked: List[Interval]) -> List[Interval]:
+    """Bookings, blocked dates and each day's blocked hours as one sorted, non-overlapping list."""
+    intervals = list(booked)
+    intervals.extend((as_utc(blocked.start), as_utc(blocked.end))
+                     for blocked in schedule.blocked_dates)
+    for i in range(days):
+        day = ref_date + timedelta(days=i)
+        for block in day_schedule_for(schedule, day).blocked_hours:
+            if block.start_time is not None and block.end_time is not None:
+                intervals.append((combine(day, block.start_time), combine(day, block.end_time)))
+    return merge_intervals(intervals)
+
+
+def compute_start_times(schedule: Schedule, duration_minutes: int, ref_date: date, booked: List[Interval],
+                        days: int = AVAILABILITY_DAYS, interval: timedelta = SLOT_INTERVAL) -> Dict[date, List[time]]:
+    """
+    Start times on each of the `days` days from ref_date where an appointment of duration_minutes
+    fits inside operating hours without touching a booking, blocked date or blocked hours.
+
+    Busy time is merged into one sorted interval list up front, then each day's slots are swept in a
+    single pass with a pointer into that list: O(slots + intervals) instead of O(slots x bookings).
+    """
+    busy = busy_intervals(schedule, ref_date, days, booked)
+    busy_ends = [end for _, end in busy]
+    duration = timedelta(minutes=duration_minutes)
+
+    possible_start_times: Dict[date, List[time]] = {}
+    for i in range(days):
+        day = ref_date + timedelta(days=i)
+        possible_start_times[day] = []
+        window = operating_window(schedule, day)
+        if window is None:
+            continue
+        start_time, end_time = window
+
+        # First busy interval that ends after the opening time
+        j = bisect_right(busy_ends, start_time)
+        current_time = start_time
+        while current_time + duration <= end_time:
+            slot_end = current_time + duration
+            while j < len(busy) and busy[j][1] <= current_time:
+                j += 1
+            if j == len(busy) or busy[j][0] >= slot_end:
+                possible_start_times[day].append(current_time.timetz())
+            current_time += interval
+
+    return possible_start_times
@@ -0,0 +1,162 @@
+import time as clock
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config.config import settings
+from app.schema.object_models.v0.schedule_model import Schedule
+from app.services.bookings.availability import (AVAILABILITY_DAYS, Interval, as_utc, availability_window,
+                                                compute_start_times, fetch_booked_intervals,
+                                                fetch_booked_intervals_by_merchant)
+from app.services.bookings.occupancy import compute_start_times_bitmap
+
+CacheKey = Tuple[str, int, date]
+
+
+class AvailabilityCache:
+    """
+    Bounded LRU of computed start times, one entry per (merchant, duration, day).
+
+    Every write that changes a merchant's free time calls invalidate() or invalidate_booking(). The cache
+    is per process, so with several workers a write only clears the worker that handled it; the TTL bounds
+    how long the other workers can serve slots that were already taken.
+    """
+
+    def __init__(self, ttl: float = 60, maxsize: int = 50_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: 'OrderedDict[CacheKey, Tuple[float, List[time]]]' = OrderedDict()
+        self._keys_by_merchant: Dict[str, Set[CacheKey]] = {}
+        # Bumped on every invalidation so a computation that raced a write is not stored
+        self._generations: Dict[str, int] = {}
+
+    def generation(self, merchant_id: str) -> int:
+        return self._generations.get(merchant_id, 0)
+
+    def get(self, merchant_id: str, duration_minutes: int, ref_date: date, days: int) -> Optional[Dict[date, List[time]]]:
+        """Start times for every requested day, or None (a miss) if any of them is not cached."""
+        now = clock.monotonic()
+        result: Dict[date, List[time]] = {}
+        for i in range(days):
+            day = ref_date + timedelta(days=i)
+            entry = self._entries.get((merchant_id, duration_minutes, day))
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            result[day] = entry[1]
+
+        for day in result:
+            self._entries.move_to_end((merchant_id, duration_minutes, day))
+        self.hits += 1
+        return result
+
+    def put(self, merchant_id: str, duration_minutes: int, start_times: Dict[date, List[time]], generation: int):
+        if self.maxsize <= 0 or self.ttl <= 0 or generation != self.generation(merchant_id):
+            return
+        expires_at = clock.monotonic() + self.ttl
+        keys = self._keys_by_merchant.setdefault(merchant_id, set())
+        for day, slots in start_times.items():
+            key = (merchant_id, duration_minutes, day)
+            self._entries[key] = (expires_at, slots)
+            self._entries.move_to_end(key)
+            keys.add(key)
+        while len(self._entries) > self.maxsize:
+            key, _ = self._entries.popitem(last=False)
+            self._keys_by_merchant.get(key[0], set()).discard(key)
+
+    def invalidate(self, merchant_id: str, days: Optional[Iterable[date]] = None):
+        """Drop the merchant's cached days, or all of them when days is None (e.g. a schedule change)."""
+        self._generations[merchant_id] = self.generation(merchant_id) + 1
+        self.invalidations += 1
+        keys = self._keys_by_merchant.get(merchant_id)
+        if not keys:
+            return
+        if days is None:
+            stale = set(keys)
+        else:
+            days = set(days)
+            stale = {key for key in keys if key[2] in days}
+        for key in stale:
+            self._entries.pop(key, None)
+        keys -= stale
+
+    def invalidate_booking(self, merchant_id: str, start_time: datetime, end_time: datetime):
+        # Operating hours carry their own UTC offset, so a booking can fall on the neighbouring local days
+        first = as_utc(start_time).date() - timedelta(days=1)
+        last = as_utc(end_time).date() + timedelta(days=1)
+        self.invalidate(merchant_id, [first + timedelta(days=i) for i in range((last - first).days + 1)])
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_merchant.clear()
+        self._generations.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+
+availability_cache = AvailabilityCache(ttl=settings.AVAILABILITY_CACHE_TTL_SECONDS,
+                                       maxsize=settings.AVAILABILITY_CACHE_SIZE)
+
+
+async def get_start_times(db: AsyncIOMotorDatabase, merchant_id: str, schedule: Schedule, duration_minutes: int,
+                          ref_date: date, days: int = AVAILABILITY_DAYS) -> Dict[date, List[time]]:
+    """Start times for the merchant, served from availability_cache when every requested day is cached."""
+    cached = availability_cache.get(merchant_id, duration_minutes, ref_date, days)
+    if cached is not None:
+        return cached
+
+    generation = availability_cache.generation(merchant_id)
+    window_start, window_end = availability_window(ref_date, days)
+    booked = await fetch_booked_intervals(db, merchant_id, window_start, window_end)
+    start_times = _compute(schedule, duration_minutes, ref_date, booked, days)
+
+    availability_cache.put(merchant_id, duration_minutes, start_times, generation)
+    return start_times
+
+
+async def get_start_times_for_merchants(db: AsyncIOMotorDatabase, schedules: Dict[str, Schedule], duration_minutes: int,
+                                        ref_date: date, days: int = AVAILABILITY_DAYS) -> Dict[str, Dict[date, List[time]]]:
+    """
+    get_start_times for many merchants. Cached merchants cost nothing, the bookings of all the others are
+    loaded with one query.
+    """
+    results: Dict[str, Dict[date, List[time]]] = {}
+    for merchant_id in schedules:
+        cached = availability_cache.get(merchant_id, duration_minutes, ref_date, days)
+        if cached is not None:
+            results[merchant_id] = cached
+
+    uncached = [merchant_id for merchant_id in schedules if merchant_id not in results]
+    if not uncached:
+        return results
+
+    generations = {merchant_id: availability_cache.generation(merchant_id) for merchant_id in uncached}
+    window_start, window_end = availability_window(ref_date, days)
+    booked = await fetch_booked_intervals_by_merchant(db, uncached, window_start, window_end)
+    for merchant_id in uncached:
+        start_times = _compute(schedules[merchant_id], duration_minutes, ref_date, booked[merchant_id], days)
+        availability_cache.put(merchant_id, duration_minutes, start_times, generations[merchant_id])
+        results[merchant_id] = start_times
+    return results
+
+
+def _compute(schedule: Schedule, duration_minutes: int, ref_date: date, booked: List[Interval], days: int) -> Dict[date, List[time]]:
+    if days > AVAILABILITY_DAYS:
+        # Multi-week ranges use the vectorized occupancy bitmap
+        return compute_start_times_bitmap(schedule, duration_minutes, ref_date, booked, days)
+    return compute_start_times(schedule, duration_minutes, ref_date, booked, days)
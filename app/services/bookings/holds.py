@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError
+
+from app.config.config import settings
+from app.schema.enums.enums import BookingStatusEnum, PaymentStatusEnum
+from app.services.bookings.availability_cache import availability_cache
+from app.services.bookings.slots import extend_slots, release_slots
+
+logger = logging.getLogger(__name__)
+
+# The hold outlives the checkout session so a payment made in its last minute still finds the slot
+# when the webhook arrives
+HOLD_GRACE = timedelta(minutes=5)
+
+
+def hold_window(now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """(checkout session expiry, hold expiry) for a hold that starts now."""
+    now = now or datetime.now(timezone.utc)
+    checkout_expires_at = now + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+    return checkout_expires_at, checkout_expires_at + HOLD_GRACE
+
+
+async def extend_hold(db: AsyncIOMotorDatabase, booking_id: str) -> Optional[datetime]:
+    """
+    Restart the hold of a booking that is still held, e.g. when its checkout is reopened.
+    Returns the expiry for the new checkout session, or None if the booking holds nothing (paid or lapsed).
+    """
+    now = datetime.now(timezone.utc)
+    checkout_expires_at, hold_expires_at = hold_window(now)
+    booking = await db['bookings'].find_one_and_update(
+        {'_id': booking_id, 'hold_expires_at': {'$gt': now}},
+        {'$set': {'hold_expires_at': hold_expires_at}},
+        projection={'_id': 1})
+    if booking is None:
+        return None
+    await extend_slots(db, booking_id, hold_expires_at)
+    return checkout_expires_at
+
+
+async def confirm_hold(db: AsyncIOMotorDatabase, booking: dict):
+    """A paid booking keeps its slot until the appointment is over."""
+    await extend_slots(db, booking['_id'], booking['appointment_date']['end_time'])
+
+
+async def release_expired_holds(db: AsyncIOMotorDatabase, now: Optional[datetime] = None) -> int:
+    """
+    Cancel unpaid bookings, including those whose payment failed, once their hold has passed and free their slots.
+
+    Overlap and availability queries already ignore lapsed holds, this only tidies up the booking status,
+    the slot locks and the availability cache. Bookings are claimed one at a time so a payment that lands
+    in the meantime is never cancelled.
+    """
+    now = now or datetime.now(timezone.utc)
+    released = 0
+    while True:
+        booking = await db['bookings'].find_one_and_update(
+            {'hold_expires_at': {'$lte': now},
+             'payment_status': {'$in': [PaymentStatusEnum.PENDING.value, PaymentStatusEnum.FAILED.value]},
+             'booking_status': {'$ne': BookingStatusEnum.CANCELLED.value}},
+            # hold_lapsed tells a late payment this booking was only let go for want of payment
+            {'$set': {'booking_status': BookingStatusEnum.CANCELLED.value,
+                      'payment_status': PaymentStatusEnum.CANCELLED.value,
+                      'hold_lapsed': True},
+             '$unset': {'hold_expires_at': ''}},
+            projection={'merchant.id': 1, 'appointment_date': 1})
+        if booking is None:
+            return released
+        await release_slots(db, booking['_id'])
+        availability_cache.invalidate_booking(
+            booking['merchant']['id'], booking['appointment_date']['start_time'], booking['appointment_date']['end_time'])
+        released += 1
+
+
+async def run_hold_sweeper(db: AsyncIOMotorDatabase, interval: float = 60):
+    while True:
+        try:
+            released = await release_expired_holds(db)
+            if released:
+                logger.info(f'Released {released} expired booking holds')
+        except PyMongoError as e:
+            logger.warning(f'Releasing expired booking holds failed: {e}')
+        await asyncio.sleep(interval)
@@ -0,0 +1,100 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List
+
+import numpy as np
+
+from app.schema.object_models.v0.schedule_model import Schedule
+from app.services.bookings.availability import (SLOT_INTERVAL, Interval, as_utc, combine, day_schedule_for,
+                                                operating_window)
+
+RESOLUTION = timedelta(minutes=5)
+CELLS_PER_DAY = int(timedelta(days=1) / RESOLUTION)
+MAX_AVAILABILITY_DAYS = 90
+
+
+def _cells(timestamps: np.ndarray, origin: float, round_up: bool) -> np.ndarray:
+    offsets = (timestamps - origin) / RESOLUTION.total_seconds()
+    return (np.ceil(offsets) if round_up else np.floor(offsets)).astype(np.int64)
+
+
+def occupancy_bitmap(schedule: Schedule, ref_date: date, days: int, booked: List[Interval]) -> np.ndarray:
+    """
+    One boolean cell per RESOLUTION step, True where the merchant cannot be booked: outside operating hours,
+    inside blocked hours or blocked dates, or taken by a booking. Cell 0 is midnight UTC the day before
+    ref_date, the extra day on each side absorbs the UTC offsets of operating hours.
+    Busy intervals are rounded outwards and open hours inwards, so the bitmap never reports time as free
+    that is not.
+    """
+    origin = datetime.combine(ref_date - timedelta(days=1), time.min, tzinfo=timezone.utc).timestamp()
+    size = (days + 2) * CELLS_PER_DAY
+
+    open_starts, open_ends = [], []
+    busy = list(booked)
+    busy.extend((as_utc(blocked.start), as_utc(blocked.end)) for blocked in schedule.blocked_dates)
+    for i in range(days):
+        day = ref_date + timedelta(days=i)
+        window = operating_window(schedule, day)
+        if window is None:
+            continue
+        open_starts.append(window[0].timestamp())
+        open_ends.append(window[1].timestamp())
+        for block in day_schedule_for(schedule, day).blocked_hours:
+            if block.start_time is not None and block.end_time is not None:
+                busy.append((combine(day, block.start_time), combine(day, block.end_time)))
+
+    # Difference arrays turn any number of intervals into coverage with a single cumsum
+    open_diff = np.zeros(size + 1, dtype=np.int32)
+    np.add.at(open_diff, np.clip(_cells(np.array(open_starts), origin, True), 0, size), 1)
+    np.add.at(open_diff, np.clip(_cells(np.array(open_ends), origin, False), 0, size), -1)
+
+    busy_diff = np.zeros(size + 1, dtype=np.int32)
+    if busy:
+        busy_starts = np.fromiter((start.timestamp() for start, _ in busy), dtype=np.float64, count=len(busy))
+        busy_ends = np.fromiter((end.timestamp() for _, end in busy), dtype=np.float64, count=len(busy))
+        np.add.at(busy_diff, np.clip(_cells(busy_starts, origin, False), 0, size), 1)
+        np.add.at(busy_diff, np.clip(_cells(busy_ends, origin, True), 0, size), -1)
+
+    is_open = np.cumsum(open_diff[:-1]) > 0
+    is_busy = np.cumsum(busy_diff[:-1]) > 0
+    return ~is_open | is_busy
+
+
+def compute_start_times_bitmap(schedule: Schedule, duration_minutes: int, ref_date: date, booked: List[Interval],
+                               days: int = MAX_AVAILABILITY_DAYS, interval: timedelta = SLOT_INTERVAL) -> Dict[date, List[time]]:
+    """
+    Same result as availability.compute_start_times, computed on an occupancy bitmap: a start is feasible
+    when the sliding window of `duration` cells starting at it holds no occupied cell. The window sums for
+    every possible start come from one prefix sum, so the cost is linear in days, not in slots x bookings.
+    """
+    occupied = occupancy_bitmap(schedule, ref_date, days, booked)
+    origin = datetime.combine(ref_date - timedelta(days=1), time.min, tzinfo=timezone.utc)
+    width = max(int(np.ceil(timedelta(minutes=duration_minutes) / RESOLUTION)), 1)
+
+    prefix = np.concatenate(([0], np.cumsum(occupied, dtype=np.int32)))
+    # free[s] is True when cells s .. s + width - 1 are all unoccupied
+    free = (prefix[width:] - prefix[:-width]) == 0
+
+    possible_start_times: Dict[date, List[time]] = {}
+    duration = timedelta(minutes=duration_minutes)
+    for i in range(days):
+        day = ref_date + timedelta(days=i)
+        possible_start_times[day] = []
+        window = operating_window(schedule, day)
+        if window is None:
+            continue
+        start_time, end_time = window
+        slot_count = int((end_time - duration - start_time) / interval) + 1 if end_time - duration >= start_time else 0
+        if slot_count <= 0:
+            continue
+
+        offsets = np.arange(slot_count) * (interval / RESOLUTION)
+        first_cell = int(np.ceil((start_time - origin) / RESOLUTION))
+        cells = np.floor(first_cell + offsets).astype(np.int64)
+        feasible = np.zeros(slot_count, dtype=bool)
+        in_range = (cells >= 0) & (cells < free.size)
+        feasible[in_range] = free[cells[in_range]]
+
+        possible_start_times[day] = [(start_time + interval * int(n)).timetz()
+                                     for n in np.flatnonzero(feasible)]
+
+    return possible_start_times
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError
+
+from app.services.bookings.availability import as_utc
+
+# Slot locks use the same grid as the occupancy bitmap
+SLOT_BUCKET = timedelta(minutes=5)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+DUPLICATE_KEY_ERROR = 11000
+
+
+class SlotUnavailable(Exception):
+    """Another booking already holds at least one of the requested slot buckets."""
+
+
+def slot_buckets(start_time: datetime, end_time: datetime) -> List[datetime]:
+    """Start of every SLOT_BUCKET the interval touches, rounded outwards so adjacent bookings never share one."""
+    start_time, end_time = as_utc(start_time), as_utc(end_time)
+    first = EPOCH + ((start_time - EPOCH) // SLOT_BUCKET) * SLOT_BUCKET
+    buckets = []
+    bucket = first
+    while bucket < end_time:
+        buckets.append(bucket)
+        bucket += SLOT_BUCKET
+    return buckets
+
+
+async def reserve_slots(db: AsyncIOMotorDatabase, merchant_id: str, booking_id: str, start_time: datetime,
+                        end_time: datetime, expires_at: Optional[datetime] = None) -> List[datetime]:
+    """
+    Claim every bucket of [start_time, end_time) for the booking, or none of them. The locks expire at
+    expires_at (the hold expiry of an unpaid booking) or else when the appointment ends.
+
+    The unique (merchant_id, slot) index turns concurrent claims into duplicate key errors, so two
+    requests for overlapping times cannot both succeed and no lock is held across requests. Buckets the
+    booking already owns (a reschedule onto an overlapping time) are kept as they are.
+    Raises SlotUnavailable after rolling back the buckets this call inserted.
+    """
+    buckets = slot_buckets(start_time, end_time)
+    # The TTL monitor only runs once a minute, locks of lapsed holds must not block the claim meanwhile
+    await db['booking_slots'].delete_many({'merchant_id': merchant_id, 'slot': {'$in': buckets},
+                                           'expires_at': {'$lte': datetime.now(timezone.utc)}})
+    owned = set()
+    async for lock in db['booking_slots'].find({'booking_id': booking_id, 'slot': {'$in': buckets}}, projection={'slot': 1}):
+        owned.add(as_utc(lock['slot']))
+
+    # Locks are only needed until the appointment has passed, the TTL index removes them after that
+    expires_at = expires_at or as_utc(end_time)
+    claims = [{'merchant_id': merchant_id, 'slot': bucket, 'booking_id': booking_id, 'expires_at': expires_at}
+              for bucket in buckets if bucket not in owned]
+    if not claims:
+        return buckets
+
+    try:
+        await db['booking_slots'].insert_many(claims, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        failed = {error['index'] for error in write_errors}
+        inserted = [claim['slot'] for index, claim in enumerate(claims) if index not in failed]
+        if inserted:
+            await db['booking_slots'].delete_many({'booking_id': booking_id, 'slot': {'$in': inserted}})
+        if write_errors and all(error['code'] == DUPLICATE_KEY_ERROR for error in write_errors):
+            raise SlotUnavailable(booking_id) from e
+        raise
+    return buckets
+
+
+async def release_slots(db: AsyncIOMotorDatabase, booking_id: str, keep: Optional[List[datetime]] = None) -> int:
+    """Free the booking's buckets, except those in keep (the buckets of its new time after a reschedule)."""
+    query = {'booking_id': booking_id}
+    if keep:
+        query['slot'] = {'$nin': keep}
+    result = await db['booking_slots'].delete_many(query)
+    return result.deleted_count
+
+
+async def extend_slots(db: AsyncIOMotorDatabase, booking_id: str, expires_at: datetime) -> int:
+    """Move the expiry of the booking's locks, e.g. to the appointment end once a hold is paid."""
+    result = await db['booking_slots'].update_many({'booking_id': booking_id}, {'$set': {'expires_at': expires_at}})
+    return result.modified_count
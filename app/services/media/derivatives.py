@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Union
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config.config import settings
+from app.services.media.images import VARIANTS, render_variants, variant_blob_name
+from app.services.storage.azure_blob import BlobStorage, blob_storage
+
+logger = logging.getLogger(__name__)
+
+MEDIA = 'media'
+
+
+async def record_media(db: AsyncIOMotorDatabase, merchant_id: str, url: str, variants: Dict[str, str]):
+    await db[MEDIA].update_one({'_id': url},
+                               {'$set': {'merchant_id': merchant_id, 'variants': variants,
+                                         'updated_at': datetime.now(timezone.utc)}},
+                               upsert=True)
+
+
+async def media_variants(db: AsyncIOMotorDatabase, urls: List[str]) -> Dict[str, Dict[str, str]]:
+    """Variant URLs of the given original image URLs, for those whose variants are ready."""
+    if not urls:
+        return {}
+    return {media['_id']: media['variants']
+            async for media in db[MEDIA].find({'_id': {'$in': urls}, 'variants': {'$exists': True}}, projection={'variants': 1})}
+
+
+async def refresh_service_variants(db: AsyncIOMotorDatabase, query: dict):
+    """Copy the variants of their images onto the matching services, in the order of `images`."""
+    async for service in db['services'].find(query, projection={'images': 1}):
+        images = service.get('images') or []
+        variants = await media_variants(db, images)
+        image_variants = [{'original': url, 'variants': variants[url]} for url in images if url in variants]
+        await db['services'].update_one({'_id': service['_id']}, {'$set': {'image_variants': image_variants}})
+
+
+class ImageDerivatives:
+    """
+    Renders thumbnails and responsive variants of uploaded images and stores them next to the original.
+
+    Resizing is CPU bound, so it runs in a pool of worker processes rather than on the event loop. Workers
+    are spawned instead of forked so they do not inherit the app's sockets and threads. The pool starts on
+    first use and is shut down by the app lifespan.
+    """
+
+    def __init__(self, storage: BlobStorage, max_workers: int = 2):
+        self.storage = storage
+        self.max_workers = max_workers
+        self.processed = 0
+        self.failed = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    async def generate(self, blob_name: str, source: Union[bytes, str]) -> Dict[str, str]:
+        """
+        Render and upload the variants of the image stored at `blob_name`, returning variant name -> URL.
+        `source` is the image itself or the path of a local copy, which the worker reads on its own.
+        """
+        rendered = await asyncio.get_running_loop().run_in_executor(self._executor(), render_variants, source)
+        variants = [variant for variant in VARIANTS if variant.name in rendered]
+        urls = await asyncio.gather(*(self.storage.upload_bytes(variant_blob_name(blob_name, variant), *rendered[variant.name])
+                                      for variant in variants))
+        return {variant.name: url for variant, url in zip(variants, urls)}
+
+    async def _generate(self, blob_name: str, source: Union[bytes, str]) -> Optional[Dict[str, str]]:
+        # Runs after the response went out, a file that is not an image only loses its variants
+        try:
+            variants = await self.generate(blob_name, source)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f'Generating image variants of {blob_name} failed: {e}')
+            return None
+        self.processed += 1
+        return variants
+
+    async def process_image(self, db: AsyncIOMotorDatabase, merchant_id: str, blob_name: str, url: str,
+                            source: Union[bytes, str]):
+        variants = await self._generate(blob_name, source)
+        if variants is None:
+            return
+        await record_media(db, merchant_id, url, variants)
+        # The merchant may have saved a service or profile picture with this image while it was rendering
+        await refresh_service_variants(db, {'images': url})
+        await db['merchants'].update_one({'_id': merchant_id, 'profile_picture_url': url},
+                                         {'$set': {'profile_picture_variants': variants}})
+
+    async def process_upload(self, db: AsyncIOMotorDatabase, merchant_id: str, blob_name: str, url: str, path: str):
+        """process_image for an upload spooled to `path`, which is removed afterwards."""
+        try:
+            await self.process_image(db, merchant_id, blob_name, url, path)
+        finally:
+            os.remove(path)
+
+    def stats(self) -> dict:
+        return {'processed': self.processed, 'failed': self.failed}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+image_derivatives = ImageDerivatives(blob_storage, max_workers=settings.IMAGE_WORKERS)
+
+
+def get_image_derivatives() -> ImageDerivatives:
+    return image_derivatives
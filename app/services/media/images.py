@@ -0,0 +1,71 @@
+"""
+Image derivatives, rendered with Pillow.
+
+This module runs in the worker processes of the derivative pool, so it only depends on Pillow and is cheap
+to import.
+"""
+import io
+import os
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+
+class Variant(NamedTuple):
+    name: str
+    width: int
+    # Variants with a height are cropped to exactly width x height, the others keep the aspect ratio
+    height: Optional[int]
+    format: str
+
+
+# Square thumbnails for merchant cards and search results, plus widths for responsive srcsets. WebP for
+# browsers that take it and a JPEG thumbnail for the ones that do not
+VARIANTS = (
+    Variant('thumbnail', 160, 160, 'WEBP'),
+    Variant('thumbnail_jpeg', 160, 160, 'JPEG'),
+    Variant('w320', 320, None, 'WEBP'),
+    Variant('w640', 640, None, 'WEBP'),
+    Variant('w1280', 1280, None, 'WEBP'),
+)
+
+FORMATS = {'WEBP': ('webp', 'image/webp', 80), 'JPEG': ('jpg', 'image/jpeg', 85)}
+
+
+def variant_blob_name(blob_name: str, variant: Variant) -> str:
+    """Variants are stored next to the original, `a/b/photo.jpg` becomes `a/b/photo_w320.webp`."""
+    extension = FORMATS[variant.format][0]
+    return f'{os.path.splitext(blob_name)[0]}_{variant.name}.{extension}'
+
+
+def _encode(image: Image.Image, format: str) -> bytes:
+    _, _, quality = FORMATS[format]
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha and format == 'WEBP' else 'RGB')
+    output = io.BytesIO()
+    image.save(output, format=format, quality=quality)
+    return output.getvalue()
+
+
+def render_variants(source: Union[bytes, str]) -> Dict[str, Tuple[bytes, str]]:
+    """
+    Render every variant of an image, as variant name -> (encoded bytes, content type). `source` is the
+    image's bytes or the path of a file holding it.
+
+    Width-bounded variants are never upscaled, an image narrower than a variant's width skips it and clients
+    fall back to the original. Raises PIL.UnidentifiedImageError when `source` is not an image.
+    """
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as original:
+        # Phones store the orientation in EXIF, the resized copies drop it so apply it to the pixels
+        image = ImageOps.exif_transpose(original)
+        rendered = {}
+        for variant in VARIANTS:
+            if variant.height is not None:
+                resized = ImageOps.fit(image, (variant.width, variant.height), Image.Resampling.LANCZOS)
+            elif image.width > variant.width:
+                height = max(1, round(image.height * variant.width / image.width))
+                resized = image.resize((variant.width, height), Image.Resampling.LANCZOS)
+            else:
+                continue
+            rendered[variant.name] = (_encode(resized, variant.format), FORMATS[variant.format][1])
+        return rendered
@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from fastapi import UploadFile
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+from app.services.media.derivatives import MEDIA
+from app.services.storage.azure_blob import BlobStorage, iter_chunks
+
+
+class StoredImage(NamedTuple):
+    url: str
+    blob_name: str
+    # False when the merchant already had this file and the transfer was skipped
+    uploaded: bool
+
+
+async def content_hash(file: UploadFile) -> str:
+    """SHA-256 of an upload, read chunk by chunk. Rewinds the file for the upload that follows."""
+    digest = hashlib.sha256()
+    async for chunk in iter_chunks(file):
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest()
+
+
+async def spool_upload(file: UploadFile) -> str:
+    """
+    Copy an upload to a temporary file chunk by chunk and return its path, for work that runs after the
+    request, once the upload itself is closed. The caller removes the file.
+    """
+    await file.seek(0)
+    with tempfile.NamedTemporaryFile(prefix='upload-', suffix=os.path.splitext(file.filename or '')[1].lower(),
+                                     delete=False) as spooled:
+        async for chunk in iter_chunks(file):
+            await asyncio.to_thread(spooled.write, chunk)
+    return spooled.name
+
+
+def content_blob_name(directory: str, digest: str, filename: str) -> str:
+    # Named after the content, so uploads of the same file can only ever write the same blob
+    return f'{directory}/{digest}{os.path.splitext(filename or "")[1].lower()}'
+
+
+async def store_image(db: AsyncIOMotorDatabase, storage: BlobStorage, merchant_id: str, directory: str,
+                      file: UploadFile) -> StoredImage:
+    """
+    Upload an image to the merchant's `directory`, unless the merchant already uploaded the same content.
+
+    A file the merchant uploaded before, in any directory, is not transferred again and its existing URL is
+    returned instead.
+    """
+    digest = await content_hash(file)
+    existing = await db[MEDIA].find_one({'merchant_id': merchant_id, 'sha256': digest}, projection={'blob_name': 1})
+    if existing is not None:
+        return StoredImage(existing['_id'], existing['blob_name'], False)
+
+    blob_name = content_blob_name(directory, digest, file.filename)
+    url = await storage.upload(blob_name, file)
+    try:
+        await db[MEDIA].insert_one({'_id': url, 'merchant_id': merchant_id, 'sha256': digest, 'blob_name': blob_name,
+                                    'created_at': datetime.now(timezone.utc)})
+    except DuplicateKeyError:
+        # A concurrent upload of the same file was recorded first, use its URL
+        existing = await db[MEDIA].find_one({'merchant_id': merchant_id, 'sha256': digest}, projection={'blob_name': 1})
+        if existing is not None:
+            return StoredImage(existing['_id'], existing['blob_name'], True)
+    return StoredImage(url, blob_name, True)
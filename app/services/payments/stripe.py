@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from fastapi import HTTPException, status
 from pydantic import BaseModel, ConfigDict
 import stripe
@@ -5,10 +7,74 @@ from stripe import StripeError
 from app.auth.auth import Auth0User
 from app.config.config import settings
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.schema.enums.enums import BookingStatusEnum, PaymentStatusEnum
 from app.schema.object_models.v0 import booking_model
+from app.schema.object_models.v0.payment_model import CheckoutSession
+from app.helpers.metrics import CallMetrics
+from app.services.bookings.availability import as_utc
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 payment_return_url = settings.PAYMENT_RETURN_URL
+# A stored checkout session is only handed out again if the customer still has this long to pay
+CHECKOUT_SESSION_MIN_REMAINING = timedelta(minutes=2)
+
+
+class StripeGateway:
+    """
+    Async Stripe API client shared by the whole process.
+
+    Calls go through one pooled httpx.AsyncClient, so they never block the event loop and reuse
+    connections, each request is bounded by `timeout`, and every call's latency is recorded per operation.
+    """
+
+    def __init__(self, api_key: str, timeout: float = 10, max_network_retries: int = 2, api_base: Optional[str] = None):
+        self.http_client = stripe.HTTPXClient(timeout=timeout)
+        self.client = stripe.StripeClient(
+            api_key,
+            http_client=self.http_client,
+            max_network_retries=max_network_retries,
+            base_addresses={'api': api_base} if api_base else {},
+        )
+        self.metrics = CallMetrics()
+
+    async def create_account(self, params: dict):
+        async with self.metrics.track('accounts.create'):
+            return await self.client.accounts.create_async(params=params)
+
+    async def retrieve_account(self, account_id: str):
+        async with self.metrics.track('accounts.retrieve'):
+            return await self.client.accounts.retrieve_async(account_id)
+
+    async def create_login_link(self, account_id: str):
+        async with self.metrics.track('accounts.login_links.create'):
+            return await self.client.accounts.login_links.create_async(account_id)
+
+    async def retrieve_balance(self, account_id: str):
+        async with self.metrics.track('balance.retrieve'):
+            return await self.client.balance.retrieve_async(options={'stripe_account': account_id})
+
+    async def create_checkout_session(self, params: dict):
+        async with self.metrics.track('checkout.sessions.create'):
+            return await self.client.checkout.sessions.create_async(params=params)
+
+    async def retrieve_checkout_session(self, session_id: str):
+        async with self.metrics.track('checkout.sessions.retrieve'):
+            return await self.client.checkout.sessions.retrieve_async(session_id)
+
+    async def expire_checkout_session(self, session_id: str):
+        async with self.metrics.track('checkout.sessions.expire'):
+            return await self.client.checkout.sessions.expire_async(session_id)
+
+    def stats(self) -> dict:
+        return self.metrics.stats()
+
+    async def close(self):
+        await self.http_client.close_async()
+
+
+stripe_gateway = StripeGateway(settings.STRIPE_SECRET_KEY,
+                               timeout=settings.STRIPE_TIMEOUT_SECONDS,
+                               api_base=settings.STRIPE_API_BASE)
 
 
 class PaymentsAccount(BaseModel):
@@ -25,15 +91,15 @@ async def create_stripe_connected_account(user_profile: Auth0User, email: str, c
     """
     try:
         user_id = user_profile.id
-        account = stripe.Account.create(
-            type='express',
-            country=country_code,
-            email=email,
-            capabilities={
+        account = await stripe_gateway.create_account({
+            'type': 'express',
+            'country': country_code,
+            'email': email,
+            'capabilities': {
                 'card_payments': {'requested': True},
                 'transfers': {'requested': True},
             },
-        )
+        })
 
         payments_account = {
             'provider': 'stripe',
@@ -67,36 +133,36 @@ async def get_stripe_account_id(user_profile: Auth0User, db: AsyncIOMotorDatabas
     return
 
 
-def check_stripe_onboarding_status(account_id: str):
+async def check_stripe_onboarding_status(account_id: str):
     """
     Check the onboarding status of a user's Stripe account.
     """
     try:
-        account = stripe.Account.retrieve(account_id)
+        account = await stripe_gateway.retrieve_account(account_id)
         return account.details_submitted
     except StripeError as e:
         print(f"Error checking Stripe onboarding status: {str(e)}")
         return False
 
 
-def generate_stripe_login_link(account_id: str):
+async def generate_stripe_login_link(account_id: str):
     """
     Generate a login link for the user to access their Stripe dashboard.
     """
     try:
-        login_link = stripe.Account.create_login_link(account_id)
+        login_link = await stripe_gateway.create_login_link(account_id)
         return login_link.url
     except StripeError as e:
         print(f"Error generating Stripe login link: {str(e)}")
         return None
 
 
-def fetch_stripe_account_balance(account_id: str):
+async def fetch_stripe_account_balance(account_id: str):
     """
     Fetch the balance of a user's Stripe connected account.
     """
     try:
-        balance = stripe.Balance.retrieve(stripe_account=account_id)
+        balance = await stripe_gateway.retrieve_balance(account_id)
         return balance
     except StripeError as e:
         print(f"Error fetching Stripe account balance: {str(e)}")
@@ -121,7 +187,27 @@ def get_line_items(booking: booking_model.BookingFullModel):
     return line_items
 
 
-def create_checkout_session(booking: booking_model.BookingFullModel, email: str):
+def awaiting_payment(booking: booking_model.BookingFullModel) -> bool:
+    """
+    Whether the booking can still be paid: pending, not paid yet, and still holding its slot if it was held.
+    Cancelled bookings and lapsed holds have released their slot, a payment for them would not secure it.
+    """
+    if booking.booking_status != BookingStatusEnum.PENDING:
+        return False
+    if booking.payment_status not in (PaymentStatusEnum.PENDING, PaymentStatusEnum.FAILED):
+        return False
+    return booking.hold_expires_at is None or as_utc(booking.hold_expires_at) > datetime.now(timezone.utc)
+
+
+def reusable_checkout_session(booking: booking_model.BookingFullModel) -> Optional[CheckoutSession]:
+    """The booking's stored checkout session, if it is still open long enough to complete a payment."""
+    session = booking.checkout_session
+    if session is None or session.expires_at <= datetime.now(timezone.utc) + CHECKOUT_SESSION_MIN_REMAINING:
+        return None
+    return session
+
+
+async def create_checkout_session(booking: booking_model.BookingFullModel, email: str, expires_at: Optional[datetime] = None) -> Optional[CheckoutSession]:
     """
     Create a Stripe Checkout session for the given user and items.
 
@@ -129,33 +215,52 @@ def create_checkout_session(booking: booking_model.BookingFullModel, email: str)
     :param items: A list of dictionaries containing 'price_data' and 'quantity' for each item
     :param success_url: The URL to redirect to after successful payment
     :param cancel_url: The URL to redirect to if the user cancels the payment
-    :return: The created Checkout session object or None if there's an error
+    :param expires_at: When the session stops accepting payment, i.e. the end of the booking hold
+    :return: The id, client secret and expiry of the created Checkout session or None if there's an error
     """
     try:
-        checkout_session = stripe.checkout.Session.create(
-            ui_mode='embedded',
-            payment_method_types=['card'],
-            customer_email=email,
-            line_items=get_line_items(booking),
-            mode='payment',
-            return_url=payment_return_url,
-            metadata={
+        params = {
+            'ui_mode': 'embedded',
+            'payment_method_types': ['card'],
+            'customer_email': email,
+            'line_items': get_line_items(booking),
+            'mode': 'payment',
+            'return_url': payment_return_url,
+            'metadata': {
                 'booking_id': booking.id
             },
-            payment_intent_data={
+            'payment_intent_data': {
                 "metadata": {
                     "booking_id": booking.id,
                 }
             },
+        }
+        if expires_at is not None:
+            params['expires_at'] = int(expires_at.timestamp())
+        checkout_session = await stripe_gateway.create_checkout_session(params)
+        return CheckoutSession(
+            id=checkout_session.id,
+            client_secret=checkout_session.client_secret,
+            expires_at=datetime.fromtimestamp(checkout_session.expires_at, timezone.utc),
         )
-        return checkout_session.client_secret
     except StripeError as e:
         print(f"Error creating Checkout session: {str(e)}")
         return None
 
 
-def get_checkout_session_status(id: str):
-    session = stripe.checkout.Session.retrieve(id)
+async def expire_checkout_session(session_id: str):
+    """
+    Stop an open Checkout session from taking payment, e.g. once its booking is cancelled.
+    """
+    try:
+        await stripe_gateway.expire_checkout_session(session_id)
+    except StripeError as e:
+        # Completed or already expired sessions cannot be expired
+        print(f"Error expiring Checkout session: {str(e)}")
+
+
+async def get_checkout_session_status(id: str):
+    session = await stripe_gateway.retrieve_checkout_session(id)
     return {
         'status': session.status,
         'customer_email': session.customer_details.email
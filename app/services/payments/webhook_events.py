@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.schema.enums.enums import BookingStatusEnum, PaymentGatewayEnum, PaymentStatusEnum
+from app.services.bookings.availability import as_utc
+from app.services.bookings.availability_cache import availability_cache
+from app.services.bookings.holds import confirm_hold
+from app.services.bookings.slots import SlotUnavailable, release_slots, reserve_slots
+
+logger = logging.getLogger(__name__)
+
+EVENTS = 'stripe_events'
+PENDING = 'pending'
+PROCESSED = 'processed'
+FAILED = 'failed'
+
+
+def event_booking_id(event: dict) -> Optional[str]:
+    metadata = ((event.get('data') or {}).get('object') or {}).get('metadata') or {}
+    return metadata.get('booking_id')
+
+
+async def record_event(db: AsyncIOMotorDatabase, event: dict) -> bool:
+    """Persist a verified webhook event. Returns False when Stripe redelivers an event we already have."""
+    try:
+        await db[EVENTS].insert_one({
+            '_id': event['id'],
+            'type': event['type'],
+            'booking_id': event_booking_id(event),
+            'created': event.get('created', 0),
+            'payload': event,
+            'status': PENDING,
+            'attempts': 0,
+            'received_at': datetime.now(timezone.utc),
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def invalidate_booking_availability(booking: Optional[dict]):
+    if booking is None:
+        return
+    merchant_id = booking['merchant']['id']
+    start_time = booking['appointment_date']['start_time']
+    end_time = booking['appointment_date']['end_time']
+    if isinstance(start_time, datetime) and isinstance(end_time, datetime):
+        availability_cache.invalidate_booking(merchant_id, start_time, end_time)
+    else:
+        # Legacy string dates that the startup migration has not converted yet
+        availability_cache.invalidate(merchant_id)
+
+
+async def record_transaction(db: AsyncIOMotorDatabase, event: dict, booking_id: str, payment_intent: dict):
+    # Keyed by the event id, so processing an event twice cannot record its payment twice
+    try:
+        await db['transactions'].insert_one({
+            '_id': event['id'],
+            'payment_gateway': PaymentGatewayEnum.STRIPE.value,
+            'booking_id': booking_id,
+            'payment_intent': payment_intent,
+        })
+    except DuplicateKeyError:
+        pass
+
+
+async def mark_for_refund(db: AsyncIOMotorDatabase, booking_id: str):
+    await db['bookings'].update_one(
+        {'_id': booking_id},
+        {'$set': {'booking_status': BookingStatusEnum.CANCELLED.value,
+                  'payment_status': PaymentStatusEnum.REFUND_PENDING.value},
+         '$unset': {'hold_expires_at': '', 'hold_lapsed': ''}})
+
+
+async def handle_payment_succeeded(db: AsyncIOMotorDatabase, event: dict):
+    payment_intent = event['data']['object']
+    booking_id = payment_intent['metadata'].get('booking_id')
+    await record_transaction(db, event, booking_id, payment_intent)
+
+    # Marking the payment first keeps the hold sweeper away from the booking from here on
+    booking = await db['bookings'].find_one_and_update(
+        {'_id': booking_id},
+        {'$set': {'payment_status': PaymentStatusEnum.SUCCESS.value}},
+        projection={'merchant.id': 1, 'appointment_date': 1, 'booking_status': 1, 'hold_expires_at': 1, 'hold_lapsed': 1})
+    if booking is None:
+        return
+
+    cancelled = booking.get('booking_status') == BookingStatusEnum.CANCELLED.value
+    if cancelled and not booking.get('hold_lapsed'):
+        # Cancelled by the customer or the merchant, the payment is not wanted anymore
+        await mark_for_refund(db, booking_id)
+        logger.warning(f'Booking {booking_id} was paid after it was cancelled, marked for refund')
+        return
+
+    hold_expires_at = booking.get('hold_expires_at')
+    lapsed = hold_expires_at is not None and as_utc(hold_expires_at) <= datetime.now(timezone.utc)
+    if cancelled or lapsed:
+        # Paid after the hold ran out, its slot locks may be gone: claim the slot again
+        try:
+            await reserve_slots(db, booking['merchant']['id'], booking_id,
+                                booking['appointment_date']['start_time'], booking['appointment_date']['end_time'])
+        except SlotUnavailable:
+            await mark_for_refund(db, booking_id)
+            logger.warning(f'Booking {booking_id} was paid after its slot was taken, marked for refund')
+            return
+
+    # Paid bookings keep their slot, the hold no longer applies
+    confirmed = await db['bookings'].update_one(
+        {'_id': booking_id,
+         '$or': [{'booking_status': BookingStatusEnum.PENDING.value},
+                 {'booking_status': BookingStatusEnum.CANCELLED.value, 'hold_lapsed': True}]},
+        {'$set': {'booking_status': BookingStatusEnum.CONFIRMED.value},
+         '$unset': {'hold_expires_at': '', 'hold_lapsed': ''}})
+    if confirmed.matched_count == 0:
+        # Cancelled while the payment was being applied
+        await release_slots(db, booking_id)
+        await mark_for_refund(db, booking_id)
+        logger.warning(f'Booking {booking_id} was paid after it was cancelled, marked for refund')
+        return
+    await confirm_hold(db, booking)
+    invalidate_booking_availability(booking)
+
+
+async def handle_payment_failed(db: AsyncIOMotorDatabase, event: dict):
+    payment_intent = event['data']['object']
+    booking_id = payment_intent['metadata'].get('booking_id')
+    await record_transaction(db, event, booking_id, payment_intent)
+    # The customer can retry within the checkout session, so the hold stays in place
+    await db['bookings'].update_one({'_id': booking_id}, {'$set': {'payment_status': PaymentStatusEnum.FAILED.value}})
+
+
+EVENT_HANDLERS = {
+    'payment_intent.succeeded': handle_payment_succeeded,
+    'payment_intent.payment_failed': handle_payment_failed,
+    # Older name the webhook used to listen for
+    'payment_intent.failed': handle_payment_failed,
+}
+
+
+class StripeEventProcessor:
+    """
+    Applies persisted webhook events to bookings and transactions, in the background.
+
+    Events are claimed in batches with a lease, so several workers can run this side by side. Within a
+    booking, events are applied oldest first and a failing event holds back the later ones until it
+    succeeds or runs out of attempts; events of different bookings are applied concurrently. Handlers
+    are idempotent, so an event retried after a crash has the same effect as applying it once.
+    """
+
+    def __init__(self, batch_size: int = 100, poll_interval: float = 5, lease: timedelta = timedelta(seconds=60),
+                 max_attempts: int = 10):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.worker_id = uuid.uuid4().hex
+        self.processed = 0
+        self.retries = 0
+        self.failed = 0
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        """Process new events now instead of at the next poll."""
+        self._wakeup.set()
+
+    def stats(self) -> Dict:
+        return {'processed': self.processed, 'retries': self.retries, 'failed': self.failed}
+
+    async def _claim(self, db: AsyncIOMotorDatabase) -> List[dict]:
+        now = datetime.now(timezone.utc)
+        claimable = {'status': PENDING, '$or': [{'lease_until': None}, {'lease_until': {'$lte': now}}]}
+        order = [('created', 1), ('_id', 1)]
+        ids = [event['_id'] async for event in
+               db[EVENTS].find(claimable, projection={'_id': 1}).sort(order).limit(self.batch_size)]
+        if not ids:
+            return []
+        await db[EVENTS].update_many({'_id': {'$in': ids}, **claimable},
+                                     {'$set': {'lease_owner': self.worker_id, 'lease_until': now + self.lease}})
+        return await db[EVENTS].find({'_id': {'$in': ids}, 'lease_owner': self.worker_id, 'status': PENDING}) \
+            .sort(order).to_list(length=None)
+
+    async def _held_elsewhere(self, db: AsyncIOMotorDatabase, events: List[dict]) -> Dict[str, Tuple]:
+        """For each booking, the oldest of its pending events that this worker did not claim."""
+        booking_ids = list({event['booking_id'] for event in events if event.get('booking_id')})
+        oldest: Dict[str, Tuple] = {}
+        async for event in db[EVENTS].find(
+                {'booking_id': {'$in': booking_ids}, 'status': PENDING, 'lease_owner': {'$ne': self.worker_id}},
+                projection={'booking_id': 1, 'created': 1}):
+            key = (event['created'], event['_id'])
+            if event['booking_id'] not in oldest or key < oldest[event['booking_id']]:
+                oldest[event['booking_id']] = key
+        return oldest
+
+    async def _release(self, db: AsyncIOMotorDatabase, events: List[dict]):
+        if events:
+            await db[EVENTS].update_many({'_id': {'$in': [event['_id'] for event in events]}, 'lease_owner': self.worker_id},
+                                         {'$unset': {'lease_owner': '', 'lease_until': ''}})
+
+    async def _apply(self, db: AsyncIOMotorDatabase, event: dict) -> bool:
+        handler = EVENT_HANDLERS.get(event['type'])
+        try:
+            if handler is not None:
+                await handler(db, event['payload'])
+        except Exception as e:
+            attempts = event.get('attempts', 0) + 1
+            status = FAILED if attempts >= self.max_attempts else PENDING
+            retry_at = datetime.now(timezone.utc) + min(timedelta(seconds=2 ** attempts), timedelta(minutes=5))
+            # Dropping the lease owner keeps the booking's later events waiting for this one
+            await db[EVENTS].update_one({'_id': event['_id']},
+                                        {'$set': {'status': status, 'attempts': attempts, 'last_error': str(e),
+                                                  'lease_until': retry_at},
+                                         '$unset': {'lease_owner': ''}})
+            if status == FAILED:
+                self.failed += 1
+                logger.error(f"Stripe event {event['_id']} ({event['type']}) failed {attempts} times: {e}")
+            else:
+                self.retries += 1
+                logger.warning(f"Stripe event {event['_id']} ({event['type']}) failed, retrying: {e}")
+            return False
+
+        await db[EVENTS].update_one({'_id': event['_id']},
+                                    {'$set': {'status': PROCESSED, 'processed_at': datetime.now(timezone.utc)},
+                                     '$unset': {'lease_owner': '', 'lease_until': ''}})
+        self.processed += 1
+        return True
+
+    async def _apply_in_order(self, db: AsyncIOMotorDatabase, events: List[dict], held_from: Optional[Tuple]) -> int:
+        for index, event in enumerate(events):
+            if held_from is not None and (event['created'], event['_id']) > held_from:
+                # An older event of this booking is not ours to apply yet
+                await self._release(db, events[index:])
+                return index
+            if not await self._apply(db, event):
+                await self._release(db, events[index + 1:])
+                return index + 1
+        return len(events)
+
+    async def process_batch(self, db: AsyncIOMotorDatabase) -> int:
+        """Claim and apply one batch, returning how many events were attempted."""
+        events = await self._claim(db)
+        if not events:
+            return 0
+        held_elsewhere = await self._held_elsewhere(db, events)
+
+        by_booking: Dict[Optional[str], List[dict]] = {}
+        for event in events:
+            by_booking.setdefault(event.get('booking_id'), []).append(event)
+        # Events without a booking do not depend on each other
+        sequences = [[event] for event in by_booking.pop(None, [])] + list(by_booking.values())
+        attempted = await asyncio.gather(*(self._apply_in_order(db, sequence, held_elsewhere.get(sequence[0].get('booking_id')))
+                                           for sequence in sequences))
+        return sum(attempted)
+
+    async def run(self, db: AsyncIOMotorDatabase):
+        while True:
+            try:
+                if await self.process_batch(db):
+                    continue
+            except PyMongoError as e:
+                logger.warning(f'Processing Stripe events failed: {e}')
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self, db: AsyncIOMotorDatabase) -> asyncio.Task:
+        return asyncio.create_task(self.run(db))
+
+
+stripe_events = StripeEventProcessor()
@@ -0,0 +1,68 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+from azure.core.exceptions import AzureError
+from azure.storage.blob import ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
+from fastapi import HTTPException, UploadFile, status
+
+from app.config.config import settings
+
+# Read uploads a megabyte at a time. Files up to a megabyte go up in a single put, larger ones are staged
+# as blocks so no upload holds more than a block in memory
+CHUNK_SIZE = 1024 * 1024
+
+
+async def iter_chunks(file: UploadFile, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+class BlobStorage:
+    """
+    Uploads images to Azure Blob Storage without blocking the event loop.
+
+    One async client, and with it one connection pool, is shared by every request in the process. It is
+    created on first use, inside the running loop, and closed by the app lifespan. Files are streamed to
+    Azure chunk by chunk instead of being read whole, and at most `max_concurrency` uploads run at once.
+    """
+
+    def __init__(self, connection_string: str, container_name: str, max_concurrency: int = 10):
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self.max_concurrency = max_concurrency
+        self._client: Optional[BlobServiceClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _service(self) -> BlobServiceClient:
+        if self._client is None:
+            self._client = BlobServiceClient.from_connection_string(self.connection_string,
+                                                                    max_single_put_size=CHUNK_SIZE)
+        return self._client
+
+    async def _put(self, blob_name: str, data, length: Optional[int], content_type: Optional[str]) -> str:
+        blob_client = self._service().get_blob_client(container=self.container_name, blob=blob_name)
+        try:
+            async with self._semaphore:
+                await blob_client.upload_blob(data, length=length, overwrite=True,
+                                              content_settings=ContentSettings(content_type=content_type))
+        except AzureError as azure_error:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{azure_error}")
+        return blob_client.url
+
+    async def upload(self, blob_name: str, file: UploadFile) -> str:
+        """Stream `file` to `blob_name`, replacing any existing blob, and return the blob's URL."""
+        return await self._put(blob_name, iter_chunks(file), file.size, file.content_type)
+
+    async def upload_bytes(self, blob_name: str, data: bytes, content_type: str) -> str:
+        return await self._put(blob_name, data, len(data), content_type)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+blob_storage = BlobStorage(settings.AZURE_STORAGE_CONNECTION_STRING, settings.IMAGE_CONTAINER_NAME,
+                           max_concurrency=settings.AZURE_UPLOAD_CONCURRENCY)
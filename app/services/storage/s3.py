@@ -0,0 +1,53 @@
+from typing import List, Optional
+
+import boto3
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+from app.config.config import settings
+
+
+class S3Uploads:
+    """
+    Issues presigned URLs that let clients PUT files straight into the S3 bucket.
+
+    Building a boto3 client resolves credentials and loads the endpoint model, so one client is created
+    on first use and shared by the whole process. Presigning is local to the client, it makes no request
+    to AWS. boto3 clients are thread safe.
+    """
+
+    def __init__(self, bucket_name: str, region_name: str, access_key: Optional[str] = None,
+                 secret_access_key: Optional[str] = None, endpoint_url: Optional[str] = None, expires_in: int = 60):
+        self.bucket_name = bucket_name
+        self.region_name = region_name
+        self.access_key = access_key
+        self.secret_access_key = secret_access_key
+        self.endpoint_url = endpoint_url
+        self.expires_in = expires_in
+        self._client: Optional[BaseClient] = None
+
+    def client(self) -> BaseClient:
+        if self._client is None:
+            credentials = {}
+            if self.access_key and self.secret_access_key:
+                credentials = {'aws_access_key_id': self.access_key, 'aws_secret_access_key': self.secret_access_key}
+            self._client = boto3.client('s3', region_name=self.region_name, endpoint_url=self.endpoint_url,
+                                        **credentials)
+        return self._client
+
+    def signed_put_url(self, object_name: str) -> Optional[str]:
+        """Presigned PUT URL for `object_name`, or None when it cannot be generated."""
+        try:
+            return self.client().generate_presigned_url('put_object',
+                                                        Params={'Bucket': self.bucket_name, 'Key': object_name},
+                                                        ExpiresIn=self.expires_in)
+        except ClientError as e:
+            print(f"Error generating presigned URL: {e}")
+            return None
+
+    def signed_put_urls(self, object_names: List[str]) -> List[Optional[str]]:
+        return [self.signed_put_url(object_name) for object_name in object_names]
+
+
+s3_uploads = S3Uploads(settings.AWS_BUCKET_NAME, settings.AWS_BUCKET_REGION, settings.AWS_ACCESS_KEY,
+                       settings.AWS_SECRET_ACCESS_KEY, endpoint_url=settings.AWS_ENDPOINT_URL)
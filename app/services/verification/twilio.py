@@ -0,0 +1,81 @@
+import asyncio
+from typing import Optional
+
+from aiohttp import ClientError
+from fastapi import HTTPException, status
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.rest import Client
+
+from app.config.config import settings
+from app.helpers.metrics import CallMetrics
+
+
+class TwilioVerifier:
+    """
+    Sends and checks phone verification codes through Twilio Verify without blocking the event loop.
+
+    One aiohttp session is shared by every request in the process. It is created on first use, inside the
+    running loop, and closed by the app lifespan. The Twilio client sends each request without a timeout of
+    its own, so every call is bounded here by `timeout`.
+    """
+
+    def __init__(self, account_sid: str, auth_token: str, service_sid: str, timeout: float = 10,
+                 base_url: Optional[str] = None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.service_sid = service_sid
+        self.timeout = timeout
+        self.base_url = base_url
+        self.metrics = CallMetrics()
+        self._http_client: Optional[AsyncTwilioHttpClient] = None
+        self._client: Optional[Client] = None
+
+    def _service(self):
+        if self._client is None:
+            self._http_client = AsyncTwilioHttpClient(timeout=self.timeout)
+            self._client = Client(self.account_sid, self.auth_token, http_client=self._http_client)
+            if self.base_url:
+                self._client.verify.base_url = self.base_url
+        return self._client.verify.v2.services(self.service_sid)
+
+    async def send_code(self, phone_number: str) -> str:
+        try:
+            async with self.metrics.track('verifications.create'):
+                verification = await asyncio.wait_for(
+                    self._service().verifications.create_async(to=phone_number, channel='sms'), self.timeout)
+        except (asyncio.TimeoutError, ClientError):
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail='Verification service unavailable. Please try again.')
+        return verification.status
+
+    async def check_code(self, phone_number: str, code: str) -> str:
+        try:
+            async with self.metrics.track('verification_checks.create'):
+                verification_check = await asyncio.wait_for(
+                    self._service().verification_checks.create_async(to=phone_number, code=code), self.timeout)
+        except TwilioRestException as e:
+            # Twilio answers 404 once the verification expired, was approved or ran out of attempts
+            if e.status == status.HTTP_404_NOT_FOUND:
+                return 'expired'
+            raise
+        except (asyncio.TimeoutError, ClientError):
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail='Verification service unavailable. Please try again.')
+        return verification_check.status
+
+    def stats(self) -> dict:
+        return self.metrics.stats()
+
+    async def close(self):
+        if self._http_client is not None:
+            await self._http_client.close()
+
+
+verifier = TwilioVerifier(settings.TWILIO_SID, settings.TWILIO_TOKEN, settings.TWILIO_VERIFICATION_SID,
+                          timeout=settings.TWILIO_TIMEOUT_SECONDS, base_url=settings.TWILIO_VERIFY_BASE_URL)
+
+
+def get_verifier() -> TwilioVerifier:
+    """Dependency for routes that verify phone numbers, tests can override it."""
+    return verifier
@@ -0,0 +1,187 @@
+"""
+Micro-benchmarks for the Auth0.get_user hot path.
+
+Everything runs offline: a local RSA keypair stands in for the tenant's signing key and its JWKS is
+loaded straight into the verifier. Run with `pytest tests/benchmarks/test_auth_benchmark.py -s` to see
+the numbers, or `python -m tests.benchmarks.test_auth_benchmark` for the report alone.
+Set AUTH_BENCH_ITERATIONS to change the sample size.
+"""
+import asyncio
+import base64
+import os
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.security import HTTPAuthorizationCredentials, SecurityScopes
+from jose import jwt
+
+from app.auth.auth import Auth0, Auth0UnauthenticatedException
+
+ITERATIONS = int(os.getenv('AUTH_BENCH_ITERATIONS', '200'))
+
+DOMAIN = 'bench.example.invalid'
+AUDIENCE = 'https://api.bench.example.invalid'
+KID = 'bench-key'
+SCOPE = 'read:bookings'
+
+
+def _b64_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def generate_signing_key():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption())
+    numbers = private_key.public_key().public_numbers()
+    jwks = {'keys': [{'kid': KID, 'kty': 'RSA', 'use': 'sig',
+                      'n': _b64_uint(numbers.n), 'e': _b64_uint(numbers.e)}]}
+    return private_pem, jwks
+
+
+def mint_token(private_pem: bytes, expires_in: int = 600, **claims) -> str:
+    payload = {
+        'sub': 'auth0|bench',
+        'aud': AUDIENCE,
+        'iss': f'https://{DOMAIN}/',
+        'iat': int(time.time()),
+        'exp': int(time.time()) + expires_in,
+        **claims,
+    }
+    return jwt.encode(payload, private_pem, algorithm='RS256', headers={'kid': KID})
+
+
+def tamper(token: str) -> str:
+    # Flip a character in the middle of the signature so the token parses but fails verification.
+    # The last character can carry only padding bits, changing it may leave the signature intact.
+    header, payload, signature = token.split('.')
+    middle = len(signature) // 2
+    flipped = 'A' if signature[middle] != 'A' else 'B'
+    return '.'.join([header, payload, signature[:middle] + flipped + signature[middle + 1:]])
+
+
+def make_verifier(jwks: Dict) -> Auth0:
+    auth = Auth0(domain=DOMAIN, api_audience=AUDIENCE)
+    auth._set_jwks(jwks)
+    return auth
+
+
+def bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme='Bearer', credentials=token)
+
+
+async def _call(auth: Auth0, token: str, scopes: List[str]):
+    try:
+        return await auth.get_user(SecurityScopes(scopes=scopes), bearer(token))
+    except Auth0UnauthenticatedException:
+        return None
+
+
+def measure(auth: Auth0, token: str, scopes: List[str] = [], before_each: Callable = None,
+            iterations: int = ITERATIONS) -> Dict:
+    async def run():
+        samples = []
+        for _ in range(iterations):
+            if before_each:
+                before_each()
+            start = time.perf_counter()
+            await _call(auth, token, scopes)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    samples = asyncio.run(run())
+    samples.sort()
+    total = sum(samples)
+    return {
+        'iterations': iterations,
+        'ops_per_sec': iterations / total if total else float('inf'),
+        'mean_us': statistics.mean(samples) * 1e6,
+        'p50_us': samples[len(samples) // 2] * 1e6,
+        'p95_us': samples[int(len(samples) * 0.95) - 1] * 1e6,
+    }
+
+
+def report(name: str, result: Dict):
+    print(f"{name:<14} {result['ops_per_sec']:>12,.0f} ops/s "
+          f"mean {result['mean_us']:>9,.1f}us  p50 {result['p50_us']:>9,.1f}us  p95 {result['p95_us']:>9,.1f}us")
+
+
+@pytest.fixture(scope='module')
+def signing_key():
+    return generate_signing_key()
+
+
+def test_verify_cold(signing_key):
+    private_pem, jwks = signing_key
+    auth = make_verifier(jwks)
+    token = mint_token(private_pem)
+
+    result = measure(auth, token, before_each=auth.token_cache.clear)
+    report('cold', result)
+    assert auth.token_cache.stats()['hits'] == 0
+
+
+def test_verify_warm_cached(signing_key):
+    private_pem, jwks = signing_key
+    auth = make_verifier(jwks)
+    token = mint_token(private_pem)
+
+    cold = measure(auth, token, before_each=auth.token_cache.clear)
+    warm = measure(auth, token)
+    report('warm-cached', warm)
+
+    assert auth.token_cache.stats()['hits'] >= ITERATIONS - 1
+    # A cache hit is a dict lookup, it must be far cheaper than an RS256 verification
+    assert warm['mean_us'] * 5 < cold['mean_us']
+
+
+def test_verify_with_scopes(signing_key):
+    private_pem, jwks = signing_key
+    auth = make_verifier(jwks)
+    token = mint_token(private_pem, scope=f'openid {SCOPE}')
+
+    cold = measure(auth, token, scopes=[SCOPE], before_each=auth.token_cache.clear)
+    warm = measure(auth, token, scopes=[SCOPE])
+    report('scoped-cold', cold)
+    report('scoped-warm', warm)
+
+    user = asyncio.run(_call(auth, token, [SCOPE]))
+    assert user is not None and user.id == 'auth0|bench'
+
+
+def test_reject_malformed(signing_key):
+    private_pem, jwks = signing_key
+    auth = make_verifier(jwks)
+    token = tamper(mint_token(private_pem))
+
+    result = measure(auth, token)
+    report('malformed', result)
+
+    assert asyncio.run(_call(auth, token, [])) is None
+    assert auth.token_cache.stats()['size'] == 0
+
+
+def test_reject_expired(signing_key):
+    private_pem, jwks = signing_key
+    auth = make_verifier(jwks)
+    token = mint_token(private_pem, expires_in=-60)
+
+    result = measure(auth, token)
+    report('expired', result)
+
+    assert asyncio.run(_call(auth, token, [])) is None
+    assert auth.token_cache.stats()['size'] == 0
+
+
+if __name__ == '__main__':
+    key = generate_signing_key()
+    for bench in (test_verify_cold, test_verify_warm_cached, test_verify_with_scopes,
+                  test_reject_malformed, test_reject_expired):
+        bench(key)
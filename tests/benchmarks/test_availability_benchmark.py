@@ -0,0 +1,140 @@
+"""
+Benchmarks for the availability engine in app.services.bookings.availability.
+
+Slot computation is pure CPU once the bookings are loaded, so these run offline against synthetic
+schedules and booking histories. Run with `pytest tests/benchmarks/test_availability_benchmark.py -s`.
+"""
+import random
+import time as clock
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List
+
+import pytest
+
+from app.schema.object_models.v0.schedule_model import Schedule
+from app.services.bookings.availability import (SLOT_INTERVAL, Interval, combine, compute_start_times,
+                                                operating_window, day_schedule_for)
+from app.services.bookings.occupancy import compute_start_times_bitmap
+
+REF_DATE = date(2030, 1, 7)
+DURATIONS = [30, 45, 60, 90]
+
+
+def make_schedule(blocked_dates: List[Dict] = []) -> Schedule:
+    working_day = {
+        'is_available': True,
+        'operating_hours': {'start_time': '09:00:00Z', 'end_time': '18:00:00Z'},
+        'blocked_hours': [{'start_time': '12:00:00Z', 'end_time': '13:00:00Z'}],
+    }
+    day_off = {'is_available': False,
+               'operating_hours': {'start_time': None, 'end_time': None}, 'blocked_hours': []}
+    days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    return Schedule.model_validate({
+        'daily_schedule': {day: (day_off if day == 'sunday' else working_day) for day in days},
+        'blocked_dates': blocked_dates,
+    })
+
+
+def make_bookings(count: int, start: date, days: int, seed: int = 7) -> List[Interval]:
+    """`count` non-cancelled bookings spread over `days` days of business hours starting at `start`."""
+    rng = random.Random(seed)
+    bookings = []
+    for _ in range(count):
+        day = start + timedelta(days=rng.randrange(days))
+        begin = datetime.combine(day, time(9), tzinfo=timezone.utc) + \
+            timedelta(minutes=15 * rng.randrange(32))
+        bookings.append((begin, begin + timedelta(minutes=rng.choice(DURATIONS))))
+    return bookings
+
+
+def reference_start_times(schedule: Schedule, duration_minutes: int, ref_date: date, booked: List[Interval],
+                          days: int = 7) -> Dict[date, List[time]]:
+    """The original slot-by-slot, booking-by-booking algorithm, kept as an oracle."""
+    duration = timedelta(minutes=duration_minutes)
+    blocked_dates = [(b.start.replace(tzinfo=b.start.tzinfo or timezone.utc),
+                      b.end.replace(tzinfo=b.end.tzinfo or timezone.utc)) for b in schedule.blocked_dates]
+    result = {}
+    for i in range(days):
+        day = ref_date + timedelta(days=i)
+        result[day] = []
+        window = operating_window(schedule, day)
+        if window is None:
+            continue
+        blocked = [(combine(day, b.start_time), combine(day, b.end_time))
+                   for b in day_schedule_for(schedule, day).blocked_hours]
+        current, end = window
+        while current + duration <= end:
+            slot_end = current + duration
+            if not any(start < slot_end and current < stop for start, stop in booked + blocked + blocked_dates):
+                result[day].append(current.timetz())
+            current += SLOT_INTERVAL
+    return result
+
+
+def timed(fn, *args, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = clock.perf_counter()
+        fn(*args)
+        best = min(best, clock.perf_counter() - start)
+    return best
+
+
+@pytest.mark.parametrize('duration', DURATIONS)
+def test_matches_reference(duration):
+    blocked = [{'start': '2030-01-09T15:00:00Z', 'end': '2030-01-10T11:00:00Z'}]
+    schedule = make_schedule(blocked)
+    booked = make_bookings(60, REF_DATE - timedelta(days=1), 9, seed=duration)
+
+    assert compute_start_times(schedule, duration, REF_DATE, booked) == \
+        reference_start_times(schedule, duration, REF_DATE, booked)
+
+
+def test_blocked_hours_reject_overlapping_slots():
+    schedule = make_schedule()
+    slots = compute_start_times(schedule, 90, REF_DATE, [])[REF_DATE]
+    starts = [slot.replace(tzinfo=None) for slot in slots]
+
+    assert time(11, 0) not in starts  # 11:00-12:30 runs into the lunch block
+    assert time(10, 30) in starts and time(13, 0) in starts
+
+
+def test_availability_10k_bookings():
+    schedule = make_schedule()
+    # Worst case: the whole history is handed to the engine instead of just the 7-day window
+    booked = make_bookings(10_000, REF_DATE - timedelta(days=365), 365 + 7)
+
+    engine = timed(compute_start_times, schedule, 60, REF_DATE, booked)
+    reference = timed(reference_start_times, schedule,
+                      60, REF_DATE, booked, repeat=1)
+    print(f"\n10k bookings, 7 days: engine {engine * 1e3:,.1f}ms, "
+          f"slot-by-booking reference {reference * 1e3:,.1f}ms")
+
+    assert engine * 10 < reference
+
+
+@pytest.mark.parametrize('duration', DURATIONS)
+def test_bitmap_matches_interval_engine(duration):
+    blocked = [{'start': '2030-02-03T15:00:00Z', 'end': '2030-02-05T11:00:00Z'}]
+    schedule = make_schedule(blocked)
+    booked = make_bookings(1_500, REF_DATE - timedelta(days=1), 92, seed=duration)
+
+    assert compute_start_times_bitmap(schedule, duration, REF_DATE, booked, 90) == \
+        compute_start_times(schedule, duration, REF_DATE, booked, 90)
+
+
+def test_bitmap_90_days():
+    schedule = make_schedule()
+    # ~2 years of history at the same density, the 90 day window holds about 1.2k bookings
+    booked_week = make_bookings(100, REF_DATE, 7)
+    booked_quarter = make_bookings(1_250, REF_DATE, 90)
+
+    week = timed(compute_start_times, schedule, 60, REF_DATE, booked_week)
+    quarter = timed(compute_start_times_bitmap, schedule,
+                    60, REF_DATE, booked_quarter, 90)
+
+    # Per day, the 90 day bitmap should cost about what the 7 day interval engine does, 3x leaves room for noise
+    assert quarter / 90 < 3 * week / 7, f'90 days took {quarter * 1e3:,.2f}ms, 7 days {week * 1e3:,.2f}ms'
+    slots = compute_start_times_bitmap(schedule, 60, REF_DATE, booked_quarter, 90)
+    first_week = compute_start_times(schedule, 60, REF_DATE, booked_quarter)
+    assert {day: slots[day] for day in first_week} == first_week
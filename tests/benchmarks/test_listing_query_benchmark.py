@@ -0,0 +1,137 @@
+"""
+Round trips and latency of the service and merchant listings against a seeded database.
+
+Unlike the other benchmarks this one needs MongoDB: it seeds 10k services into a scratch database next to
+the integration test database (TEST_DB_URL) and drops it afterwards. Every command the app sends is counted
+with a pymongo CommandListener. Run with `pytest tests/benchmarks/test_listing_query_benchmark.py -s`.
+"""
+import time
+from typing import List
+
+import certifi
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import Response
+from pymongo import monitoring
+from pymongo.server_api import ServerApi
+
+from app.config.database.indexes import REQUIRED_INDEXES, reconcile_indexes
+from app.helpers.pagination import NEXT_CURSOR_HEADER
+from app.routers.v0.merchant import get_merchants
+from app.routers.v0.services import get_all_services, get_owner_details
+from tests.setup.config_tests import env
+
+SERVICES = 10_000
+MERCHANTS = 500
+PER_PAGE = 20
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands: List[str] = []
+
+    def started(self, event):
+        self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+@pytest.fixture(scope="module")
+async def seeded():
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(env.test_db_url, tlsCAFile=certifi.where(), server_api=ServerApi('1'),
+                                tz_aware=True, event_listeners=[counter])
+    db = client[f'{env.test_db_name}_listing_benchmark']
+    await client.drop_database(db.name)
+    await reconcile_indexes(db, [spec for spec in REQUIRED_INDEXES
+                                 if spec.collection in ('services', 'merchants', 'usernames')])
+    location = {'country': 'Canada', 'city': 'Montreal'}
+    await db['usernames'].insert_many([{'_id': f'username-{i}', 'username': f'merchant{i}', 'user_id': f'user-{i}'}
+                                       for i in range(MERCHANTS)])
+    await db['merchants'].insert_many([{'_id': f'merchant-{i}', 'user_id': f'user-{i}', 'username_id': f'username-{i}',
+                                        'name': f'Merchant {i}', 'profession': 'Barber', 'location': location,
+                                        'public': True} for i in range(MERCHANTS)])
+    await db['services'].insert_many([{'_id': f'service-{i:05d}', 'owner_id': f'user-{i % MERCHANTS}',
+                                       'service_name': f'Service {i}', 'duration_minutes': 60, 'out_call': False,
+                                       'description': 'Cut and style', 'images': [],
+                                       'price': {'amount': 50, 'currency': 'CAD'}} for i in range(SERVICES)])
+    yield db, counter
+    await client.drop_database(db.name)
+    client.close()
+
+
+async def per_service_owner_lookups(db, services):
+    """The previous implementation, two finds per service, kept as the baseline."""
+    for service in services:
+        service['owner'] = await get_owner_details(service.get('owner_id'), db)
+    return services
+
+
+@pytest.mark.anyio
+async def test_page_of_services_is_one_round_trip(seeded):
+    db, counter = seeded
+    timings = []
+    for page in (1, 50, SERVICES // PER_PAGE):
+        counter.commands.clear()
+        start = time.perf_counter()
+        services = await get_all_services(Response(), page=page, per_page=PER_PAGE, db=db)
+        timings.append(time.perf_counter() - start)
+
+        assert counter.commands == ['aggregate']
+        assert len(services) == PER_PAGE
+        assert all(service['owner']['username'].startswith('merchant') for service in services)
+    print(f'\naggregation: 1 round trip per page of {PER_PAGE}, '
+          f'{", ".join(f"{t * 1000:.1f}ms" for t in timings)} for pages 1, 50 and the last')
+
+
+@pytest.mark.anyio
+async def test_baseline_costs_two_round_trips_per_service(seeded):
+    db, counter = seeded
+    services = await db['services'].find().sort('_id', 1).limit(PER_PAGE).to_list(length=None)
+
+    counter.commands.clear()
+    start = time.perf_counter()
+    await per_service_owner_lookups(db, services)
+    elapsed = time.perf_counter() - start
+
+    assert len(counter.commands) == 2 * PER_PAGE
+    print(f'\nper-service lookups: {len(counter.commands) + 1} round trips for {PER_PAGE} services, '
+          f'{elapsed * 1000:.1f}ms; unpaginated over {SERVICES} services that is {2 * SERVICES + 1} round trips')
+
+
+@pytest.mark.anyio
+async def test_merchant_directory_page_is_one_round_trip(seeded):
+    db, counter = seeded
+    for per_page in (10, 100):
+        counter.commands.clear()
+        start = time.perf_counter()
+        cards = await get_merchants(Response(), page=2, per_page=per_page, db=db)
+        elapsed = time.perf_counter() - start
+
+        assert counter.commands == ['aggregate']
+        assert len(cards) == per_page
+        assert set(cards[0]) == {'_id', 'username', 'header_name', 'location', 'profession'}
+        print(f'\nmerchant directory: 1 round trip for {per_page} cards, {elapsed * 1000:.1f}ms')
+
+
+@pytest.mark.anyio
+async def test_cursor_pages_walk_every_service_once(seeded):
+    db, _ = seeded
+    seen, cursor, timings = [], None, []
+    while True:
+        response = Response()
+        start = time.perf_counter()
+        services = await get_all_services(response, per_page=100, cursor=cursor, db=db)
+        timings.append(time.perf_counter() - start)
+        seen.extend(service['_id'] for service in services)
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+
+    assert len(seen) == len(set(seen)) == SERVICES
+    assert seen == sorted(seen)
+    print(f'\ncursor pages of 100: first {timings[0] * 1000:.1f}ms, last {timings[-2] * 1000:.1f}ms')
@@ -1,6 +1,15 @@
 import pytest
 
+from tests.setup.fake_stripe import FakeStripe
+
 
 @pytest.fixture(scope="module")
 def anyio_backend():
     return 'asyncio'
+
+
+@pytest.fixture(scope="module")
+def fake_stripe():
+    server = FakeStripe().start()
+    yield server
+    server.stop()
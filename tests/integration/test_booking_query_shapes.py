@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.server_api import ServerApi
+from app.config.database.indexes import REQUIRED_INDEXES, reconcile_indexes
+from app.helpers.pagination import encode_cursor, paginated_query
+from app.routers.v0 import bookings
+from app.services.bookings import availability
+from tests.setup.config_tests import env
+from tests.setup.query_plans import assert_uses_index, winning_plan_stages
+
+import certifi
+ca = certifi.where()
+
+MERCHANT_ID = 'query-shape-merchant'
+CUSTOMER_ID = 'auth0|query-shape-customer'
+
+
+@pytest.fixture(scope="module")
+async def test_database():
+    client = AsyncIOMotorClient(
+        env.test_db_url, tlsCAFile=ca, server_api=ServerApi('1'))
+    db = client[env.test_db_name]
+    await reconcile_indexes(db, [spec for spec in REQUIRED_INDEXES if spec.collection == 'bookings'])
+    yield db
+    client.close()
+
+
+@pytest.mark.anyio
+async def test_merchant_bookings_query_uses_index(test_database):
+    cursor = test_database['bookings'].find(
+        bookings.merchant_bookings_query(MERCHANT_ID)).skip(10).limit(10)
+    assert_uses_index(await winning_plan_stages(cursor))
+
+
+@pytest.mark.anyio
+async def test_customer_bookings_query_uses_index(test_database):
+    cursor = test_database['bookings'].find(
+        bookings.customer_bookings_query(CUSTOMER_ID)).skip(10).limit(10)
+    assert_uses_index(await winning_plan_stages(cursor))
+
+
+@pytest.mark.anyio
+async def test_overlap_query_uses_index(test_database):
+    start_time = datetime(2030, 1, 1, 10, tzinfo=timezone.utc)
+    query = availability.overlapping_bookings_query(
+        MERCHANT_ID, start_time, start_time + timedelta(minutes=45))
+    cursor = test_database['bookings'].find(query, projection={'_id': 1}).limit(1)
+    assert_uses_index(await winning_plan_stages(cursor))
+
+
+@pytest.mark.anyio
+async def test_batch_availability_query_uses_index(test_database):
+    window_start = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    query = availability.overlapping_bookings_query(
+        [MERCHANT_ID, 'query-shape-merchant-2'], window_start, window_start + timedelta(days=9))
+    cursor = test_database['bookings'].find(query, projection={'_id': 0, 'merchant.id': 1, 'appointment_date': 1})
+    assert_uses_index(await winning_plan_stages(cursor))
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('query', [bookings.merchant_bookings_query(MERCHANT_ID),
+                                   bookings.customer_bookings_query(CUSTOMER_ID)])
+async def test_booking_history_cursor_page_is_an_index_range(test_database, query):
+    last = {'_id': 'booking-50', 'appointment_date': {'start_time': datetime(2030, 1, 1, 10, tzinfo=timezone.utc)}}
+    cursor = encode_cursor(last, bookings.BOOKINGS_SORT)
+    page = test_database['bookings'].find(paginated_query(query, bookings.BOOKINGS_SORT, cursor)) \
+        .sort(bookings.BOOKINGS_SORT).limit(10)
+
+    stages = await winning_plan_stages(page)
+    assert_uses_index(stages)
+    # The index yields the page in order, no in-memory sort of the whole history
+    assert 'SORT' not in stages, stages
@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.server_api import ServerApi
+from app.config.database.indexes import REQUIRED_INDEXES, reconcile_indexes
+from app.routers.v0.payments.stripe import get_checkout_session
+from app.services.payments import stripe as payments
+from app.services.payments.stripe import StripeGateway
+from tests.setup.config_tests import env
+
+import certifi
+ca = certifi.where()
+
+BOOKING_ID = 'checkout-sessions-booking'
+MERCHANT_ID = 'checkout-sessions-merchant'
+START_TIME = datetime(2030, 1, 7, 10, tzinfo=timezone.utc)
+CURRENCY = {'code': 'CAD', 'symbol': 'CA$', 'name': 'Canadian Dollar'}
+
+
+@pytest.fixture(scope="module")
+async def test_database():
+    client = AsyncIOMotorClient(
+        env.test_db_url, tlsCAFile=ca, server_api=ServerApi('1'), tz_aware=True)
+    db = client[env.test_db_name]
+    await reconcile_indexes(db, [spec for spec in REQUIRED_INDEXES if spec.collection == 'booking_slots'])
+    yield db
+    client.close()
+
+
+@pytest.fixture
+async def gateway(fake_stripe, monkeypatch):
+    gateway = StripeGateway('sk_test_fake', timeout=5, max_network_retries=0, api_base=fake_stripe.url)
+    monkeypatch.setattr(payments, 'stripe_gateway', gateway)
+    yield gateway
+    await gateway.close()
+
+
+@pytest.fixture(scope="function")
+async def booking(test_database):
+    async def clean():
+        await test_database['bookings'].delete_many({'_id': BOOKING_ID})
+        await test_database['booking_slots'].delete_many({'merchant_id': MERCHANT_ID})
+    await clean()
+    now = datetime.now(timezone.utc)
+    await test_database['bookings'].insert_one({
+        '_id': BOOKING_ID,
+        'customer': {'id': 'checkout-sessions-customer', 'name': 'Customer'},
+        'merchant': {'id': MERCHANT_ID, 'name': 'Merchant'},
+        'service': {'_id': 'checkout-sessions-service', 'service_name': 'Cut', 'duration_minutes': 60, 'out_call': False,
+                    'description': 'Cut and style', 'images': [], 'price': {'amount': '50', 'currency': CURRENCY}},
+        'appointment_date': {'start_time': START_TIME, 'end_time': START_TIME + timedelta(hours=1)},
+        'appointment_location': {'country': {'name': 'Canada', 'code': 'CA', 'currency': CURRENCY},
+                                 'city': 'Montreal', 'street_address': '1 Main St', 'coordinates': None},
+        'booking_status': 'pending',
+        'payment_status': 'pending',
+        'hold_expires_at': now + timedelta(minutes=5),
+        # About to expire, so reopening checkout needs a new session
+        'checkout_session': {'id': 'cs_test_expiring', 'client_secret': 'cs_test_expiring_secret',
+                             'expires_at': now + timedelta(seconds=30)},
+    })
+    yield BOOKING_ID
+    await clean()
+
+
+@pytest.mark.anyio
+async def test_reopened_checkout_outlasts_the_stripe_minimum(test_database, gateway, fake_stripe, booking):
+    called_at = time.time()
+    response = await get_checkout_session(booking, SimpleNamespace(email='customer@example.com'), test_database)
+
+    # Stripe refuses sessions that expire less than 30 minutes after it creates them
+    assert response['client_secret'] is not None
+    stored = await test_database['bookings'].find_one({'_id': booking})
+    assert stored['checkout_session']['id'] != 'cs_test_expiring'
+    assert fake_stripe.sessions[stored['checkout_session']['id']]['expires_at'] >= called_at + 30 * 60
+    assert stored['hold_expires_at'] > stored['checkout_session']['expires_at']
@@ -0,0 +1,200 @@
+import asyncio
+import io
+import time
+from types import SimpleNamespace
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import BackgroundTasks, UploadFile
+from PIL import Image
+from pymongo.server_api import ServerApi
+from starlette.datastructures import Headers
+from app.config.database.indexes import REQUIRED_INDEXES, reconcile_indexes
+from app.routers.v0.uploads import upload_profile_image
+from app.services.media.derivatives import MEDIA, ImageDerivatives, refresh_service_variants
+from app.services.media.library import store_image
+from app.services.storage.azure_blob import BlobStorage
+from tests.setup.config_tests import env
+from tests.setup.fake_blob_storage import FakeBlobStorage
+
+import certifi
+ca = certifi.where()
+
+MERCHANT_ID = 'image-variants-merchant'
+USER_ID = 'auth0|image-variants-merchant'
+CONTAINER = 'images'
+SERVICE_ID = 'image-variants-service'
+
+
+@pytest.fixture(scope="module")
+async def test_database():
+    client = AsyncIOMotorClient(
+        env.test_db_url, tlsCAFile=ca, server_api=ServerApi('1'), tz_aware=True)
+    db = client[env.test_db_name]
+    await reconcile_indexes(db, [spec for spec in REQUIRED_INDEXES if spec.collection == 'media'])
+    yield db
+    client.close()
+
+
+@pytest.fixture(scope="module")
+def blob_server():
+    server = FakeBlobStorage().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+async def storage(blob_server):
+    storage = BlobStorage(blob_server.connection_string, CONTAINER)
+    yield storage
+    await storage.close()
+
+
+@pytest.fixture(scope="module")
+async def derivatives(storage):
+    derivatives = ImageDerivatives(storage, max_workers=1)
+    yield derivatives
+    derivatives.shutdown()
+
+
+@pytest.fixture(scope="function")
+async def merchant(test_database):
+    async def clean():
+        await test_database[MEDIA].delete_many({'merchant_id': MERCHANT_ID})
+        await test_database['services'].delete_many({'_id': SERVICE_ID})
+        await test_database['merchants'].delete_many({'_id': MERCHANT_ID})
+    await clean()
+    await test_database['merchants'].insert_one({'_id': MERCHANT_ID, 'user_id': USER_ID})
+    yield MERCHANT_ID
+    await clean()
+
+
+def photo() -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', (1600, 1200), 'red').save(output, format='JPEG')
+    return output.getvalue()
+
+
+@pytest.mark.anyio
+async def test_service_saved_before_variants_are_ready_gets_them(test_database, derivatives, merchant):
+    url = 'https://example.blob.core.windows.net/images/merchant/services/photo.jpg'
+    await test_database['services'].insert_one({'_id': SERVICE_ID, 'owner_id': USER_ID, 'images': [url]})
+
+    await derivatives.process_image(test_database, merchant, 'merchant/services/photo.jpg', url, photo())
+
+    service = await test_database['services'].find_one({'_id': SERVICE_ID})
+    assert service['image_variants'][0]['original'] == url
+    assert service['image_variants'][0]['variants']['thumbnail'].endswith('merchant/services/photo_thumbnail.webp')
+
+
+@pytest.mark.anyio
+async def test_service_saved_after_variants_are_ready_gets_them(test_database, derivatives, merchant):
+    ready = 'https://example.blob.core.windows.net/images/merchant/services/ready.jpg'
+    pending = 'https://example.blob.core.windows.net/images/merchant/services/pending.jpg'
+    await derivatives.process_image(test_database, merchant, 'merchant/services/ready.jpg', ready, photo())
+    await test_database['services'].insert_one({'_id': SERVICE_ID, 'owner_id': USER_ID, 'images': [pending, ready]})
+
+    await refresh_service_variants(test_database, {'_id': SERVICE_ID})
+
+    service = await test_database['services'].find_one({'_id': SERVICE_ID})
+    assert [image['original'] for image in service['image_variants']] == [ready]
+
+
+@pytest.mark.anyio
+async def test_replaced_profile_picture_keeps_the_newer_variants(test_database, derivatives, merchant):
+    old = 'https://example.blob.core.windows.net/images/merchant/profile/old.jpg'
+    new = 'https://example.blob.core.windows.net/images/merchant/profile/new.jpg'
+    await test_database['merchants'].update_one({'_id': merchant}, {'$set': {'profile_picture_url': new}})
+
+    await derivatives.process_image(test_database, merchant, 'merchant/profile/old.jpg', old, photo())
+    assert 'profile_picture_variants' not in await test_database['merchants'].find_one({'_id': merchant})
+
+    await derivatives.process_image(test_database, merchant, 'merchant/profile/new.jpg', new, photo())
+    stored = await test_database['merchants'].find_one({'_id': merchant})
+    assert stored['profile_picture_variants']['w1280'].endswith('merchant/profile/new_w1280.webp')
+
+
+def upload(content: bytes, filename: str = 'Photo.JPG') -> UploadFile:
+    return UploadFile(io.BytesIO(content), size=len(content), filename=filename,
+                      headers=Headers({'content-type': 'image/jpeg'}))
+
+
+@pytest.mark.anyio
+async def test_reuploaded_file_is_not_transferred_again(test_database, storage, blob_server, merchant):
+    content = photo()
+    first = await store_image(test_database, storage, merchant, f'{merchant}/services', upload(content))
+    blob_server.blobs.clear()
+
+    again = await store_image(test_database, storage, merchant, f'{merchant}/profile', upload(content, 'copy.jpg'))
+
+    assert first.uploaded and not again.uploaded
+    assert again.url == first.url
+    assert first.blob_name.startswith(f'{merchant}/services/') and first.blob_name.endswith('.jpg')
+    assert blob_server.blobs == {}
+    assert await test_database[MEDIA].count_documents({'merchant_id': merchant}) == 1
+
+
+@pytest.mark.anyio
+async def test_reuploaded_profile_picture_is_still_a_success(test_database, storage, derivatives, merchant):
+    user_profile = SimpleNamespace(id=USER_ID)
+    content = photo()
+    first = await upload_profile_image(BackgroundTasks(), user_profile, upload(content), test_database, storage, derivatives)
+
+    # Same file, same URL: the merchant document does not change
+    again = await upload_profile_image(BackgroundTasks(), user_profile, upload(content), test_database, storage, derivatives)
+
+    assert again['URL'] == first['URL']
+    assert (await test_database['merchants'].find_one({'_id': merchant}))['profile_picture_url'] == first['URL']
+
+
+@pytest.mark.anyio
+async def test_same_file_uploaded_concurrently_is_stored_once(test_database, storage, blob_server, merchant):
+    content = photo()
+
+    stored = await asyncio.gather(*(store_image(test_database, storage, merchant, f'{merchant}/services', upload(content))
+                                    for _ in range(5)))
+
+    assert len({image.url for image in stored}) == 1
+    assert await test_database[MEDIA].count_documents({'merchant_id': merchant}) == 1
+    assert blob_server.blobs[f'{CONTAINER}/{stored[0].blob_name}'] == content
+
+
+@pytest.mark.anyio
+async def test_other_merchants_do_not_share_uploads(test_database, storage, merchant):
+    content = photo()
+    mine = await store_image(test_database, storage, merchant, f'{merchant}/services', upload(content))
+    theirs = await store_image(test_database, storage, f'{merchant}-other', f'{merchant}-other/services', upload(content))
+    await test_database[MEDIA].delete_many({'merchant_id': f'{merchant}-other'})
+
+    assert theirs.uploaded and theirs.url != mine.url
+
+
+@pytest.mark.anyio
+async def test_images_upload_concurrently(test_database, storage, blob_server, merchant):
+    blob_server.delay = 0.2
+    try:
+        start = time.perf_counter()
+        stored = await asyncio.gather(*(store_image(test_database, storage, merchant, f'{merchant}/services',
+                                                    upload(b'x' * (i + 1), f'{i}.jpg')) for i in range(10)))
+        elapsed = time.perf_counter() - start
+    finally:
+        blob_server.delay = 0
+
+    assert all(image.uploaded for image in stored)
+    assert len({image.url for image in stored}) == 10
+    assert elapsed < 10 * 0.2 / 4, f'10 uploads took {elapsed:.2f}s'
+
+
+@pytest.mark.anyio
+async def test_upload_concurrency_is_bounded(test_database, blob_server, merchant):
+    storage = BlobStorage(blob_server.connection_string, CONTAINER, max_concurrency=2)
+    blob_server.delay = 0.1
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(store_image(test_database, storage, merchant, f'{merchant}/services',
+                                           upload(b'bounded' * (i + 1), f'{i}.jpg')) for i in range(6)))
+        elapsed = time.perf_counter() - start
+    finally:
+        blob_server.delay = 0
+        await storage.close()
+
+    assert elapsed >= 3 * 0.1
@@ -0,0 +1,62 @@
+import pytest
+from fastapi import Response
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.server_api import ServerApi
+from app.config.database.indexes import REQUIRED_INDEXES, reconcile_indexes
+from app.helpers.pagination import NEXT_CURSOR_HEADER
+from app.routers.v0.merchant import get_merchants
+from app.routers.v0.services import get_all_services
+from tests.setup.config_tests import env
+
+import certifi
+ca = certifi.where()
+
+MERCHANTS = 6
+# Rows the listings cannot join, in the middle of the second page of 2
+ORPHAN_SERVICE = 'service-2'
+ORPHAN_MERCHANT = 'merchant-3'
+
+
+@pytest.fixture(scope="module")
+async def test_database():
+    client = AsyncIOMotorClient(
+        env.test_db_url, tlsCAFile=ca, server_api=ServerApi('1'))
+    db = client[f'{env.test_db_name}_listing_pagination']
+    await client.drop_database(db.name)
+    await reconcile_indexes(db, [spec for spec in REQUIRED_INDEXES
+                                 if spec.collection in ('services', 'merchants', 'usernames')])
+    location = {'country': 'Canada', 'city': 'Montreal'}
+    await db['usernames'].insert_many([{'_id': f'username-{i}', 'username': f'merchant{i}', 'user_id': f'user-{i}'}
+                                       for i in range(MERCHANTS) if f'merchant-{i}' != ORPHAN_MERCHANT])
+    await db['merchants'].insert_many([{'_id': f'merchant-{i}', 'user_id': f'user-{i}', 'username_id': f'username-{i}',
+                                        'name': f'Merchant {i}', 'location': location, 'public': True}
+                                       for i in range(MERCHANTS)])
+    await db['services'].insert_many([{'_id': f'service-{i}', 'owner_id': 'user-missing' if f'service-{i}' == ORPHAN_SERVICE else 'user-0',
+                                       'service_name': f'Service {i}', 'duration_minutes': 60, 'out_call': False,
+                                       'description': 'Cut and style', 'images': [],
+                                       'price': {'amount': 50, 'currency': 'CAD'}} for i in range(MERCHANTS)])
+    yield db
+    await client.drop_database(db.name)
+    client.close()
+
+
+async def walk(listing, db) -> list:
+    seen, cursor = [], None
+    while True:
+        response = Response()
+        seen.extend(item['_id'] for item in await listing(response, per_page=2, cursor=cursor, db=db))
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.anyio
+async def test_service_without_merchant_does_not_end_the_listing(test_database):
+    seen = await walk(get_all_services, test_database)
+    assert seen == [f'service-{i}' for i in range(MERCHANTS) if f'service-{i}' != ORPHAN_SERVICE]
+
+
+@pytest.mark.anyio
+async def test_merchant_without_username_does_not_end_the_directory(test_database):
+    seen = await walk(get_merchants, test_database)
+    assert seen == [f'merchant-{i}' for i in range(MERCHANTS) if f'merchant-{i}' != ORPHAN_MERCHANT]
@@ -0,0 +1,105 @@
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.server_api import ServerApi
+from app.config.database.indexes import REQUIRED_INDEXES, reconcile_indexes
+from app.helpers.pagination import paginated_query
+from app.routers.v0 import services
+from tests.setup.config_tests import env
+from tests.setup.query_plans import assert_uses_index, lookup_stats, plan_stages
+
+import certifi
+ca = certifi.where()
+
+PREFIX = 'search-shape'
+PUBLIC_OWNER = f'auth0|{PREFIX}-public'
+PRIVATE_OWNER = f'auth0|{PREFIX}-private'
+ELSEWHERE_OWNER = f'auth0|{PREFIX}-elsewhere'
+
+
+def merchant(owner_id: str, city: str, public: bool = True) -> dict:
+    return {'_id': f'{owner_id}-merchant', 'user_id': owner_id, 'name': owner_id, 'public': public,
+            'location': {'country': 'Canada', 'city': city}}
+
+
+@pytest.fixture(scope="module")
+async def test_database():
+    client = AsyncIOMotorClient(
+        env.test_db_url, tlsCAFile=ca, server_api=ServerApi('1'))
+    db = client[env.test_db_name]
+    await reconcile_indexes(db, [spec for spec in REQUIRED_INDEXES
+                                 if spec.collection in ('services', 'merchants', 'usernames')])
+    yield db
+    client.close()
+
+
+@pytest.fixture(scope="module")
+async def seeded(test_database):
+    owners = [PUBLIC_OWNER, PRIVATE_OWNER, ELSEWHERE_OWNER]
+
+    async def clean():
+        await test_database['services'].delete_many({'owner_id': {'$in': owners}})
+        await test_database['merchants'].delete_many({'user_id': {'$in': owners}})
+        await test_database['usernames'].delete_many({'user_id': {'$in': owners}})
+    await clean()
+    await test_database['merchants'].insert_many([
+        merchant(PUBLIC_OWNER, 'Montreal'),
+        merchant(PRIVATE_OWNER, 'Montreal', public=False),
+        merchant(ELSEWHERE_OWNER, 'Toronto'),
+    ])
+    await test_database['usernames'].insert_many(
+        [{'_id': f'{owner_id}-username', 'user_id': owner_id, 'username': owner_id.split('|')[1]} for owner_id in owners])
+    # The private and out of town services sort first, they must not shorten the page
+    await test_database['services'].insert_many(
+        [{'_id': f'{PREFIX}-0-{owner_id}-{price}', 'owner_id': owner_id, 'description': f'{PREFIX} braids',
+          'price': {'amount': price, 'currency': 'CAD'}}
+         for owner_id in (PRIVATE_OWNER, ELSEWHERE_OWNER) for price in (20, 40)] +
+        [{'_id': f'{PREFIX}-1-{price}', 'owner_id': PUBLIC_OWNER, 'description': f'{PREFIX} braids',
+          'price': {'amount': price, 'currency': 'CAD'}}
+         for price in (10, 20, 30, 40, 50)])
+    yield
+    await clean()
+
+
+def search_pipeline(per_page: int = 10) -> list:
+    service_query = paginated_query(services.build_service_query(PREFIX, 20, 40), services.SERVICES_SORT, None)
+    return services.build_aggregation_pipeline(
+        service_query, services.build_location_query('canada', 'montreal'), 1, per_page)
+
+
+def test_price_range_keeps_both_bounds():
+    assert services.build_service_query(None, 20, 40) == {'price.amount': {'$gte': 20, '$lte': 40}}
+    assert services.build_service_query(None, None, 40) == {'price.amount': {'$lte': 40}}
+
+
+def test_service_predicates_run_before_the_joins():
+    pipeline = search_pipeline()
+    assert list(pipeline[0]) == ['$match'] and 'price.amount' in pipeline[0]['$match']
+    merchants_lookup = pipeline[2]['$lookup']
+    assert merchants_lookup['from'] == 'merchants'
+    assert merchants_lookup['pipeline'][0] == {
+        '$match': {'public': True, 'location.country': 'Canada', 'location.city': 'Montreal'}}
+
+
+@pytest.mark.anyio
+async def test_search_uses_indexes(test_database, seeded):
+    explained = await test_database.command({
+        'explain': {'aggregate': 'services', 'pipeline': search_pipeline(), 'cursor': {}},
+        'verbosity': 'executionStats',
+    })
+
+    assert_uses_index(plan_stages(explained))
+    lookups = lookup_stats(explained)
+    assert lookups, explained
+    for lookup in lookups:
+        # Each join probes the foreign collection by index, never scans it
+        assert lookup.get('collectionScans', 0) == 0, lookup
+        if 'indexesUsed' in lookup:
+            assert lookup['indexesUsed'], lookup
+
+
+@pytest.mark.anyio
+async def test_search_pages_only_matching_merchants(test_database, seeded):
+    results = await test_database['services'].aggregate(search_pipeline(per_page=3)).to_list(length=None)
+
+    assert [service['_id'] for service in results] == [f'{PREFIX}-1-20', f'{PREFIX}-1-30', f'{PREFIX}-1-40']
+    assert {service['owner']['username'] for service in results} == {f'{PREFIX}-public'}
@@ -0,0 +1,114 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.server_api import ServerApi
+from app.config.database.indexes import REQUIRED_INDEXES, reconcile_indexes
+from app.services.bookings.holds import release_expired_holds
+from app.services.bookings.slots import SlotUnavailable, release_slots, reserve_slots, slot_buckets
+from tests.setup.config_tests import env
+
+import certifi
+ca = certifi.where()
+
+MERCHANT_ID = 'slot-reservation-merchant'
+DAY_START = datetime(2030, 1, 7, 9, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+async def test_database():
+    client = AsyncIOMotorClient(
+        env.test_db_url, tlsCAFile=ca, server_api=ServerApi('1'))
+    db = client[env.test_db_name]
+    reconciler = await reconcile_indexes(db, [spec for spec in REQUIRED_INDEXES if spec.collection == 'booking_slots'])
+    assert reconciler.ready, reconciler.status()
+    yield db
+    client.close()
+
+
+@pytest.fixture(scope="function")
+async def clean_slots(test_database):
+    await test_database['booking_slots'].delete_many({'merchant_id': MERCHANT_ID})
+    yield
+    await test_database['booking_slots'].delete_many({'merchant_id': MERCHANT_ID})
+
+
+async def try_reserve(db, booking_id: str, start_time: datetime, duration_minutes: int):
+    end_time = start_time + timedelta(minutes=duration_minutes)
+    try:
+        await reserve_slots(db, MERCHANT_ID, booking_id, start_time, end_time)
+        return booking_id, start_time, end_time
+    except SlotUnavailable:
+        return None
+
+
+@pytest.mark.anyio
+async def test_concurrent_bookings_never_overlap(test_database, clean_slots):
+    rng = random.Random(12)
+    # 300 customers race for a single 9 hour day, most of the requests collide
+    requests = [(f'stress-{i}', DAY_START + timedelta(minutes=15 * rng.randrange(32)), rng.choice([30, 45, 60, 90]))
+                for i in range(300)]
+
+    results = await asyncio.gather(*(try_reserve(test_database, *request) for request in requests))
+    winners = sorted((result for result in results if result is not None), key=lambda result: result[1])
+
+    assert winners
+    for (_, _, previous_end), (_, start, _) in zip(winners, winners[1:]):
+        assert previous_end <= start
+
+    # Losers leave nothing behind, winners hold exactly their own buckets
+    locks = await test_database['booking_slots'].find({'merchant_id': MERCHANT_ID}).to_list(length=None)
+    assert sorted(lock['booking_id'] for lock in locks) == sorted(
+        booking_id for booking_id, start, end in winners for _ in slot_buckets(start, end))
+
+
+@pytest.mark.anyio
+async def test_same_slot_has_one_winner(test_database, clean_slots):
+    results = await asyncio.gather(*(try_reserve(test_database, f'same-{i}', DAY_START, 60) for i in range(200)))
+    assert len([result for result in results if result is not None]) == 1
+
+
+@pytest.mark.anyio
+async def test_reschedule_onto_overlapping_time_keeps_own_slots(test_database, clean_slots):
+    await reserve_slots(test_database, MERCHANT_ID, 'resched', DAY_START, DAY_START + timedelta(minutes=60))
+
+    new_start = DAY_START + timedelta(minutes=30)
+    new_slots = await reserve_slots(test_database, MERCHANT_ID, 'resched', new_start, new_start + timedelta(minutes=60))
+    await release_slots(test_database, 'resched', keep=new_slots)
+
+    locks = await test_database['booking_slots'].find({'booking_id': 'resched'}).to_list(length=None)
+    assert sorted(lock['slot'].replace(tzinfo=timezone.utc) for lock in locks) == new_slots
+    assert await try_reserve(test_database, 'other', DAY_START, 30) is not None
+
+
+@pytest.mark.anyio
+async def test_lapsed_hold_does_not_block_the_slot(test_database, clean_slots):
+    lapsed = datetime.now(timezone.utc) - timedelta(minutes=1)
+    await reserve_slots(test_database, MERCHANT_ID, 'abandoned', DAY_START, DAY_START + timedelta(minutes=60),
+                        expires_at=lapsed)
+
+    assert await try_reserve(test_database, 'next-customer', DAY_START, 60) is not None
+    assert await test_database['booking_slots'].count_documents({'booking_id': 'abandoned'}) == 0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('payment_status', ['pending', 'failed'])
+async def test_sweeper_releases_lapsed_holds(test_database, clean_slots, payment_status):
+    booking_id = f'lapsed-{payment_status}'
+    lapsed = datetime.now(timezone.utc) - timedelta(minutes=1)
+    await test_database['bookings'].delete_many({'_id': booking_id})
+    await test_database['bookings'].insert_one({
+        '_id': booking_id, 'merchant': {'id': MERCHANT_ID},
+        'appointment_date': {'start_time': DAY_START, 'end_time': DAY_START + timedelta(minutes=60)},
+        'booking_status': 'pending', 'payment_status': payment_status, 'hold_expires_at': lapsed})
+    # A lock that has not expired yet, only the sweeper frees it
+    await reserve_slots(test_database, MERCHANT_ID, booking_id, DAY_START, DAY_START + timedelta(minutes=60))
+    try:
+        await release_expired_holds(test_database)
+        stored = await test_database['bookings'].find_one({'_id': booking_id})
+    finally:
+        await test_database['bookings'].delete_many({'_id': booking_id})
+
+    assert stored['booking_status'] == 'cancelled' and stored['hold_lapsed'] and 'hold_expires_at' not in stored
+    assert await test_database['booking_slots'].count_documents({'booking_id': booking_id}) == 0
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.server_api import ServerApi
+from app.config.database.indexes import REQUIRED_INDEXES, reconcile_indexes
+from app.services.bookings.slots import reserve_slots
+from app.services.payments import webhook_events
+from app.services.payments.webhook_events import EVENTS, StripeEventProcessor, record_event
+from tests.setup.config_tests import env
+
+import certifi
+ca = certifi.where()
+
+BOOKING_ID = 'stripe-events-booking'
+MERCHANT_ID = 'stripe-events-merchant'
+START_TIME = datetime(2030, 1, 7, 10, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+async def test_database():
+    client = AsyncIOMotorClient(
+        env.test_db_url, tlsCAFile=ca, server_api=ServerApi('1'), tz_aware=True)
+    db = client[env.test_db_name]
+    await reconcile_indexes(db, [spec for spec in REQUIRED_INDEXES if spec.collection == 'booking_slots'])
+    yield db
+    client.close()
+
+
+@pytest.fixture(scope="function")
+async def booking(test_database):
+    async def clean():
+        await test_database[EVENTS].delete_many({'booking_id': BOOKING_ID})
+        await test_database['transactions'].delete_many({'booking_id': BOOKING_ID})
+        await test_database['bookings'].delete_many({'_id': BOOKING_ID})
+        await test_database['booking_slots'].delete_many({'merchant_id': MERCHANT_ID})
+    await clean()
+    await test_database['bookings'].insert_one({
+        '_id': BOOKING_ID,
+        'merchant': {'id': MERCHANT_ID},
+        'appointment_date': {'start_time': START_TIME, 'end_time': START_TIME + timedelta(hours=1)},
+        'booking_status': 'pending',
+        'payment_status': 'pending',
+        'hold_expires_at': datetime.now(timezone.utc) + timedelta(minutes=30),
+    })
+    yield BOOKING_ID
+    await clean()
+
+
+def payment_event(event_id: str, event_type: str, created: int) -> dict:
+    return {
+        'id': event_id,
+        'type': event_type,
+        'created': created,
+        'data': {'object': {'id': f'pi_{event_id}', 'object': 'payment_intent', 'metadata': {'booking_id': BOOKING_ID}}},
+    }
+
+
+@pytest.mark.anyio
+async def test_redelivered_event_is_stored_once(test_database, booking):
+    event = payment_event('evt_redelivered', 'payment_intent.succeeded', 100)
+
+    assert await record_event(test_database, event) is True
+    assert await record_event(test_database, event) is False
+    assert await test_database[EVENTS].count_documents({'_id': 'evt_redelivered'}) == 1
+
+
+@pytest.mark.anyio
+async def test_event_is_applied_exactly_once(test_database, booking):
+    await record_event(test_database, payment_event('evt_paid', 'payment_intent.succeeded', 100))
+    processor = StripeEventProcessor()
+
+    assert await processor.process_batch(test_database) == 1
+    # Replaying the same event, e.g. after a crash before it was marked processed, changes nothing
+    await test_database[EVENTS].update_one({'_id': 'evt_paid'}, {'$set': {'status': 'pending'}})
+    await processor.process_batch(test_database)
+
+    stored = await test_database['bookings'].find_one({'_id': booking})
+    assert stored['booking_status'] == 'confirmed' and stored['payment_status'] == 'success'
+    assert 'hold_expires_at' not in stored
+    assert await test_database['transactions'].count_documents({'booking_id': booking}) == 1
+    assert (await test_database[EVENTS].find_one({'_id': 'evt_paid'}))['status'] == 'processed'
+
+
+@pytest.mark.anyio
+async def test_events_apply_in_creation_order(test_database, booking):
+    # Stripe can deliver out of order: the success arrives before the earlier failed attempt
+    await record_event(test_database, payment_event('evt_second', 'payment_intent.succeeded', 200))
+    await record_event(test_database, payment_event('evt_first', 'payment_intent.payment_failed', 100))
+
+    await StripeEventProcessor().process_batch(test_database)
+
+    stored = await test_database['bookings'].find_one({'_id': booking})
+    assert stored['payment_status'] == 'success'
+
+
+@pytest.mark.anyio
+async def test_failing_event_holds_back_later_events(test_database, booking, monkeypatch):
+    async def broken(db, event):
+        raise RuntimeError('database hiccup')
+
+    monkeypatch.setitem(webhook_events.EVENT_HANDLERS, 'payment_intent.payment_failed', broken)
+    await record_event(test_database, payment_event('evt_broken', 'payment_intent.payment_failed', 100))
+    await record_event(test_database, payment_event('evt_later', 'payment_intent.succeeded', 200))
+    processor = StripeEventProcessor()
+
+    await processor.process_batch(test_database)
+
+    assert (await test_database['bookings'].find_one({'_id': booking}))['payment_status'] == 'pending'
+    broken_event = await test_database[EVENTS].find_one({'_id': 'evt_broken'})
+    assert broken_event['status'] == 'pending' and broken_event['attempts'] == 1
+    assert (await test_database[EVENTS].find_one({'_id': 'evt_later'}))['status'] == 'pending'
+    assert processor.stats()['retries'] == 1
+
+
+async def cancel_hold(db, booking_id: str):
+    """What the hold sweeper does once the hold lapses without a payment."""
+    await db['bookings'].update_one({'_id': booking_id}, {'$set': {'booking_status': 'cancelled', 'payment_status': 'cancelled',
+                                                                   'hold_lapsed': True},
+                                                          '$unset': {'hold_expires_at': ''}})
+    await db['booking_slots'].delete_many({'booking_id': booking_id})
+
+
+@pytest.mark.anyio
+async def test_late_payment_reclaims_a_free_slot(test_database, booking):
+    await cancel_hold(test_database, booking)
+    await record_event(test_database, payment_event('evt_late', 'payment_intent.succeeded', 100))
+
+    await StripeEventProcessor().process_batch(test_database)
+
+    stored = await test_database['bookings'].find_one({'_id': booking})
+    assert stored['booking_status'] == 'confirmed' and stored['payment_status'] == 'success'
+    assert await test_database['booking_slots'].count_documents({'booking_id': booking}) == 12
+
+
+@pytest.mark.anyio
+async def test_late_payment_for_a_taken_slot_is_marked_for_refund(test_database, booking):
+    await cancel_hold(test_database, booking)
+    await reserve_slots(test_database, MERCHANT_ID, 'stripe-events-other-booking', START_TIME, START_TIME + timedelta(hours=1))
+    await record_event(test_database, payment_event('evt_late', 'payment_intent.succeeded', 100))
+
+    await StripeEventProcessor().process_batch(test_database)
+
+    stored = await test_database['bookings'].find_one({'_id': booking})
+    assert stored['booking_status'] == 'cancelled' and stored['payment_status'] == 'refund_pending'
+    assert await test_database['booking_slots'].count_documents({'booking_id': booking}) == 0
+    assert await test_database['booking_slots'].count_documents({'booking_id': 'stripe-events-other-booking'}) == 12
+
+
+@pytest.mark.anyio
+async def test_payment_for_a_cancelled_booking_is_marked_for_refund(test_database, booking):
+    # Cancelled by the customer while the hold was still running
+    await test_database['bookings'].update_one({'_id': booking}, {'$set': {'booking_status': 'cancelled', 'payment_status': 'cancelled'}})
+    await record_event(test_database, payment_event('evt_cancelled', 'payment_intent.succeeded', 100))
+
+    await StripeEventProcessor().process_batch(test_database)
+
+    stored = await test_database['bookings'].find_one({'_id': booking})
+    assert stored['booking_status'] == 'cancelled' and stored['payment_status'] == 'refund_pending'
+    assert await test_database['booking_slots'].count_documents({'booking_id': booking}) == 0
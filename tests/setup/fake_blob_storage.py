@@ -0,0 +1,62 @@
+"""
+A local stand-in for the Azure Blob Storage upload endpoints, served on a background thread.
+
+Build a BlobStorage from FakeBlobStorage.connection_string. Uploads are kept in memory, both single puts
+and block uploads, and `delay` makes every response slow to check that uploads run concurrently.
+"""
+import asyncio
+import re
+from email.utils import formatdate
+from typing import Dict
+
+from fastapi import FastAPI, Request, Response
+
+from tests.setup.local_server import LocalServer
+
+ACCOUNT = 'devstoreaccount1'
+# The well known Azurite development key, requests are signed with it but never checked
+ACCOUNT_KEY = 'Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=='
+
+
+class FakeBlobStorage(LocalServer):
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.blobs: Dict[str, bytes] = {}
+        self.content_types: Dict[str, str] = {}
+        self.blocks: Dict[str, Dict[str, bytes]] = {}
+        super().__init__(self._build_app())
+
+    @property
+    def connection_string(self) -> str:
+        return (f'DefaultEndpointsProtocol=http;AccountName={ACCOUNT};AccountKey={ACCOUNT_KEY};'
+                f'BlobEndpoint={self.url}/{ACCOUNT};')
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        def created() -> Response:
+            return Response(status_code=201, headers={
+                'ETag': '"0x8D000000000000"', 'Last-Modified': formatdate(usegmt=True),
+                'x-ms-request-server-encrypted': 'true'})
+
+        @app.put(f'/{ACCOUNT}/{{container}}/{{blob:path}}')
+        async def put_blob(container: str, blob: str, request: Request):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            name = f'{container}/{blob}'
+            body = await request.body()
+            comp = request.query_params.get('comp')
+            if comp == 'block':
+                self.blocks.setdefault(name, {})[request.query_params['blockid']] = body
+            elif comp == 'blocklist':
+                staged = self.blocks.pop(name, {})
+                ids = re.findall(rb'<(?:Latest|Uncommitted|Committed)>([^<]+)<', body)
+                self.blobs[name] = b''.join(staged[block_id.decode()] for block_id in ids)
+                self.content_types[name] = request.headers.get('x-ms-blob-content-type')
+            else:
+                self.blobs[name] = body
+                self.content_types[name] = request.headers.get('x-ms-blob-content-type')
+            return created()
+
+        return app
+
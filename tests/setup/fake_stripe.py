@@ -0,0 +1,97 @@
+"""
+A local stand-in for the parts of the Stripe API the app uses, served on a background thread.
+
+Point a StripeGateway at FakeStripe.url to exercise real HTTP round trips without network access or
+Stripe credentials. `delay` makes every response slow, to check that calls do not block the event loop.
+"""
+import asyncio
+import time
+import uuid
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from tests.setup.local_server import LocalServer
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code,
+                        content={'error': {'type': 'invalid_request_error', 'message': message}})
+
+
+class FakeStripe(LocalServer):
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sessions: Dict[str, dict] = {}
+        self.accounts: Dict[str, dict] = {}
+        self.requests: Dict[str, int] = {}
+        super().__init__(self._build_app())
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.middleware('http')
+        async def count_and_delay(request: Request, call_next):
+            key = f'{request.method} {request.url.path}'
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            return await call_next(request)
+
+        @app.post('/v1/checkout/sessions')
+        async def create_session(request: Request):
+            form = await request.form()
+            expires_at = int(form.get('expires_at', int(time.time()) + 24 * 3600))
+            if expires_at < time.time() + 30 * 60:
+                return _error(400, 'The `expires_at` timestamp must be at least 30 minutes from Checkout Session creation.')
+            session_id = f'cs_test_{uuid.uuid4().hex}'
+            self.sessions[session_id] = {
+                'id': session_id,
+                'object': 'checkout.session',
+                'client_secret': f'{session_id}_secret_{uuid.uuid4().hex[:8]}',
+                'status': 'open',
+                'expires_at': expires_at,
+                'metadata': {'booking_id': form.get('metadata[booking_id]')},
+                'customer_details': {'email': form.get('customer_email')},
+            }
+            return self.sessions[session_id]
+
+        @app.get('/v1/checkout/sessions/{session_id}')
+        async def retrieve_session(session_id: str):
+            if session_id not in self.sessions:
+                return _error(404, f'No such checkout.session: {session_id}')
+            return self.sessions[session_id]
+
+        @app.post('/v1/checkout/sessions/{session_id}/expire')
+        async def expire_session(session_id: str):
+            if session_id not in self.sessions:
+                return _error(404, f'No such checkout.session: {session_id}')
+            if self.sessions[session_id]['status'] != 'open':
+                return _error(400, 'Only Checkout Sessions with a status in ["open"] can be expired.')
+            self.sessions[session_id]['status'] = 'expired'
+            return self.sessions[session_id]
+
+        @app.post('/v1/accounts')
+        async def create_account(request: Request):
+            form = await request.form()
+            account_id = f'acct_{uuid.uuid4().hex[:16]}'
+            self.accounts[account_id] = {'id': account_id, 'object': 'account', 'email': form.get('email'),
+                                         'country': form.get('country'), 'details_submitted': False}
+            return self.accounts[account_id]
+
+        @app.get('/v1/accounts/{account_id}')
+        async def retrieve_account(account_id: str):
+            if account_id not in self.accounts:
+                return _error(404, f'No such account: {account_id}')
+            return self.accounts[account_id]
+
+        @app.post('/v1/accounts/{account_id}/login_links')
+        async def create_login_link(account_id: str):
+            return {'object': 'login_link', 'url': f'https://connect.stripe.test/{account_id}'}
+
+        @app.get('/v1/balance')
+        async def retrieve_balance():
+            return {'object': 'balance', 'available': [{'amount': 0, 'currency': 'cad'}], 'pending': []}
+
+        return app
@@ -0,0 +1,58 @@
+"""
+A local stand-in for the Twilio Verify endpoints the app uses, served on a background thread.
+
+Point a TwilioVerifier at FakeTwilio.url as its base_url. Every verification accepts CODE, and a check
+for a number without a pending verification answers 404 like Twilio does once a code expired.
+"""
+import asyncio
+import uuid
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from tests.setup.local_server import LocalServer
+
+CODE = '123456'
+
+
+class FakeTwilio(LocalServer):
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.pending: Dict[str, str] = {}
+        self.requests: Dict[str, int] = {}
+        super().__init__(self._build_app())
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.middleware('http')
+        async def count_and_delay(request: Request, call_next):
+            key = f'{request.method} {request.url.path}'
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            return await call_next(request)
+
+        @app.post('/v2/Services/{service_sid}/Verifications')
+        async def create_verification(service_sid: str, request: Request):
+            form = await request.form()
+            verification_sid = f'VE{uuid.uuid4().hex}'
+            self.pending[form['To']] = verification_sid
+            return {'sid': verification_sid, 'service_sid': service_sid, 'to': form['To'],
+                    'channel': form.get('Channel'), 'status': 'pending', 'valid': False}
+
+        @app.post('/v2/Services/{service_sid}/VerificationCheck')
+        async def check_verification(service_sid: str, request: Request):
+            form = await request.form()
+            verification_sid = self.pending.get(form['To'])
+            if verification_sid is None:
+                return JSONResponse(status_code=404, content={
+                    'code': 20404, 'status': 404, 'message': 'The requested resource was not found'})
+            approved = form.get('Code') == CODE
+            if approved:
+                del self.pending[form['To']]
+            return {'sid': verification_sid, 'service_sid': service_sid, 'to': form['To'],
+                    'status': 'approved' if approved else 'pending', 'valid': approved}
+
+        return app
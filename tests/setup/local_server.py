@@ -0,0 +1,32 @@
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+
+
+class LocalServer:
+    """Serves an ASGI app with uvicorn on a background thread, on a free localhost port."""
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.url = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host='127.0.0.1', port=port, log_level='warning'))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        self.url = f'http://127.0.0.1:{port}'
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
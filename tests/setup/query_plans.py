@@ -0,0 +1,41 @@
+"""
+Helpers for tests that assert on explain() output, to check that queries and pipelines use an index.
+"""
+
+
+def plan_stages(plan) -> list:
+    """Collect every stage name in an explain() plan, classic or slot-based engine."""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+async def winning_plan_stages(cursor) -> list:
+    explained = await cursor.explain()
+    return plan_stages(explained['queryPlanner']['winningPlan'])
+
+
+def assert_uses_index(stages: list):
+    assert 'IXSCAN' in stages, stages
+    assert 'COLLSCAN' not in stages, stages
+
+
+def lookup_stats(explained) -> list:
+    """The per-stage statistics the server reports for each $lookup of an explained pipeline."""
+    stats = []
+    if isinstance(explained, dict):
+        if '$lookup' in explained:
+            stats.append(explained)
+        for value in explained.values():
+            stats.extend(lookup_stats(value))
+    elif isinstance(explained, list):
+        for item in explained:
+            stats.extend(lookup_stats(item))
+    return stats
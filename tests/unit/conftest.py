@@ -0,0 +1,31 @@
+import pytest
+
+from tests.setup.fake_blob_storage import FakeBlobStorage
+from tests.setup.fake_stripe import FakeStripe
+from tests.setup.fake_twilio import FakeTwilio
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture(scope="module")
+def fake_stripe():
+    server = FakeStripe().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+def fake_twilio():
+    server = FakeTwilio().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+def fake_blob_storage():
+    server = FakeBlobStorage().start()
+    yield server
+    server.stop()
@@ -0,0 +1,67 @@
+from datetime import date, datetime, time, timedelta, timezone
+
+from app.services.bookings.availability_cache import AvailabilityCache
+
+REF_DATE = date(2030, 1, 7)
+MERCHANT_ID = 'merchant-1'
+
+
+def week_of_slots(days: int = 7):
+    return {REF_DATE + timedelta(days=i): [time(9, tzinfo=timezone.utc)] for i in range(days)}
+
+
+def test_hit_after_put():
+    cache = AvailabilityCache()
+    assert cache.get(MERCHANT_ID, 60, REF_DATE, 7) is None
+
+    cache.put(MERCHANT_ID, 60, week_of_slots(), cache.generation(MERCHANT_ID))
+
+    assert cache.get(MERCHANT_ID, 60, REF_DATE, 7) == week_of_slots()
+    assert cache.get(MERCHANT_ID, 30, REF_DATE, 7) is None
+    assert cache.get(MERCHANT_ID, 60, REF_DATE, 8) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 3)
+
+
+def test_invalidate_booking_drops_neighbouring_days():
+    cache = AvailabilityCache()
+    cache.put(MERCHANT_ID, 60, week_of_slots(), cache.generation(MERCHANT_ID))
+
+    start = datetime(2030, 1, 10, 10, tzinfo=timezone.utc)
+    cache.invalidate_booking(MERCHANT_ID, start, start + timedelta(hours=1))
+
+    assert cache.get(MERCHANT_ID, 60, REF_DATE, 2) is not None
+    assert cache.get(MERCHANT_ID, 60, date(2030, 1, 9), 1) is None
+    assert cache.get(MERCHANT_ID, 60, date(2030, 1, 11), 1) is None
+    assert cache.get(MERCHANT_ID, 60, date(2030, 1, 12), 2) is not None
+
+
+def test_schedule_change_drops_every_day():
+    cache = AvailabilityCache()
+    cache.put(MERCHANT_ID, 60, week_of_slots(), cache.generation(MERCHANT_ID))
+    cache.put('merchant-2', 60, week_of_slots(), cache.generation('merchant-2'))
+
+    cache.invalidate(MERCHANT_ID)
+
+    assert cache.stats()['size'] == 7
+    assert cache.get('merchant-2', 60, REF_DATE, 7) is not None
+
+
+def test_result_computed_before_a_write_is_not_stored():
+    cache = AvailabilityCache()
+    generation = cache.generation(MERCHANT_ID)
+    cache.invalidate(MERCHANT_ID)  # a booking lands while the slots are being computed
+
+    cache.put(MERCHANT_ID, 60, week_of_slots(), generation)
+
+    assert cache.get(MERCHANT_ID, 60, REF_DATE, 7) is None
+
+
+def test_least_recently_used_days_are_evicted():
+    cache = AvailabilityCache(maxsize=7)
+    cache.put(MERCHANT_ID, 60, week_of_slots(), cache.generation(MERCHANT_ID))
+    cache.put(MERCHANT_ID, 30, week_of_slots(1), cache.generation(MERCHANT_ID))
+
+    assert cache.stats()['size'] == 7
+    assert cache.get(MERCHANT_ID, 60, REF_DATE, 1) is None
+    assert cache.get(MERCHANT_ID, 30, REF_DATE, 1) is not None
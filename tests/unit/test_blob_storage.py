@@ -0,0 +1,37 @@
+import io
+
+import pytest
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from app.services.storage.azure_blob import BlobStorage
+
+CONTAINER = 'images'
+
+
+@pytest.fixture
+async def storage(fake_blob_storage):
+    storage = BlobStorage(fake_blob_storage.connection_string, CONTAINER, max_concurrency=10)
+    yield storage
+    await storage.close()
+
+
+def image(content: bytes, filename: str = 'photo.jpg') -> UploadFile:
+    return UploadFile(io.BytesIO(content), size=len(content), filename=filename, headers=Headers({'content-type': 'image/jpeg'}))
+
+
+@pytest.mark.anyio
+async def test_upload_returns_blob_url(storage, fake_blob_storage):
+    url = await storage.upload('merchant-1/profile/photo.jpg', image(b'jpeg bytes'))
+
+    assert url == f'{fake_blob_storage.url}/devstoreaccount1/{CONTAINER}/merchant-1/profile/photo.jpg'
+    assert fake_blob_storage.blobs[f'{CONTAINER}/merchant-1/profile/photo.jpg'] == b'jpeg bytes'
+    assert fake_blob_storage.content_types[f'{CONTAINER}/merchant-1/profile/photo.jpg'] == 'image/jpeg'
+
+
+@pytest.mark.anyio
+async def test_large_file_is_streamed_in_blocks(storage, fake_blob_storage):
+    content = bytes(range(256)) * (6 * 1024 * 1024 // 256)
+    await storage.upload('merchant-1/services/large.jpg', image(content))
+
+    assert fake_blob_storage.blobs[f'{CONTAINER}/merchant-1/services/large.jpg'] == content
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+from app.services.media.derivatives import ImageDerivatives
+from app.services.media.images import VARIANTS, render_variants, variant_blob_name
+from app.services.storage.azure_blob import BlobStorage
+
+CONTAINER = 'images'
+
+
+def photo(width: int, height: int, mode: str = 'RGB', format: str = 'JPEG', exif=None, color='red') -> bytes:
+    output = io.BytesIO()
+    image = Image.new(mode, (width, height), color)
+    image.save(output, format=format, **({'exif': exif} if exif else {}))
+    return output.getvalue()
+
+
+def opened(rendered, name) -> Image.Image:
+    return Image.open(io.BytesIO(rendered[name][0]))
+
+
+def test_thumbnails_are_cropped_to_size():
+    rendered = render_variants(photo(1600, 900))
+
+    for name, format in (('thumbnail', 'WEBP'), ('thumbnail_jpeg', 'JPEG')):
+        assert opened(rendered, name).size == (160, 160)
+        assert opened(rendered, name).format == format
+    assert rendered['thumbnail'][1] == 'image/webp'
+    assert rendered['thumbnail_jpeg'][1] == 'image/jpeg'
+
+
+def test_responsive_variants_keep_aspect_ratio_and_never_upscale():
+    rendered = render_variants(photo(1000, 500))
+
+    assert opened(rendered, 'w320').size == (320, 160)
+    assert opened(rendered, 'w640').size == (640, 320)
+    assert 'w1280' not in rendered
+
+
+def test_exif_orientation_is_applied():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees, as phones store portrait shots
+    rendered = render_variants(photo(1200, 800, exif=exif))
+
+    assert opened(rendered, 'w640').size == (640, 960)
+
+
+def test_transparent_images_keep_alpha_in_webp():
+    rendered = render_variants(photo(800, 800, mode='RGBA', format='PNG', color=(255, 0, 0, 128)))
+
+    assert opened(rendered, 'w640').mode == 'RGBA'
+    assert opened(rendered, 'thumbnail_jpeg').mode == 'RGB'
+
+
+def test_non_image_is_rejected():
+    with pytest.raises(UnidentifiedImageError):
+        render_variants(b'not an image')
+
+
+def test_variants_are_named_after_the_original():
+    assert [variant_blob_name('merchant-1/services/photo.jpg', variant) for variant in VARIANTS] == [
+        'merchant-1/services/photo_thumbnail.webp',
+        'merchant-1/services/photo_thumbnail_jpeg.jpg',
+        'merchant-1/services/photo_w320.webp',
+        'merchant-1/services/photo_w640.webp',
+        'merchant-1/services/photo_w1280.webp',
+    ]
+
+
+@pytest.mark.anyio
+async def test_variants_render_in_worker_processes_and_upload_next_to_the_original(fake_blob_storage, tmp_path):
+    # Uploads reach the workers as a spooled file, not as bytes
+    spooled = tmp_path / 'photo.jpg'
+    spooled.write_bytes(photo(2000, 1500))
+    server = fake_blob_storage
+    storage = BlobStorage(server.connection_string, CONTAINER)
+    derivatives = ImageDerivatives(storage, max_workers=1)
+    try:
+        variants = await derivatives.generate('merchant-1/services/photo.jpg', str(spooled))
+    finally:
+        derivatives.shutdown()
+        await storage.close()
+
+    assert set(variants) == {variant.name for variant in VARIANTS}
+    assert variants['w320'] == f'{server.url}/devstoreaccount1/{CONTAINER}/merchant-1/services/photo_w320.webp'
+    assert Image.open(io.BytesIO(server.blobs[f'{CONTAINER}/merchant-1/services/photo_w1280.webp'])).size == (1280, 960)
+    assert server.content_types[f'{CONTAINER}/merchant-1/services/photo_thumbnail.webp'] == 'image/webp'
@@ -1,3 +1,5 @@
+from types import SimpleNamespace
+
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
@@ -10,3 +12,16 @@ def test_read_main():
     assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
     assert response.json() == {
         "msg": "Welcome to Suav Beauty"}, f"Expected response body {{'msg': 'Welcome to Suav Beauty'}}, but got {response.json()}"
+
+
+@pytest.mark.parametrize('indexes_ready, migrations_ready, expected', [
+    (True, True, 200), (True, False, 503), (False, True, 503)])
+def test_ready_waits_for_indexes_and_migrations(indexes_ready, migrations_ready, expected, monkeypatch):
+    for name, ready in (('indexes', indexes_ready), ('migrations', migrations_ready)):
+        monkeypatch.setattr(app.state, name, SimpleNamespace(ready=ready, status=lambda ready=ready: {'ready': ready}),
+                            raising=False)
+
+    response = client.get("/ready")
+
+    assert response.status_code == expected
+    assert response.json()['migrations'] == {'ready': migrations_ready}
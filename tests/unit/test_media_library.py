@@ -0,0 +1,37 @@
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+
+from app.services.media.library import content_blob_name, content_hash, spool_upload
+
+
+@pytest.mark.anyio
+async def test_content_hash_streams_and_rewinds():
+    content = bytes(range(256)) * 20_000
+    file = UploadFile(io.BytesIO(content), size=len(content), filename='photo.jpg')
+
+    assert await content_hash(file) == hashlib.sha256(content).hexdigest()
+    assert await file.read() == content
+
+
+@pytest.mark.anyio
+async def test_spool_upload_copies_to_a_temporary_file():
+    content = bytes(range(256)) * 20_000
+    file = UploadFile(io.BytesIO(content), size=len(content), filename='Photo.JPG')
+    await file.read()
+
+    path = await spool_upload(file)
+    try:
+        assert path.endswith('.jpg')
+        with open(path, 'rb') as spooled:
+            assert spooled.read() == content
+    finally:
+        os.remove(path)
+
+
+def test_blob_name_is_content_addressed():
+    assert content_blob_name('merchant-1/services', 'ab12', 'My Photo.JPEG') == 'merchant-1/services/ab12.jpeg'
+    assert content_blob_name('merchant-1/services', 'ab12', '') == 'merchant-1/services/ab12'
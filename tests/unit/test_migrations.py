@@ -0,0 +1,39 @@
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from app.config.database import migrations
+from app.config.database.migrations import MigrationRunner
+
+
+@pytest.mark.anyio
+async def test_ready_once_every_migration_completed(monkeypatch):
+    calls = []
+
+    async def flaky(db):
+        calls.append('flaky')
+        if len(calls) == 1:
+            raise AutoReconnect('primary stepped down')
+        return 3
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [flaky])
+    runner = MigrationRunner(db=None, retry_delay=0)
+    assert not runner.ready
+
+    await runner.run()
+
+    assert runner.ready and calls == ['flaky', 'flaky']
+    assert runner.status() == {'ready': True, 'errors': {}}
+
+
+@pytest.mark.anyio
+async def test_failed_migration_keeps_the_app_unready(monkeypatch):
+    async def broken(db):
+        raise OperationFailure('Failed to parse date string')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [broken])
+    runner = MigrationRunner(db=None)
+
+    await runner.run()
+
+    assert not runner.ready
+    assert runner.status()['errors'] == {'broken': 'Failed to parse date string'}
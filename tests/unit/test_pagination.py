@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+
+from app.helpers.pagination import (NEXT_CURSOR_HEADER, after_cursor, decode_cursor, encode_cursor, paginated_query,
+                                    set_next_cursor)
+
+BOOKING_SORT = [('appointment_date.start_time', 1), ('_id', 1)]
+START_TIME = datetime(2030, 1, 7, 10, tzinfo=timezone.utc)
+
+
+def test_cursor_round_trips_sort_key():
+    booking = {'_id': 'booking-1', 'appointment_date': {'start_time': START_TIME}, 'customer': {'id': 'c'}}
+    cursor = encode_cursor(booking, BOOKING_SORT)
+
+    assert decode_cursor(cursor, BOOKING_SORT) == [START_TIME, 'booking-1']
+
+
+def test_next_page_starts_after_the_cursor():
+    cursor = encode_cursor({'_id': 'booking-1', 'appointment_date': {'start_time': START_TIME}}, BOOKING_SORT)
+
+    assert after_cursor(cursor, BOOKING_SORT) == {'$or': [
+        {'appointment_date.start_time': {'$gt': START_TIME}},
+        {'appointment_date.start_time': START_TIME, '_id': {'$gt': 'booking-1'}},
+    ]}
+    assert after_cursor(encode_cursor({'_id': 'm-9'}, [('_id', -1)]), [('_id', -1)]) == {'_id': {'$lt': 'm-9'}}
+
+
+def test_query_is_unchanged_without_cursor():
+    assert paginated_query({'merchant.id': 'm'}, [('_id', 1)], None) == {'merchant.id': 'm'}
+    assert paginated_query({'merchant.id': 'm'}, [('_id', 1)], encode_cursor({'_id': 'b'}, [('_id', 1)])) == {
+        '$and': [{'merchant.id': 'm'}, {'_id': {'$gt': 'b'}}]}
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'bm90IGpzb24=', encode_cursor({'_id': 'b'}, [('_id', 1)])])
+def test_invalid_cursor_is_bad_request(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, BOOKING_SORT)
+    assert e.value.status_code == 400
+
+
+def test_last_page_has_no_next_cursor():
+    full, short = Response(), Response()
+    set_next_cursor(full, [{'_id': 'a'}, {'_id': 'b'}], [('_id', 1)], per_page=2)
+    set_next_cursor(short, [{'_id': 'a'}], [('_id', 1)], per_page=2)
+
+    assert decode_cursor(full.headers[NEXT_CURSOR_HEADER], [('_id', 1)]) == ['b']
+    assert NEXT_CURSOR_HEADER not in short.headers
@@ -0,0 +1,59 @@
+import boto3
+import pytest
+import requests
+from moto import mock_aws
+
+from app.auth.auth import Auth0User
+from app.routers.v0 import file_uploads
+from app.services.storage.s3 import S3Uploads
+
+BUCKET = 'suav-test-uploads'
+REGION = 'us-east-1'
+
+
+@pytest.fixture
+def uploads():
+    with mock_aws():
+        boto3.client('s3', region_name=REGION).create_bucket(Bucket=BUCKET)
+        yield S3Uploads(BUCKET, REGION, 'testing', 'testing')
+
+
+class MerchantLookups:
+    """Stands in for the database, counting merchant lookups."""
+
+    def __init__(self):
+        self.lookups = 0
+
+    def __getitem__(self, collection):
+        return self
+
+    async def find_one(self, query):
+        self.lookups += 1
+        return {'_id': 'merchant-1', 'user_id': query['user_id']}
+
+
+def test_client_is_created_once(uploads):
+    assert uploads.client() is uploads.client()
+
+
+def test_presigned_url_accepts_upload(uploads):
+    url = uploads.signed_put_url('merchant-1/services/photo')
+
+    assert requests.put(url, data=b'jpeg bytes').status_code == 200
+    stored = uploads.client().get_object(Bucket=BUCKET, Key='merchant-1/services/photo')
+    assert stored['Body'].read() == b'jpeg bytes'
+
+
+@pytest.mark.anyio
+async def test_gallery_urls_use_one_merchant_lookup(uploads):
+    db = MerchantLookups()
+    user = Auth0User(sub='auth0|merchant-1')
+
+    response = await file_uploads.get_service_image_signed_urls(count=10, user_profile=user, db=db, uploads=uploads)
+
+    assert db.lookups == 1
+    assert len(response['urls']) == 10
+    for index, url in enumerate(response['urls']):
+        assert requests.put(url, data=f'image {index}'.encode()).status_code == 200
+    keys = [obj['Key'] for obj in uploads.client().list_objects_v2(Bucket=BUCKET, Prefix='merchant-1/services/')['Contents']]
+    assert len(set(keys)) == 10
@@ -0,0 +1,152 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+import pytest
+
+from app.services.bookings.holds import hold_window
+from app.services.payments import stripe as payments
+from app.schema.object_models.v0.booking_model import BookingFullModel
+from app.schema.object_models.v0.payment_model import CheckoutSession
+from app.services.payments.stripe import StripeGateway, awaiting_payment, reusable_checkout_session
+
+CHECKOUT_PARAMS = {
+    'ui_mode': 'embedded',
+    'mode': 'payment',
+    'customer_email': 'customer@example.com',
+    'metadata': {'booking_id': 'booking-1'},
+}
+
+
+@pytest.fixture
+async def gateway(fake_stripe):
+    gateway = StripeGateway('sk_test_fake', timeout=5, max_network_retries=0, api_base=fake_stripe.url)
+    yield gateway
+    await gateway.close()
+
+
+@pytest.mark.anyio
+async def test_checkout_session_round_trip(gateway, fake_stripe, monkeypatch):
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=31)
+    session = await gateway.create_checkout_session(dict(CHECKOUT_PARAMS, expires_at=int(expires_at.timestamp())))
+
+    assert session.client_secret.startswith(session.id)
+    assert session.expires_at == int(expires_at.timestamp())
+    assert fake_stripe.sessions[session.id]['metadata'] == {'booking_id': 'booking-1'}
+
+    monkeypatch.setattr(payments, 'stripe_gateway', gateway)
+    assert await payments.get_checkout_session_status(session.id) == {
+        'status': 'open', 'customer_email': 'customer@example.com'}
+
+
+@pytest.mark.anyio
+async def test_checkout_session_for_a_new_hold_outlasts_the_stripe_minimum(gateway, fake_stripe, monkeypatch):
+    monkeypatch.setattr(payments, 'stripe_gateway', gateway)
+    service = SimpleNamespace(service_name='Cut', description='Cut and style', images=[],
+                              price=SimpleNamespace(currency=SimpleNamespace(code='CAD')))
+    booking = BookingFullModel.model_construct(id='booking-1', service=service)
+
+    called_at = time.time()
+    checkout_expires_at, _ = hold_window()
+    session = await payments.create_checkout_session(booking, 'customer@example.com', expires_at=checkout_expires_at)
+
+    # Stripe refuses sessions that expire less than 30 minutes after it creates them
+    assert session is not None
+    assert fake_stripe.sessions[session.id]['expires_at'] >= called_at + 30 * 60
+
+
+@pytest.mark.anyio
+async def test_expired_checkout_session_stops_taking_payment(gateway, fake_stripe, monkeypatch):
+    monkeypatch.setattr(payments, 'stripe_gateway', gateway)
+    session = await gateway.create_checkout_session(CHECKOUT_PARAMS)
+
+    await payments.expire_checkout_session(session.id)
+    assert fake_stripe.sessions[session.id]['status'] == 'expired'
+    # Expiring it again, or a session Stripe no longer has, is not an error for the caller
+    await payments.expire_checkout_session(session.id)
+    await payments.expire_checkout_session('cs_test_missing')
+
+
+@pytest.mark.anyio
+async def test_connected_account_calls(gateway, monkeypatch):
+    monkeypatch.setattr(payments, 'stripe_gateway', gateway)
+    account = await gateway.create_account({'type': 'express', 'country': 'CA', 'email': 'merchant@example.com'})
+
+    assert await payments.check_stripe_onboarding_status(account.id) is False
+    assert await payments.generate_stripe_login_link(account.id) == f'https://connect.stripe.test/{account.id}'
+    assert (await payments.fetch_stripe_account_balance(account.id)).available[0].currency == 'cad'
+    assert await payments.check_stripe_onboarding_status('acct_missing') is False
+
+
+@pytest.mark.anyio
+async def test_slow_stripe_does_not_block_the_event_loop(gateway, fake_stripe):
+    fake_stripe.delay = 0.2
+    try:
+        # A sync SDK call would hold the loop for the whole round trip, the ticker would barely advance
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await asyncio.gather(*(gateway.create_checkout_session(CHECKOUT_PARAMS) for _ in range(20)))
+        elapsed = time.perf_counter() - start
+        ticking.cancel()
+    finally:
+        fake_stripe.delay = 0
+
+    assert elapsed < 20 * 0.2 / 4, f'20 concurrent calls took {elapsed:.2f}s'
+    assert ticks > 10
+
+
+@pytest.mark.anyio
+async def test_latency_metrics(gateway):
+    await gateway.create_checkout_session(CHECKOUT_PARAMS)
+    with pytest.raises(Exception):
+        await gateway.retrieve_checkout_session('cs_test_missing')
+
+    stats = gateway.stats()
+    assert stats['checkout.sessions.create']['calls'] == 1
+    assert stats['checkout.sessions.create']['errors'] == 0
+    assert stats['checkout.sessions.retrieve']['errors'] == 1
+    assert stats['checkout.sessions.create']['p95_ms'] > 0
+
+
+def booking_with_session(expires_in: timedelta) -> BookingFullModel:
+    session = CheckoutSession(id='cs_test_1', client_secret='cs_test_1_secret',
+                              expires_at=datetime.now(timezone.utc) + expires_in)
+    return BookingFullModel.model_construct(checkout_session=session)
+
+
+def test_open_checkout_session_is_reused():
+    assert reusable_checkout_session(booking_with_session(timedelta(minutes=20))).id == 'cs_test_1'
+
+
+def test_expiring_checkout_session_is_not_reused():
+    assert reusable_checkout_session(booking_with_session(timedelta(seconds=30))) is None
+    assert reusable_checkout_session(booking_with_session(timedelta(minutes=-5))) is None
+    assert reusable_checkout_session(BookingFullModel.model_construct(checkout_session=None)) is None
+
+
+def booking_in(booking_status: str, payment_status: str = 'pending', hold_expires_in: Optional[timedelta] = timedelta(minutes=10)):
+    hold_expires_at = None if hold_expires_in is None else datetime.now(timezone.utc) + hold_expires_in
+    return BookingFullModel.model_construct(booking_status=booking_status, payment_status=payment_status,
+                                            hold_expires_at=hold_expires_at)
+
+
+def test_held_booking_awaits_payment():
+    assert awaiting_payment(booking_in('pending'))
+    assert awaiting_payment(booking_in('pending', payment_status='failed'))
+    assert awaiting_payment(booking_in('pending', hold_expires_in=None))
+
+
+def test_cancelled_paid_or_lapsed_booking_cannot_be_paid():
+    assert not awaiting_payment(booking_in('cancelled', payment_status='cancelled'))
+    assert not awaiting_payment(booking_in('confirmed', payment_status='success', hold_expires_in=None))
+    assert not awaiting_payment(booking_in('pending', hold_expires_in=timedelta(minutes=-1)))
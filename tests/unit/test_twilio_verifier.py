@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.verification.twilio import TwilioVerifier
+from tests.setup.fake_twilio import CODE
+
+PHONE_NUMBER = '+15145550123'
+
+
+@pytest.fixture
+async def verifier(fake_twilio):
+    verifier = TwilioVerifier('ACfake', 'token', 'VAfake', timeout=5, base_url=fake_twilio.url)
+    yield verifier
+    await verifier.close()
+
+
+@pytest.mark.anyio
+async def test_send_and_check_code(verifier):
+    assert await verifier.send_code(PHONE_NUMBER) == 'pending'
+    assert await verifier.check_code(PHONE_NUMBER, '000000') == 'pending'
+    assert await verifier.check_code(PHONE_NUMBER, CODE) == 'approved'
+
+
+@pytest.mark.anyio
+async def test_check_without_pending_verification_is_expired(verifier):
+    assert await verifier.check_code('+15145550199', CODE) == 'expired'
+
+
+@pytest.mark.anyio
+async def test_slow_twilio_does_not_block_the_event_loop(verifier, fake_twilio):
+    fake_twilio.delay = 0.2
+    try:
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(verifier.send_code(f'+1514555{i:04d}') for i in range(20)))
+        elapsed = time.perf_counter() - start
+    finally:
+        fake_twilio.delay = 0
+
+    assert statuses == ['pending'] * 20
+    assert elapsed < 20 * 0.2 / 4, f'20 concurrent calls took {elapsed:.2f}s'
+
+
+@pytest.mark.anyio
+async def test_twilio_slower_than_the_timeout_is_service_unavailable(fake_twilio):
+    verifier = TwilioVerifier('ACfake', 'token', 'VAfake', timeout=0.5, base_url=fake_twilio.url)
+    fake_twilio.delay = 3
+    try:
+        start = time.perf_counter()
+        with pytest.raises(HTTPException) as e:
+            await verifier.send_code(PHONE_NUMBER)
+        elapsed = time.perf_counter() - start
+    finally:
+        fake_twilio.delay = 0
+        await verifier.close()
+
+    assert e.value.status_code == 503
+    assert elapsed < 1.5, f'the call took {elapsed:.2f}s'
+
+
+@pytest.mark.anyio
+async def test_unreachable_twilio_is_service_unavailable():
+    verifier = TwilioVerifier('ACfake', 'token', 'VAfake', timeout=1, base_url='http://127.0.0.1:9')
+    try:
+        with pytest.raises(HTTPException) as e:
+            await verifier.send_code(PHONE_NUMBER)
+    finally:
+        await verifier.close()
+
+    assert e.value.status_code == 503
+    assert verifier.stats()['verifications.create']['errors'] == 1
+
+
+@pytest.mark.anyio
+async def test_latency_metrics(verifier):
+    await verifier.send_code(PHONE_NUMBER)
+    await verifier.check_code(PHONE_NUMBER, CODE)
+
+    stats = verifier.stats()
+    assert stats['verifications.create']['calls'] == 1
+    assert stats['verification_checks.create']['calls'] == 1
+    assert stats['verifications.create']['p95_ms'] > 0